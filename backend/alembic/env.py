@@ -16,7 +16,7 @@ if config.config_file_name is not None:
 
 from app.config import get_settings
 from app.database import Base
-from app.models import user, blog  # Import all models to register them with Base
+from app.models import user, blog, email_outbox  # Import all models to register them with Base
 
 settings = get_settings()
 # Use DATABASE_URL from environment
@@ -0,0 +1,31 @@
+"""refresh token maintenance indexes
+
+Revision ID: 004_refresh_token_maintenance
+Revises: 003_revoked_access_tokens
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '004_refresh_token_maintenance'
+down_revision = '003_revoked_access_tokens'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_refresh_tokens_active_user_id',
+        'refresh_tokens',
+        ['user_id'],
+        unique=False,
+        postgresql_where=sa.text('NOT revoked')
+    )
+    op.create_index(op.f('ix_refresh_tokens_expires_at'), 'refresh_tokens', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_refresh_tokens_expires_at'), table_name='refresh_tokens')
+    op.drop_index('ix_refresh_tokens_active_user_id', table_name='refresh_tokens')
@@ -0,0 +1,68 @@
+"""store auth tokens as sha256 digests
+
+Revision ID: 005_hashed_tokens
+Revises: 004_refresh_token_maintenance
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '005_hashed_tokens'
+down_revision = '004_refresh_token_maintenance'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Refresh tokens: digest existing values so issued cookies keep working
+    op.add_column('refresh_tokens', sa.Column('token_hash', sa.LargeBinary(length=32), nullable=True))
+    op.execute("UPDATE refresh_tokens SET token_hash = sha256(convert_to(token, 'UTF8'))")
+    op.alter_column('refresh_tokens', 'token_hash', nullable=False)
+    op.drop_index(op.f('ix_refresh_tokens_token'), table_name='refresh_tokens')
+    op.drop_column('refresh_tokens', 'token')
+    op.create_index(op.f('ix_refresh_tokens_token_hash'), 'refresh_tokens', ['token_hash'], unique=True)
+
+    # Verification and reset tokens: same, so links already emailed stay valid
+    op.add_column('users', sa.Column('verification_token_hash', sa.LargeBinary(length=32), nullable=True))
+    op.add_column('users', sa.Column('reset_token_hash', sa.LargeBinary(length=32), nullable=True))
+    op.execute("""
+        UPDATE users SET
+            verification_token_hash = sha256(convert_to(verification_token, 'UTF8')),
+            reset_token_hash = sha256(convert_to(reset_token, 'UTF8'))
+        WHERE verification_token IS NOT NULL OR reset_token IS NOT NULL
+    """)
+    op.drop_column('users', 'verification_token')
+    op.drop_column('users', 'reset_token')
+    op.create_index(
+        'ix_users_verification_token_hash',
+        'users',
+        ['verification_token_hash'],
+        unique=True,
+        postgresql_where=sa.text('verification_token_hash IS NOT NULL')
+    )
+    op.create_index(
+        'ix_users_reset_token_hash',
+        'users',
+        ['reset_token_hash'],
+        unique=True,
+        postgresql_where=sa.text('reset_token_hash IS NOT NULL')
+    )
+
+
+def downgrade() -> None:
+    # Digests cannot be turned back into tokens: outstanding tokens are invalidated
+    op.drop_index('ix_users_reset_token_hash', table_name='users')
+    op.drop_index('ix_users_verification_token_hash', table_name='users')
+    op.add_column('users', sa.Column('verification_token', sa.String(length=255), nullable=True))
+    op.add_column('users', sa.Column('reset_token', sa.String(length=255), nullable=True))
+    op.drop_column('users', 'reset_token_hash')
+    op.drop_column('users', 'verification_token_hash')
+
+    op.drop_index(op.f('ix_refresh_tokens_token_hash'), table_name='refresh_tokens')
+    op.add_column('refresh_tokens', sa.Column('token', sa.String(length=255), nullable=True))
+    op.execute("UPDATE refresh_tokens SET token = encode(token_hash, 'hex'), revoked = true")
+    op.alter_column('refresh_tokens', 'token', nullable=False)
+    op.drop_column('refresh_tokens', 'token_hash')
+    op.create_index(op.f('ix_refresh_tokens_token'), 'refresh_tokens', ['token'], unique=True)
@@ -0,0 +1,25 @@
+"""record when refresh tokens were revoked
+
+Revision ID: 006_refresh_token_revoked_at
+Revises: 005_hashed_tokens
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '006_refresh_token_revoked_at'
+down_revision = '005_hashed_tokens'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('refresh_tokens', sa.Column('revoked_at', sa.DateTime(timezone=True), nullable=True))
+    # When existing tokens were revoked is unknown: keep them for a full retention window from now
+    op.execute("UPDATE refresh_tokens SET revoked_at = now() WHERE revoked")
+
+
+def downgrade() -> None:
+    op.drop_column('refresh_tokens', 'revoked_at')
@@ -0,0 +1,25 @@
+"""record why refresh tokens were revoked
+
+Revision ID: 007_refresh_token_revoked_reason
+Revises: 006_refresh_token_revoked_at
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '007_refresh_token_revoked_reason'
+down_revision = '006_refresh_token_revoked_at'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Existing revoked tokens keep a NULL reason: they cannot be told apart, so none of
+    # them triggers reuse detection
+    op.add_column('refresh_tokens', sa.Column('revoked_reason', sa.String(length=16), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('refresh_tokens', 'revoked_reason')
@@ -0,0 +1,39 @@
+"""email outbox: index rows claimed for sending
+
+Revision ID: 008_email_outbox_lease
+Revises: 007_refresh_token_revoked_reason
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '008_email_outbox_lease'
+down_revision = '007_refresh_token_revoked_reason'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.drop_index('ix_email_outbox_pending', table_name='email_outbox')
+    op.create_index(
+        'ix_email_outbox_due',
+        'email_outbox',
+        ['next_attempt_at'],
+        unique=False,
+        postgresql_where=sa.text("status IN ('pending', 'sending')")
+    )
+
+
+def downgrade() -> None:
+    # Rows claimed when the worker stopped go back to pending
+    op.execute("UPDATE email_outbox SET status = 'pending' WHERE status = 'sending'")
+    op.drop_index('ix_email_outbox_due', table_name='email_outbox')
+    op.create_index(
+        'ix_email_outbox_pending',
+        'email_outbox',
+        ['next_attempt_at'],
+        unique=False,
+        postgresql_where=sa.text("status = 'pending'")
+    )
@@ -0,0 +1,30 @@
+"""index revoked refresh tokens by revocation time
+
+Revision ID: 009_refresh_token_revoked_index
+Revises: 008_email_outbox_lease
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '009_refresh_token_revoked_index'
+down_revision = '008_email_outbox_lease'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # The purge finds revoked tokens past the retention window through this index
+    op.create_index(
+        'ix_refresh_tokens_revoked_at',
+        'refresh_tokens',
+        ['revoked_at'],
+        unique=False,
+        postgresql_where=sa.text('revoked')
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_refresh_tokens_revoked_at', table_name='refresh_tokens')
@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings
 from functools import lru_cache
+from typing import Optional
 
 
 class Settings(BaseSettings):
@@ -9,14 +10,146 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 15
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7
 
+    # Primary connection pool; see the db_pool_* metrics when resizing
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT_SECONDS: float = 30.0
+
+    # Request deadline unless the route sets its own with @deadline (0: none); a route's own
+    # deadline also becomes the statement_timeout and lock_timeout of its transactions
+    REQUEST_DEADLINE_SECONDS: float = 10.0
+    # Jittered retries of read-only SELECTs that fail on a transient connection error
+    DB_READ_RETRY_ATTEMPTS: int = 2
+    DB_READ_RETRY_BASE_DELAY_SECONDS: float = 0.05
+    DB_READ_RETRY_MAX_DELAY_SECONDS: float = 1.0
+
+    # "transaction" when connecting through pgbouncer/Supavisor in transaction mode, "direct" otherwise
+    DB_POOLER_MODE: str = "transaction"
+    DB_STATEMENT_CACHE_SIZE: int = 256
+
+    # Optional comma-separated read replica URLs; reads go to the primary when empty
+    READ_REPLICA_URLS: str = ""
+    READ_REPLICA_POOL_SIZE: int = 10
+    READ_REPLICA_MAX_OVERFLOW: int = 10
+    READ_REPLICA_HEALTH_CHECK_SECONDS: float = 5.0
+    READ_REPLICA_MAX_LAG_SECONDS: float = 10.0
+    # After a write, the client reads from the primary for this long
+    READ_AFTER_WRITE_PIN_SECONDS: int = 5
+
+    # Rate limiting: shared counter storage (e.g. redis://host:6379/0) and algorithm.
+    # moving-window is a sliding-window log, checked atomically in one round trip on Redis.
+    RATE_LIMIT_STORAGE_URI: str = "bounded-memory://"
+    RATE_LIMIT_STRATEGY: str = "moving-window"
+    # Key cap for the per-process bounded-memory:// storage (also used as the Redis fallback)
+    RATE_LIMIT_STORAGE_MAX_KEYS: int = 100000
+    RATE_LIMIT_STORAGE_SHARDS: int = 16
+    # In-process short-circuit for keys that are clearly over or clearly under their limit
+    RATE_LIMIT_LOCAL_CACHE: bool = True
+    RATE_LIMIT_LOCAL_LEASE_FRACTION: float = 0.05
+    RATE_LIMIT_LOCAL_CACHE_SIZE: int = 100000
+    # Authenticated requests also count against the address they come from, at this many times the per-user limit
+    RATE_LIMIT_SHARED_IP_MULTIPLIER: int = 10
+    # Cost-weighted limits: per-client token bucket drained by @route_cost routes
+    RATE_LIMIT_COST_ENABLED: bool = True
+    RATE_LIMIT_COST_CAPACITY: float = 300
+    RATE_LIMIT_COST_REFILL_PER_SECOND: float = 0.5
+    RATE_LIMIT_COST_MAX_CLIENTS: int = 100000
+    # Bot blocker: optional user-agent pattern file (one regex per line), re-read when it changes
+    BOT_USER_AGENT_PATTERNS_FILE: str = ""
+    BOT_USER_AGENT_PATTERNS_RELOAD_SECONDS: float = 10
+    BOT_USER_AGENT_CACHE_SIZE: int = 10000
+    # Bot blocker: CIDR deny/allow list files (one address or CIDR per line), re-read when they change
+    IP_DENYLIST_FILE: str = ""
+    IP_ALLOWLIST_FILE: str = ""
+    IP_LISTS_RELOAD_SECONDS: float = 30
+    # Scraper detection: sliding-window count-min sketches per IP, network and user agent (fixed memory)
+    SCRAPER_DETECTION_ENABLED: bool = True
+    SCRAPER_WINDOW_SECONDS: float = 300
+    SCRAPER_SKETCH_WIDTH: int = 16384
+    SCRAPER_SKETCH_DEPTH: int = 4
+    SCRAPER_SEEN_FILTER_CELLS: int = 2097152
+    # Distinct blogs per window that make a key suspect; BLOCK_FACTOR times that blocks it
+    SCRAPER_BREADTH_PER_IP: int = 100
+    SCRAPER_BREADTH_PER_NETWORK: int = 300
+    SCRAPER_BREADTH_PER_USER_AGENT: int = 2000
+    # ...raised for a user agent to this many distinct blogs per IP using it, on average
+    SCRAPER_BREADTH_PER_USER_AGENT_CLIENT: float = 20
+    SCRAPER_BLOCK_FACTOR: float = 3
+    # Requests per window allowed to suspect clients, and the cap on escalated keys
+    SCRAPER_SUSPECT_MAX_REQUESTS: int = 60
+    SCRAPER_MAX_FLAGGED: int = 10000
+    # Admission control: requests in flight at once (0: DB_POOL_SIZE + DB_MAX_OVERFLOW), beyond
+    # which they queue briefly per priority class and are then shed with 503
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_MAX_CONCURRENT: int = 0
+    ADMISSION_MAX_QUEUE: int = 100
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: float = 2.0
+    ADMISSION_CRITICAL_RESERVE: int = 3
+    ADMISSION_BULK_SHARE: float = 0.5
+    # Peers (IPs or CIDRs, comma-separated) whose X-Forwarded-For is believed, e.g. the load balancer
+    TRUSTED_PROXIES: str = "127.0.0.0/8,::1/128,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16,100.64.0.0/10,fc00::/7"
+
+    # Recently verified access tokens cached per process (until their exp)
+    TOKEN_CACHE_MAX_SIZE: int = 10000
+
+    # Revoked access token ids, held in memory until expiry and synced via LISTEN/NOTIFY
+    ACCESS_TOKEN_DENYLIST_SWEEP_SECONDS: float = 30.0
+    ACCESS_TOKEN_DENYLIST_SYNC: bool = True
+    # LISTEN needs a direct (non-pooled) connection; empty: DATABASE_URL when DB_POOLER_MODE is
+    # "direct", otherwise no listener and revocations reach other workers by the periodic reload
+    ACCESS_TOKEN_DENYLIST_LISTEN_URL: str = ""
+    ACCESS_TOKEN_DENYLIST_RELOAD_SECONDS: float = 60.0
+    ACCESS_TOKEN_DENYLIST_BLOOM: bool = False
+    ACCESS_TOKEN_DENYLIST_BLOOM_CAPACITY: int = 100000
+
+    # Authenticated user snapshots cached per process
+    USER_CACHE_MAX_SIZE: int = 10000
+    USER_CACHE_TTL_SECONDS: float = 60.0
+
+    # Password hasher; the cost is calibrated at startup unless PASSWORD_HASH_ROUNDS pins it
+    PASSWORD_HASHER: str = "bcrypt"
+    PASSWORD_HASH_ROUNDS: Optional[int] = None
+    PASSWORD_HASH_TARGET_MS: float = 250.0
+    PASSWORD_HASH_MIN_ROUNDS: int = 10
+    PASSWORD_HASH_MAX_ROUNDS: int = 14
+
+    # Password hashing runs on a bounded thread pool off the event loop
+    PASSWORD_HASH_MAX_WORKERS: int = 4
+    PASSWORD_HASH_MAX_QUEUE: int = 64
+    PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS: float = 2.0
+
     MAIL_USERNAME: str
     MAIL_PASSWORD: str
     MAIL_FROM: str
     MAIL_PORT: int = 587
     MAIL_SERVER: str
 
+    # Pooled SMTP sessions used by the outbox worker
+    SMTP_POOL_SIZE: int = 2
+    SMTP_MAX_MESSAGES_PER_CONNECTION: int = 100
+    SMTP_IDLE_TIMEOUT_SECONDS: float = 60.0
+    SMTP_TIMEOUT_SECONDS: float = 30.0
+
     FRONTEND_URL: str = "http://localhost:3000"
 
+    # Internal metrics endpoint is disabled unless a token is configured
+    METRICS_TOKEN: Optional[str] = None
+
+    # Email outbox delivery worker
+    EMAIL_OUTBOX_POLL_INTERVAL_SECONDS: float = 5.0
+    EMAIL_OUTBOX_BATCH_SIZE: int = 20
+    EMAIL_OUTBOX_MAX_ATTEMPTS: int = 8
+    EMAIL_OUTBOX_BACKOFF_BASE_SECONDS: float = 10.0
+    EMAIL_OUTBOX_BACKOFF_MAX_SECONDS: float = 3600.0
+    # A claimed batch is retried if it is not settled within this long (the worker died mid-send)
+    EMAIL_OUTBOX_LEASE_SECONDS: float = 300.0
+
+    # Background purge of expired and long-revoked refresh tokens
+    REFRESH_TOKEN_PURGE_INTERVAL_SECONDS: float = 600.0
+    REFRESH_TOKEN_PURGE_BATCH_SIZE: int = 1000
+    REFRESH_TOKEN_PURGE_BATCH_PAUSE_SECONDS: float = 0.1
+    REFRESH_TOKEN_REVOKED_RETENTION_HOURS: int = 24
+
     class Config:
         env_file = ".env"
 
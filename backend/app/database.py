@@ -1,45 +1,382 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from sqlalchemy.orm import DeclarativeBase
+import asyncio
+import itertools
+import math
+import random
+import re
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+from fastapi import Request
+from sqlalchemy import Delete, Insert, TextClause, Update, event, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession, async_sessionmaker
+from sqlalchemy.orm import DeclarativeBase, Session
 from app.config import get_settings
+from app.utils.deadline import remaining, server_side_remaining
+from app.utils.logger import logger
+from app.utils.metrics import metrics
+from app.utils.pool_metrics import InstrumentedAsyncQueuePool, instrument_engine
 
 settings = get_settings()
 
-# Convert postgresql:// to postgresql+asyncpg:// for async operations
-database_url = settings.DATABASE_URL
-if database_url.startswith("postgresql://") and not database_url.startswith("postgresql+asyncpg://"):
-    database_url = database_url.replace("postgresql://", "postgresql+asyncpg://", 1)
+
+def to_async_url(url: str) -> str:
+    # Convert postgresql:// to postgresql+asyncpg:// for async operations
+    if url.startswith("postgresql://") and not url.startswith("postgresql+asyncpg://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    return url
+
+
+def pooler_connect_args(mode: str) -> Dict[str, Any]:
+    """asyncpg connect arguments for how the app reaches Postgres.
+
+    direct      - a real Postgres backend per connection: cache prepared statements
+                  so hot queries are parsed and planned once per connection.
+    transaction - behind a transaction-mode pooler (pgbouncer, Supavisor): consecutive
+                  statements may land on different backends, so nothing is cached and
+                  the statements asyncpg still prepares get unique names.
+    """
+    if mode == "direct":
+        return {
+            "statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+            "prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+        }
+    if mode == "transaction":
+        return {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+        }
+    raise ValueError(f"Unknown DB_POOLER_MODE '{mode}', expected 'direct' or 'transaction'")
+
+
+database_url = to_async_url(settings.DATABASE_URL)
 
 try:
     engine = create_async_engine(
         database_url,  # Use converted URL
         echo=False,
-        pool_size=10,
-        max_overflow=20,
+        poolclass=InstrumentedAsyncQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
         pool_pre_ping=True,
         pool_recycle=3600,
-        connect_args={
-            "statement_cache_size": 0,
-            "prepared_statement_cache_size": 0,
-        },
+        connect_args=pooler_connect_args(settings.DB_POOLER_MODE),
     )
 except Exception as e:
     raise
 
-async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+instrument_engine(engine, "db_pool")
+
+# Same pool, but connections run in autocommit: no BEGIN/COMMIT round trips for pure reads
+read_engine = engine.execution_options(isolation_level="AUTOCOMMIT")
+# Reads under a server-side deadline run in a read-only transaction instead, so the
+# deadline can be set transaction-locally (see _apply_request_deadline)
+read_transaction_engine = engine.execution_options(postgresql_readonly=True)
+
+
+class WriteSession(Session):
+    pass
+
+
+class ReadSession(Session):
+    pass
+
+
+# Connection-level failures (SQLSTATE class 08) and server restarts or overload: a fresh connection may succeed
+TRANSIENT_SQLSTATES = {"57P01", "57P02", "57P03", "53300"}
+
+
+def is_transient_error(error: Exception) -> bool:
+    if isinstance(error, DBAPIError):
+        if error.connection_invalidated:
+            return True
+        sqlstate = getattr(error.orig, "sqlstate", None) or ""
+        return sqlstate.startswith("08") or sqlstate in TRANSIENT_SQLSTATES
+    # Raised as-is when a new connection cannot be opened
+    return isinstance(error, OSError)
+
+
+class ReadAsyncSession(AsyncSession):
+    """AsyncSession for get_read_db: a SELECT that hits a transient connection error is retried.
+
+    Read sessions run in autocommit or a read-only transaction, so a failed SELECT
+    leaves nothing behind and running it again is safe. Retries back off exponentially with full jitter, so
+    clients do not reconnect in lockstep, and stop when the request deadline would
+    pass. Only execute() retries; anything that is not a SELECT runs once. Instances
+    loaded before a retry are detached from the session with their loaded state intact.
+    """
+
+    _retries = metrics.counter("db_read_retries_total", "Read queries retried after a transient connection error")
+
+    async def execute(self, statement, *args, **kwargs):
+        if not getattr(statement, "is_select", False):
+            return await super().execute(statement, *args, **kwargs)
+        attempt = 0
+        while True:
+            try:
+                return await super().execute(statement, *args, **kwargs)
+            except Exception as e:
+                if attempt >= settings.DB_READ_RETRY_ATTEMPTS or not is_transient_error(e):
+                    raise
+                delay = random.uniform(0, min(settings.DB_READ_RETRY_MAX_DELAY_SECONDS, settings.DB_READ_RETRY_BASE_DELAY_SECONDS * 2 ** attempt))
+                budget = remaining()
+                if budget is not None and delay >= budget:
+                    raise
+                attempt += 1
+                self._retries.inc()
+                logger.warning(f"Database: Retrying read after transient error - attempt: {attempt}, delay: {delay * 1000:.0f}ms, error: {str(e)}")
+                # Drop the broken connection; the next attempt checks out a fresh one. Rolling
+                # back would expire every instance loaded so far, and touching one afterwards would
+                # lazily reload it; detach them first so earlier results keep their loaded state
+                self.expunge_all()
+                await self.rollback()
+                await asyncio.sleep(delay)
+
+
+async_session = async_sessionmaker(engine, class_=AsyncSession, sync_session_class=WriteSession, expire_on_commit=False)
+async_read_session = async_sessionmaker(read_engine, class_=ReadAsyncSession, sync_session_class=ReadSession, expire_on_commit=False)
+
+
+def _track_connection_hold(session_class, histogram) -> None:
+    """Observe how long each session keeps its pooled connection checked out."""
+    @event.listens_for(session_class, "after_begin")
+    def _acquired(session, transaction, connection):
+        session.info.setdefault("connection_acquired_at", time.perf_counter())
+
+    @event.listens_for(session_class, "after_transaction_end")
+    def _released(session, transaction):
+        if transaction.parent is not None:
+            return
+        acquired_at = session.info.pop("connection_acquired_at", None)
+        if acquired_at is not None:
+            histogram.observe(time.perf_counter() - acquired_at)
+
+
+# Server-side limits trail the request deadline slightly, so the client-side cancel normally comes first
+# and the request ends with 504; they are the backstop if the cancel never reaches Postgres
+DEADLINE_SERVER_GRACE_MS = 100
+
+SET_TRANSACTION_TIMEOUTS_SQL = text(
+    "SELECT set_config('statement_timeout', :timeout, true), set_config('lock_timeout', :timeout, true)"
+)
+
+
+def _apply_request_deadline(session_class) -> None:
+    """Bound transactions opened during a request with a server-side deadline by the time left."""
+    @event.listens_for(session_class, "after_begin")
+    def _set_timeouts(session, transaction, connection):
+        budget = server_side_remaining()
+        # In autocommit there is no transaction to scope the settings to; get_read_db
+        # avoids autocommit for requests with a server-side deadline
+        if budget is None or connection.connection.dbapi_connection.autocommit:
+            return
+        # Transaction-local (SET LOCAL), so nothing leaks to the next user of the
+        # connection, or of the backend behind a transaction-mode pooler
+        timeout = f"{max(1, math.ceil(budget * 1000)) + DEADLINE_SERVER_GRACE_MS}ms"
+        connection.execute(SET_TRANSACTION_TIMEOUTS_SQL, {"timeout": timeout})
+
+
+_apply_request_deadline(WriteSession)
+_apply_request_deadline(ReadSession)
+
+_track_connection_hold(WriteSession, metrics.histogram("db_write_session_hold_seconds", "Connection hold time of read-write sessions"))
+_track_connection_hold(ReadSession, metrics.histogram("db_read_session_hold_seconds", "Connection hold time of read-only sessions"))
+
+
+REPLICA_LAG_SQL = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0"
+    " ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+class ReplicaRouter:
+    """Round-robin over healthy read replicas, falling back to the primary.
+
+    A background task probes every replica with SELECT 1 and its replay lag;
+    replicas that fail or lag too far behind are skipped until they recover.
+    A replica that has replayed all the WAL it received counts as caught up, however
+    long ago the last transaction was: on an idle primary that age keeps growing.
+    """
+
+    def __init__(
+        self,
+        urls: List[str],
+        health_check_interval: float = settings.READ_REPLICA_HEALTH_CHECK_SECONDS,
+        max_lag: float = settings.READ_REPLICA_MAX_LAG_SECONDS,
+    ):
+        self.health_check_interval = health_check_interval
+        self.max_lag = max_lag
+        self.engines: List[AsyncEngine] = [
+            create_async_engine(
+                to_async_url(url),
+                echo=False,
+                poolclass=InstrumentedAsyncQueuePool,
+                pool_size=settings.READ_REPLICA_POOL_SIZE,
+                max_overflow=settings.READ_REPLICA_MAX_OVERFLOW,
+                pool_pre_ping=True,
+                pool_recycle=3600,
+                connect_args=pooler_connect_args(settings.DB_POOLER_MODE),
+            )
+            for url in urls
+        ]
+        for index, engine in enumerate(self.engines):
+            instrument_engine(engine, f"db_replica_{index}_pool")
+        # Like read_engine and read_transaction_engine, over each replica's pool
+        self._read_engines = [engine.execution_options(isolation_level="AUTOCOMMIT") for engine in self.engines]
+        self._read_transaction_engines = [engine.execution_options(postgresql_readonly=True) for engine in self.engines]
+        # Replicas start out unhealthy and are enabled by the first successful probe
+        self._healthy: List[bool] = [False] * len(self.engines)
+        self._checked = False
+        self._cycle = itertools.cycle(range(len(self.engines)))
+        self._task: Optional[asyncio.Task] = None
+
+        self._replica_reads = metrics.counter("db_replica_reads_total", "Read sessions routed to a replica")
+        self._primary_reads = metrics.counter("db_primary_reads_total", "Read sessions routed to the primary")
+        metrics.gauge("db_replicas_healthy", "Read replicas currently accepting reads", lambda: sum(self._healthy))
+
+    def choose(self, pinned_to_primary: bool = False, in_transaction: bool = False) -> AsyncEngine:
+        """Bind for a read session: autocommit, or a read-only transaction if in_transaction."""
+        if not pinned_to_primary:
+            for _ in range(len(self.engines)):
+                index = next(self._cycle)
+                if self._healthy[index]:
+                    self._replica_reads.inc()
+                    return self._read_transaction_engines[index] if in_transaction else self._read_engines[index]
+        self._primary_reads.inc()
+        return read_transaction_engine if in_transaction else read_engine
+
+    async def _probe(self, index: int) -> bool:
+        engine = self._read_engines[index]
+        try:
+            async with engine.connect() as connection:
+                # NULL on a primary (or a replica that has replayed nothing yet): treat as no lag
+                lag = await asyncio.wait_for(
+                    connection.scalar(REPLICA_LAG_SQL),
+                    timeout=self.health_check_interval,
+                )
+            if lag is not None and float(lag) > self.max_lag:
+                logger.debug(f"Database: Replica lagging - replica: {index}, lag: {float(lag):.1f}s")
+                return False
+            return True
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.debug(f"Database: Replica health check failed - replica: {index}, error: {str(e)}")
+            return False
+
+    async def check_health(self) -> None:
+        results = await asyncio.gather(*(self._probe(index) for index in range(len(self.engines))))
+        for index, healthy in enumerate(results):
+            if healthy and not self._healthy[index]:
+                logger.info(f"Database: Replica available for reads - replica: {index}")
+            elif not healthy and (self._healthy[index] or not self._checked):
+                logger.warning(f"Database: Replica unavailable, reads fall back to other replicas or the primary - replica: {index}")
+            self._healthy[index] = healthy
+        self._checked = True
+
+    async def _run(self) -> None:
+        while True:
+            await self.check_health()
+            await asyncio.sleep(self.health_check_interval)
+
+    def start(self) -> None:
+        if self.engines and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for engine in self.engines:
+            await engine.dispose()
+
+
+replica_router = ReplicaRouter([url.strip() for url in settings.READ_REPLICA_URLS.split(",") if url.strip()])
+
+# Clients that just wrote read from the primary until this unix timestamp, so they see their own writes
+PRIMARY_PIN_COOKIE = "db_primary_until"
+
+
+def no_primary_pin(func):
+    """Writes by this route do not pin the client to the primary (e.g. view counters nobody reads back)."""
+    func.__primary_pin__ = False
+    return func
+
+
+# Raw SQL is checked for data-modifying keywords; a SELECT ... FOR UPDATE counts as a write too
+DATA_MODIFYING_SQL = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE)\b", re.IGNORECASE)
+
+
+def _is_write(statement) -> bool:
+    if isinstance(statement, (Insert, Update, Delete)):
+        return True
+    if isinstance(statement, TextClause):
+        return DATA_MODIFYING_SQL.search(statement.text) is not None
+    return False
+
+
+def _track_writes(session_class) -> None:
+    """Note in session.info when a session flushes or executes an INSERT, UPDATE or DELETE."""
+    @event.listens_for(session_class, "after_flush")
+    def _flushed(session, flush_context):
+        session.info["wrote"] = True
+
+    @event.listens_for(session_class, "do_orm_execute")
+    def _executed(orm_execute_state):
+        if _is_write(orm_execute_state.statement):
+            orm_execute_state.session.info["wrote"] = True
+
+
+_track_writes(WriteSession)
 
 
 class Base(DeclarativeBase):
     pass
 
 
-async def get_db():
+async def get_db(request: Request):
     try:
         async with async_session() as session:
             try:
                 yield session
                 await session.commit()
+                # Response headers are fixed before dependency teardown, so the pin cookie
+                # is added by PrimaryPinMiddleware, and only once a write has committed
+                if replica_router.engines and session.info.get("wrote") and getattr(request.scope.get("endpoint"), "__primary_pin__", True):
+                    request.state.wrote_to_primary = True
             except Exception as e:
                 await session.rollback()
                 raise
     except Exception as e:
         raise
+
+
+def _pinned_to_primary(request: Request) -> bool:
+    try:
+        return float(request.cookies.get(PRIMARY_PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+async def get_read_db(request: Request):
+    """Session for endpoints that only read.
+
+    Runs in autocommit, so there is no transaction to commit or roll back; the
+    connection goes back to the pool as soon as the endpoint returns. Anything
+    written through this session is not atomic - use get_db for writes.
+
+    With READ_REPLICA_URLS set, the session is bound to a healthy replica unless
+    the client wrote recently (see get_db and PrimaryPinMiddleware).
+
+    When the route's @deadline is to be enforced by Postgres, the session runs in a
+    read-only transaction instead, which carries the statement_timeout.
+    """
+    bind = replica_router.choose(_pinned_to_primary(request), in_transaction=server_side_remaining() is not None)
+    async with async_read_session(bind=bind) as session:
+        yield session
@@ -1,17 +1,52 @@
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import auth, blog
+from app.routers import auth, blog, internal
 from app.config import get_settings
+from app.database import replica_router
 from app.utils.logger import logger
 from app.middleware.bot_blocker import BotBlockerMiddleware
+from app.middleware.auth import AuthenticationMiddleware
+from app.middleware.cost_limiter import CostLimitMiddleware
+from app.middleware.ip_filter import ip_access_lists
+from app.middleware.scraper_detector import ScraperDetectionMiddleware
+from app.middleware.admission import AdmissionControlMiddleware, admission, HEALTH_ADMISSION
+from app.middleware.deadline import RequestDeadlineMiddleware
+from app.middleware.primary_pin import PrimaryPinMiddleware
 from app.middleware.rate_limiter import limiter, rate_limit_exceeded_handler
+from app.services.email_worker import email_outbox_worker
+from app.services.password_pool import password_hash_pool
+from app.services.hasher import configure_hasher
+from app.services.token_denylist import access_token_denylist
+from app.services.token_purge import refresh_token_purge_worker
 from slowapi.errors import RateLimitExceeded
 
 settings = get_settings()
 
 
-app = FastAPI(title="Blogy API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Calibration hashes for a few seconds; keep it off the event loop
+    await asyncio.get_running_loop().run_in_executor(None, configure_hasher)
+    # Background workers live for the lifetime of each uvicorn worker process
+    email_outbox_worker.start()
+    access_token_denylist.start()
+    refresh_token_purge_worker.start()
+    replica_router.start()
+    ip_access_lists.start()
+    try:
+        yield
+    finally:
+        await ip_access_lists.stop()
+        await replica_router.stop()
+        await refresh_token_purge_worker.stop()
+        await access_token_denylist.stop()
+        await email_outbox_worker.stop()
+        password_hash_pool.shutdown()
+
+
+app = FastAPI(title="Blogy API", version="1.0.0", lifespan=lifespan)
 
 # Initialize rate limiter
 app.state.limiter = limiter
@@ -19,6 +54,28 @@ app.state.limiter = limiter
 # Add custom rate limit exceeded handler
 app.add_exception_handler(RateLimitExceeded, rate_limit_exceeded_handler)
 
+# Send clients that just wrote to the primary for their next reads
+if replica_router.engines:
+    app.add_middleware(PrimaryPinMiddleware)
+
+# Charge expensive routes against the caller's cost budget; needs the principal, so inside auth
+if settings.RATE_LIMIT_COST_ENABLED:
+    app.add_middleware(CostLimitMiddleware)
+
+# Resolve the caller's identity once per request; blocked bots never pay for it
+app.add_middleware(AuthenticationMiddleware)
+
+# Cap requests in flight to what the DB pool can serve; shed the excess early, before auth
+if settings.ADMISSION_ENABLED:
+    app.add_middleware(AdmissionControlMiddleware)
+
+# Start each request's deadline before it queues for admission
+app.add_middleware(RequestDeadlineMiddleware)
+
+# Profile clients for breadth scraping; escalated ones are rejected before authentication
+if settings.SCRAPER_DETECTION_ENABLED:
+    app.add_middleware(ScraperDetectionMiddleware)
+
 # Add bot blocker middleware first (before CORS and rate limiting)
 app.add_middleware(BotBlockerMiddleware)
 
@@ -32,8 +89,10 @@ app.add_middleware(
 
 app.include_router(auth.router, prefix="/auth", tags=["Authentication"])
 app.include_router(blog.router, prefix="/blog", tags=["Blogs"])
+app.include_router(internal.router, prefix="/internal", tags=["Internal"], include_in_schema=False)
 
 @app.get("/health")
+@admission(HEALTH_ADMISSION)
 @limiter.limit("300/hour")
 async def health_check(request: Request):
     logger.debug("This is a debug message 2")
@@ -0,0 +1,236 @@
+"""
+Admission control and load shedding.
+
+Without it, a traffic spike queues every request for one of the database pool
+connections until pool_timeout, and latency collapses for everyone, /health
+included. Instead, at most ADMISSION_MAX_CONCURRENT requests (by default the
+pool size plus overflow) are in flight at once; the rest wait in a short,
+bounded queue and are turned away with 503 and Retry-After when it is full or
+they have waited ADMISSION_QUEUE_TIMEOUT_SECONDS (less if the request's
+deadline comes first).
+
+Routes declare a policy with @admission: a priority class and optionally a cap
+on their own concurrency. When a slot frees up, waiting requests are admitted
+in priority order:
+
+- critical (auth, health, metrics) may use every slot, including the
+  ADMISSION_CRITICAL_RESERVE slots no one else can take
+- normal (everything undeclared) may use the rest
+- bulk (list scans, analytics) may use the rest too, but never holds more
+  than ADMISSION_BULK_SHARE of the slots itself
+
+Each class has its own queue of at most ADMISSION_MAX_QUEUE requests, so a
+flood of list scans is shed without pushing out a login.
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Optional
+from fastapi import status
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+from app.config import get_settings
+from app.middleware.route_attributes import RouteAttributeLookup, route_attribute
+from app.utils.deadline import remaining
+from app.utils.logger import logger
+from app.utils.metrics import metrics
+
+settings = get_settings()
+
+# Priority classes, most important first
+CRITICAL, NORMAL, BULK = 0, 1, 2
+CLASS_NAMES = {CRITICAL: "critical", NORMAL: "normal", BULK: "bulk"}
+
+
+@dataclass(frozen=True)
+class AdmissionPolicy:
+    priority: int = NORMAL
+    # Concurrent requests allowed on the route itself; None for no route-level cap
+    max_concurrent: Optional[int] = None
+
+
+def admission(policy: AdmissionPolicy):
+    """Declare a route's admission policy."""
+    return route_attribute("__admission__", policy)
+
+
+# Route policies
+DEFAULT_ADMISSION = AdmissionPolicy(NORMAL)
+AUTH_ADMISSION = AdmissionPolicy(CRITICAL)
+HEALTH_ADMISSION = AdmissionPolicy(CRITICAL)
+LIST_SCAN_ADMISSION = AdmissionPolicy(BULK, max_concurrent=8)
+ANALYTICS_ADMISSION = AdmissionPolicy(BULK, max_concurrent=4)
+
+
+class _Waiter:
+    __slots__ = ("route", "limit", "future", "queued_at")
+
+    def __init__(self, route: Optional[str], limit: Optional[int], future: asyncio.Future):
+        self.route = route
+        self.limit = limit
+        self.future = future
+        self.queued_at = time.monotonic()
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_concurrent: int = settings.ADMISSION_MAX_CONCURRENT or settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW,
+        max_queue: int = settings.ADMISSION_MAX_QUEUE,
+        queue_timeout: float = settings.ADMISSION_QUEUE_TIMEOUT_SECONDS,
+        critical_reserve: int = settings.ADMISSION_CRITICAL_RESERVE,
+        bulk_share: float = settings.ADMISSION_BULK_SHARE,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        general = max(1, max_concurrent - critical_reserve)
+        # Occupied slots, of any class, up to which each class is admitted
+        self.shared_limits = {CRITICAL: max_concurrent, NORMAL: general, BULK: general}
+        # Slots each class may hold itself
+        self.class_limits = {
+            CRITICAL: max_concurrent,
+            NORMAL: general,
+            BULK: max(1, min(general, math.floor(max_concurrent * bulk_share))),
+        }
+        self.in_flight = 0
+        self._class_in_flight: Dict[int, int] = {priority: 0 for priority in CLASS_NAMES}
+        self._route_in_flight: Dict[str, int] = {}
+        self._queues: Dict[int, Deque[_Waiter]] = {priority: deque() for priority in CLASS_NAMES}
+
+        metrics.gauge("admission_in_flight", "Requests currently admitted", lambda: self.in_flight)
+        metrics.gauge("admission_queue_depth", "Requests waiting for admission", lambda: sum(map(len, self._queues.values())))
+        self._wait_seconds = metrics.histogram("admission_wait_seconds", "Time admitted requests spent queued")
+        self._shed = {
+            priority: metrics.counter(f"admission_shed_{name}_total", f"{name.capitalize()} requests shed with 503")
+            for priority, name in CLASS_NAMES.items()
+        }
+        for priority, name in CLASS_NAMES.items():
+            metrics.gauge(f"admission_queue_depth_{name}", f"{name.capitalize()} requests waiting for admission", lambda queue=self._queues[priority]: len(queue))
+            metrics.gauge(f"admission_in_flight_{name}", f"{name.capitalize()} requests currently admitted", lambda priority=priority: self._class_in_flight[priority])
+
+    def _class_full(self, priority: int) -> bool:
+        return self.in_flight >= self.shared_limits[priority] or self._class_in_flight[priority] >= self.class_limits[priority]
+
+    def _admissible(self, priority: int, route: Optional[str], limit: Optional[int]) -> bool:
+        if self._class_full(priority):
+            return False
+        return limit is None or self._route_in_flight.get(route, 0) < limit
+
+    def _take(self, priority: int, route: Optional[str]) -> None:
+        self.in_flight += 1
+        self._class_in_flight[priority] += 1
+        if route is not None:
+            self._route_in_flight[route] = self._route_in_flight.get(route, 0) + 1
+
+    def release(self, priority: int, route: Optional[str]) -> None:
+        self.in_flight -= 1
+        self._class_in_flight[priority] -= 1
+        if route is not None:
+            left = self._route_in_flight[route] - 1
+            if left:
+                self._route_in_flight[route] = left
+            else:
+                del self._route_in_flight[route]
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Hand free slots to waiters, highest class first, FIFO within a class."""
+        for priority, queue in self._queues.items():
+            if self._class_full(priority):
+                continue
+            # A waiter held back by its route cap must not block others in its class
+            for waiter in list(queue):
+                if waiter.future.done():
+                    queue.remove(waiter)
+                elif self._admissible(priority, waiter.route, waiter.limit):
+                    queue.remove(waiter)
+                    self._take(priority, waiter.route)
+                    waiter.future.set_result(True)
+                elif self._class_full(priority):
+                    break
+
+    async def acquire(self, route: Optional[str], policy: AdmissionPolicy) -> bool:
+        """Wait for a slot; False if the request should be shed. Call release() after a True."""
+        priority = policy.priority
+        if self._admissible(priority, route, policy.max_concurrent):
+            self._take(priority, route)
+            return True
+        queue = self._queues[priority]
+        if len(queue) >= self.max_queue:
+            self._shed[priority].inc()
+            return False
+
+        waiter = _Waiter(route, policy.max_concurrent, asyncio.get_running_loop().create_future())
+        queue.append(waiter)
+        try:
+            # Never wait past the request's deadline
+            budget = remaining()
+            timeout = self.queue_timeout if budget is None else max(0.0, min(self.queue_timeout, budget))
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # The client went away; give back a slot handed over in the meantime
+            if waiter.future.done():
+                self.release(priority, route)
+            else:
+                waiter.future.cancel()
+                queue.remove(waiter)
+            raise
+        if not waiter.future.done():
+            # Timed out while queued (a slot handed over at the last moment is kept)
+            waiter.future.cancel()
+            queue.remove(waiter)
+        if waiter.future.cancelled():
+            self._shed[priority].inc()
+            return False
+        self._wait_seconds.observe(time.monotonic() - waiter.queued_at)
+        return True
+
+
+admission_controller = AdmissionController()
+
+
+class AdmissionControlMiddleware:
+    """
+    Middleware that admits requests through the AdmissionController, or sheds them with 503.
+    Pure ASGI; the slot is held until the response has been sent.
+    """
+
+    def __init__(self, app: ASGIApp, controller: AdmissionController = admission_controller):
+        self.app = app
+        self.controller = controller
+        self._route_policy = RouteAttributeLookup("__admission__")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route, policy = self._route_policy(scope)
+        policy = policy or DEFAULT_ADMISSION
+        if not await self.controller.acquire(route, policy):
+            retry_after = max(1, math.ceil(self.controller.queue_timeout))
+            logger.warning(
+                f"Admission: Shed {CLASS_NAMES[policy.priority]} request - "
+                f"Path: {scope['path']}, In flight: {self.controller.in_flight}"
+            )
+            response = JSONResponse(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                content={
+                    "error": "Service overloaded",
+                    "message": "The server is too busy to handle this request. Please try again shortly.",
+                    "retry_after": retry_after
+                },
+                headers={"Retry-After": str(retry_after)}
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(policy.priority, route)
@@ -0,0 +1,82 @@
+"""
+Middleware that authenticates each request exactly once.
+
+The access token is taken from the access_token cookie (preferred) or the
+Authorization: Bearer header, verified through the VerifiedTokenCache and the
+result stored on request.state for the dependencies in app/dependencies.py:
+
+- request.state.principal: Principal or None
+- request.state.auth_token_present: whether the client sent any token at all
+"""
+from typing import Optional
+from fastapi import Request
+from starlette.types import ASGIApp, Receive, Scope, Send
+from app.services.auth import decode_access_token_claims
+from app.services.token_cache import verified_token_cache, Principal
+from app.services.token_denylist import access_token_denylist
+from app.utils.logger import logger
+from app.utils.mask import mask_token
+
+ACCESS_TOKEN_COOKIE = "access_token"
+
+
+def extract_access_token(request: Request) -> Optional[str]:
+    # Try to get token from cookie first (preferred method)
+    token = request.cookies.get(ACCESS_TOKEN_COOKIE)
+    if token:
+        return token
+    
+    # Fall back to Authorization header for backward compatibility
+    authorization = request.headers.get("authorization")
+    if authorization:
+        scheme, _, credentials = authorization.partition(" ")
+        if scheme.lower() == "bearer" and credentials:
+            return credentials.strip()
+    return None
+
+
+def authenticate_token(token: str) -> Optional[Principal]:
+    principal = verified_token_cache.get(token)
+    if principal is not None:
+        return None if access_token_denylist.is_revoked(principal.token_id) else principal
+    
+    claims = decode_access_token_claims(token)
+    if claims is None:
+        return None
+    try:
+        principal = Principal(
+            user_id=int(claims["sub"]),
+            expires_at=float(claims["exp"]),
+            token_id=claims.get("jti"),
+        )
+    except (KeyError, TypeError, ValueError):
+        logger.warning(f"Auth Middleware: Malformed access token claims - token: {mask_token(token)}")
+        return None
+    verified_token_cache.set(token, principal)
+    if access_token_denylist.is_revoked(principal.token_id):
+        logger.warning(f"Auth Middleware: Revoked access token presented - user_id: {principal.user_id}, token: {mask_token(token)}")
+        return None
+    return principal
+
+
+class AuthenticationMiddleware:
+    """
+    Middleware that resolves the request's principal from its access token.
+    Never rejects requests itself; protected routes enforce it via dependencies.
+    Pure ASGI: the result is written to the scope's state, which request.state reads.
+    """
+    
+    def __init__(self, app: ASGIApp):
+        self.app = app
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        request = Request(scope)
+        token = extract_access_token(request)
+        request.state.auth_token_present = token is not None
+        request.state.principal = authenticate_token(token) if token else None
+        
+        await self.app(scope, receive, send)
@@ -1,10 +1,31 @@
 """
 Middleware to block AI crawlers and bots from accessing the API.
+
+Requests from networks on the IP denylist are rejected (see ip_filter.py);
+allowlisted networks skip the user-agent check.
+
+User agents are matched against all patterns at once with a single compiled
+regex, and verdicts are cached per user-agent string (real traffic has few
+distinct ones). Patterns default to AI_BOT_PATTERNS; with
+BOT_USER_AGENT_PATTERNS_FILE set they are read from that file (one regex per
+line, # comments) and reloaded when it changes, without a restart.
 """
-from fastapi import Request, HTTPException, status
-from starlette.middleware.base import BaseHTTPMiddleware
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Pattern
+from fastapi import Request, status
+from starlette.datastructures import Headers
 from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+from app.config import get_settings
+from app.middleware.ip_filter import DENY, ALLOW, ip_access_lists
+from app.middleware.rate_limiter import get_client_ip
 from app.utils.logger import logger
+from app.utils.metrics import metrics
+
+settings = get_settings()
 
 # Known AI bot user-agent patterns
 AI_BOT_PATTERNS = [
@@ -23,7 +44,123 @@ AI_BOT_PATTERNS = [
     r'crawler.*ai',
 ]
 
-import re
+
+def _fold_case(pattern: str) -> str:
+    """
+    Rewrite a pattern to match a lowercased user agent. Plain patterns are simply
+    lowercased; lowercasing the text of an escape changes its meaning (\\W, \\S,
+    \\xC9), so patterns with escapes are matched case-insensitively in a scoped group.
+    """
+    if "\\" in pattern:
+        return f"(?i:{pattern})"
+    return pattern.lower()
+
+
+def compile_patterns(patterns: Iterable[str]) -> Pattern:
+    """
+    One alternation over all patterns, matched against a lowercased user agent.
+    Raises re.error naming the first invalid pattern.
+    """
+    patterns = list(patterns)
+    for pattern in patterns:
+        try:
+            re.compile(pattern)
+        except re.error as e:
+            raise re.error(f"{pattern!r}: {e}") from e
+    if not patterns:
+        # An empty list must match nothing, not everything
+        return re.compile(r"(?!)")
+    try:
+        # re.IGNORECASE makes every position of the alternation far slower; case-folding
+        # the patterns once and lowercasing the input gives the same verdicts
+        return re.compile("|".join(f"(?:{_fold_case(pattern)})" for pattern in patterns))
+    except re.error:
+        return re.compile("|".join(f"(?:{pattern})" for pattern in patterns), re.IGNORECASE)
+
+
+def read_patterns_file(path: str) -> List[str]:
+    with open(path, encoding="utf-8") as f:
+        lines = (line.strip() for line in f)
+        return [line for line in lines if line and not line.startswith("#")]
+
+
+class UserAgentClassifier:
+    def __init__(
+        self,
+        patterns: Iterable[str] = AI_BOT_PATTERNS,
+        patterns_file: str = settings.BOT_USER_AGENT_PATTERNS_FILE,
+        reload_interval: float = settings.BOT_USER_AGENT_PATTERNS_RELOAD_SECONDS,
+        cache_size: int = settings.BOT_USER_AGENT_CACHE_SIZE,
+    ):
+        self.patterns_file = patterns_file
+        self.reload_interval = reload_interval
+        self.cache_size = cache_size
+        patterns = list(patterns)
+        self._regex = compile_patterns(patterns)
+        self._pattern_count = len(patterns)
+        self._verdicts: "OrderedDict[str, bool]" = OrderedDict()
+        self._file_mtime: Optional[float] = None
+        self._next_reload_check = 0.0
+
+        self._cache_hits = metrics.counter("bot_blocker_verdict_cache_hits_total", "User agents classified from the verdict cache")
+        self._cache_misses = metrics.counter("bot_blocker_verdict_cache_misses_total", "User agents classified by running the pattern regex")
+        metrics.gauge("bot_blocker_patterns", "User-agent patterns in use", lambda: self._pattern_count)
+
+        if patterns_file:
+            self.reload()
+
+    def load(self, patterns: Iterable[str]) -> None:
+        patterns = list(patterns)
+        regex = compile_patterns(patterns)
+        # Swap regex and cache together: requests in flight see either the old or the new set
+        self._regex, self._verdicts = regex, OrderedDict()
+        self._pattern_count = len(patterns)
+
+    def reload(self) -> bool:
+        """Load patterns from patterns_file if it changed. Keeps the current ones on any error."""
+        try:
+            mtime = os.stat(self.patterns_file).st_mtime
+            if mtime == self._file_mtime:
+                return False
+            # Remember the version even if it is broken, so it is reported once, not on every check
+            self._file_mtime = mtime
+            patterns = read_patterns_file(self.patterns_file)
+            self.load(patterns)
+        except (OSError, re.error) as e:
+            logger.error(f"Bot Blocker: Failed to load user-agent patterns - file: {self.patterns_file}, error: {str(e)}")
+            return False
+        logger.info(f"Bot Blocker: Loaded {len(patterns)} user-agent patterns from {self.patterns_file}")
+        return True
+
+    def _maybe_reload(self) -> None:
+        now = time.monotonic()
+        if now >= self._next_reload_check:
+            self._next_reload_check = now + self.reload_interval
+            self.reload()
+
+    def is_bot(self, user_agent: str) -> bool:
+        if not user_agent:
+            return False
+        if self.patterns_file:
+            self._maybe_reload()
+
+        verdicts = self._verdicts
+        verdict = verdicts.get(user_agent)
+        if verdict is not None:
+            self._cache_hits.inc()
+            verdicts.move_to_end(user_agent)
+            return verdict
+
+        self._cache_misses.inc()
+        verdict = self._regex.search(user_agent.lower()) is not None
+        verdicts[user_agent] = verdict
+        if len(verdicts) > self.cache_size:
+            verdicts.popitem(last=False)
+        return verdict
+
+
+user_agent_classifier = UserAgentClassifier()
+
 
 def is_ai_bot(user_agent: str) -> bool:
     """
@@ -35,26 +172,46 @@ def is_ai_bot(user_agent: str) -> bool:
     Returns:
         True if the user agent matches an AI bot pattern, False otherwise
     """
-    if not user_agent:
-        return False
-    
-    user_agent_lower = user_agent.lower()
-    for pattern in AI_BOT_PATTERNS:
-        if re.search(pattern, user_agent_lower, re.IGNORECASE):
-            return True
-    return False
+    return user_agent_classifier.is_bot(user_agent)
 
 
-class BotBlockerMiddleware(BaseHTTPMiddleware):
+class BotBlockerMiddleware:
     """
     Middleware that blocks requests from known AI crawlers and bots.
+    Pure ASGI: allowed requests pass straight through, responses are not buffered.
     """
     
-    async def dispatch(self, request: Request, call_next):
-        user_agent = request.headers.get('user-agent', '')
+    def __init__(self, app: ASGIApp):
+        self.app = app
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        # Network lists first: scrapers often fake a browser user agent
+        ip_verdict = None
+        if ip_access_lists.enabled:
+            request = Request(scope)
+            client_ip = get_client_ip(request)
+            ip_verdict = ip_access_lists.verdict(client_ip)
+            if ip_verdict is DENY:
+                logger.warning(f"Blocked denylisted network: {client_ip} - {request.method} {request.url.path}")
+                response = JSONResponse(
+                    status_code=status.HTTP_403_FORBIDDEN,
+                    content={
+                        "error": "Access denied",
+                        "message": "Requests from this network are not permitted"
+                    }
+                )
+                await response(scope, receive, send)
+                return
+        
+        user_agent = Headers(scope=scope).get('user-agent', '')
         
-        # Check if the request is from an AI bot
-        if is_ai_bot(user_agent):
+        # Check if the request is from an AI bot (allowlisted networks are trusted)
+        if ip_verdict is not ALLOW and is_ai_bot(user_agent):
+            request = Request(scope)
             # Log the blocked attempt
             logger.warning(
                 f"Blocked AI bot access: {user_agent} - {request.method} {request.url.path} - "
@@ -62,14 +219,15 @@ class BotBlockerMiddleware(BaseHTTPMiddleware):
             )
             
             # Return 403 Forbidden
-            return JSONResponse(
+            response = JSONResponse(
                 status_code=status.HTTP_403_FORBIDDEN,
                 content={
                     "error": "Automated access detected",
                     "message": "AI crawlers are not permitted to access this API"
                 }
             )
+            await response(scope, receive, send)
+            return
         
         # Allow the request to proceed
-        response = await call_next(request)
-        return response
+        await self.app(scope, receive, send)
@@ -0,0 +1,166 @@
+"""
+Cost-weighted rate limiting.
+
+Request-count limits charge a full blog listing the same as a /health ping.
+Routes declare what they cost with @route_cost: a static charge, plus optional
+charges per KiB of response body and per millisecond of database time. Every
+client has a token bucket of RATE_LIMIT_COST_CAPACITY units that refills at
+RATE_LIMIT_COST_REFILL_PER_SECOND.
+
+A request is admitted if the bucket covers its static cost, which is taken up
+front. Response size and DB time are only known afterwards and are charged once
+the response is ready, which may leave the bucket in debt: the next expensive
+request then waits until it has refilled. Clients are keyed on the first identity
+of the request-count key (the user, or the client IP if anonymous); the shared
+per-address limit is left to the request-count limits. Buckets are kept per process.
+"""
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Tuple
+from fastapi import Request, status
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.config import get_settings
+from app.middleware.rate_limit_strategy import KEY_SEPARATOR
+from app.middleware.route_attributes import RouteAttributeLookup, route_attribute
+from app.middleware.rate_limiter import get_rate_limit_key
+from app.utils.db_timing import track_db_time
+from app.utils.logger import logger
+from app.utils.metrics import metrics
+
+settings = get_settings()
+
+
+@dataclass(frozen=True)
+class RouteCost:
+    static: float = 1.0
+    per_kib: float = 0.0
+    per_db_ms: float = 0.0
+
+    def variable(self, response_bytes: int, db_seconds: float) -> float:
+        return self.per_kib * response_bytes / 1024 + self.per_db_ms * db_seconds * 1000
+
+
+def route_cost(cost: RouteCost):
+    """Declare a route's cost."""
+    return route_attribute("__route_cost__", cost)
+
+
+# Route costs, in budget units
+BLOG_COST = RouteCost(static=1, per_kib=0.5)
+BLOG_LIST_COST = RouteCost(static=10, per_kib=1, per_db_ms=1)
+MY_BLOGS_COST = RouteCost(static=5, per_kib=0.5, per_db_ms=1)
+ANALYTICS_COST = RouteCost(static=20, per_db_ms=2)
+
+
+class TokenBuckets:
+    def __init__(self, capacity: float, refill_per_second: float, max_keys: int = 100000):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.max_keys = max_keys
+        # key -> (tokens, updated_at); keys with a full bucket are not stored
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+        metrics.gauge("rate_limit_cost_buckets", "Clients with a partially drained cost budget", lambda: len(self._buckets))
+
+    def level(self, key: str, now: float) -> float:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return self.capacity
+        tokens, updated_at = bucket
+        return min(self.capacity, tokens + (now - updated_at) * self.refill_per_second)
+
+    def _store(self, key: str, tokens: float, now: float) -> None:
+        if tokens >= self.capacity:
+            self._buckets.pop(key, None)
+            return
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+
+    def acquire(self, key: str, cost: float) -> float:
+        """Take cost from the bucket if it can cover it. Returns 0 on success, else seconds until it can."""
+        now = time.time()
+        cost = min(cost, self.capacity)
+        level = self.level(key, now)
+        if level < cost:
+            return (cost - level) / self.refill_per_second
+        self._store(key, level - cost, now)
+        return 0.0
+
+    def charge(self, key: str, cost: float) -> None:
+        """Take cost unconditionally; the bucket may go negative."""
+        now = time.time()
+        self._store(key, self.level(key, now) - cost, now)
+
+
+cost_buckets = TokenBuckets(
+    capacity=settings.RATE_LIMIT_COST_CAPACITY,
+    refill_per_second=settings.RATE_LIMIT_COST_REFILL_PER_SECOND,
+    max_keys=settings.RATE_LIMIT_COST_MAX_CLIENTS,
+)
+
+
+class CostLimitMiddleware:
+    """
+    Middleware that charges @route_cost routes against the caller's token bucket.
+    Must run inside AuthenticationMiddleware so users are keyed by id.
+    """
+
+    def __init__(self, app: ASGIApp, buckets: TokenBuckets = cost_buckets):
+        self.app = app
+        self.buckets = buckets
+        self._route_cost = RouteAttributeLookup("__route_cost__")
+        self._rejected = metrics.counter("rate_limit_cost_rejects_total", "Requests rejected for an exhausted cost budget")
+        self._charged = metrics.counter("rate_limit_cost_units_total", "Cost budget units charged")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        _, cost = self._route_cost(scope)
+        if cost is None:
+            await self.app(scope, receive, send)
+            return
+
+        request = Request(scope)
+        key = get_rate_limit_key(request).split(KEY_SEPARATOR)[0]
+        retry_after = self.buckets.acquire(key, cost.static)
+        if retry_after:
+            self._rejected.inc()
+            logger.warning(
+                f"Cost limit exceeded - Key: {key}, "
+                f"Path: {request.url.path}, "
+                f"Method: {request.method}, "
+                f"Retry after: {retry_after:.1f}s"
+            )
+            response = JSONResponse(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                content={
+                    "error": "Rate limit exceeded",
+                    "message": "Too many expensive requests. Please try again later.",
+                    "retry_after": math.ceil(retry_after)
+                },
+                headers={"Retry-After": str(math.ceil(retry_after))}
+            )
+            await response(scope, receive, send)
+            return
+
+        response_bytes = 0
+
+        async def send_counting(message: Message) -> None:
+            nonlocal response_bytes
+            if message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        with track_db_time() as db_seconds:
+            await self.app(scope, receive, send_counting)
+        variable = cost.variable(response_bytes, db_seconds[0])
+        if variable:
+            self.buckets.charge(key, variable)
+        self._charged.inc(cost.static + variable)
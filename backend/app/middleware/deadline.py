@@ -0,0 +1,97 @@
+"""
+Request deadlines.
+
+Nothing used to bound how long a request could hold a pool connection: a slow
+list scan kept its slot for as long as Postgres took. Every request now gets a
+deadline, REQUEST_DEADLINE_SECONDS unless its route declares one with
+@deadline. When it expires the request is cancelled, which also cancels a
+running query (asyncpg sends Postgres a cancel request), and the client gets 504.
+The deadline covers the request up to its last response byte; background tasks
+that run after that (rehashing a password, waking the email worker) are not
+bound by it.
+
+For routes that declare their deadline, the remaining budget is also handed to
+Postgres: their transactions, reads included, get statement_timeout and
+lock_timeout set to it (see app/database.py), so the server stops on its own
+should the cancel never arrive. That costs a statement per transaction, which
+the cheap auth routes running on the default deadline are spared.
+"""
+import asyncio
+from fastapi import status
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.config import get_settings
+from app.middleware.route_attributes import RouteAttributeLookup, route_attribute
+from app.utils.deadline import request_deadline
+from app.utils.logger import logger
+from app.utils.metrics import metrics
+
+settings = get_settings()
+
+
+def deadline(seconds: float):
+    """Declare a route's deadline in seconds."""
+    return route_attribute("__deadline__", seconds)
+
+
+# Route deadlines, in seconds
+LIST_SCAN_DEADLINE = 5.0
+ANALYTICS_DEADLINE = 5.0
+
+
+class RequestDeadlineMiddleware:
+    """
+    Middleware that cancels requests running past their deadline.
+    Pure ASGI; sits outside admission control so time spent queued counts too.
+    """
+
+    def __init__(self, app: ASGIApp, default_seconds: float = settings.REQUEST_DEADLINE_SECONDS):
+        self.app = app
+        self.default_seconds = default_seconds
+        self._route_deadline = RouteAttributeLookup("__deadline__")
+        self._exceeded = metrics.counter("request_deadline_exceeded_total", "Requests cancelled at their deadline")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        _, route_seconds = self._route_deadline(scope)
+        seconds = route_seconds or self.default_seconds
+        if not seconds:
+            await self.app(scope, receive, send)
+            return
+
+        response_started = False
+        timeout = asyncio.timeout(seconds)
+
+        with request_deadline(seconds, server_side=route_seconds is not None) as request_budget:
+            async def send_tracking(message: Message) -> None:
+                nonlocal response_started
+                if message["type"] == "http.response.start":
+                    response_started = True
+                await send(message)
+                if message["type"] == "http.response.body" and not message.get("more_body", False) and not timeout.expired():
+                    # The response is complete; background tasks that run next are not bound by the deadline
+                    timeout.reschedule(None)
+                    request_budget.disarm()
+
+            try:
+                async with timeout:
+                    await self.app(scope, receive, send_tracking)
+            except TimeoutError:
+                if not timeout.expired():
+                    raise
+                self._exceeded.inc()
+                logger.warning(f"Deadline: Request cancelled after {seconds:g}s - Path: {scope['path']}, Method: {scope['method']}")
+                if response_started:
+                    # Too late for an error response; the client sees the body cut short
+                    return
+                response = JSONResponse(
+                    status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+                    content={
+                        "error": "Request timed out",
+                        "message": "The request took too long to process. Please try again later."
+                    }
+                )
+                await response(scope, receive, send)
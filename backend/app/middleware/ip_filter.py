@@ -0,0 +1,237 @@
+"""
+CIDR allow and deny lists for the bot blocker.
+
+Scrapers often send a browser user agent, so blocking also works on the
+client's network. Prefixes are read from IP_DENYLIST_FILE and IP_ALLOWLIST_FILE
+(one IPv4/IPv6 address or CIDR per line, # comments) into a CIDRTable, where the
+longest matching prefix decides. An allowlisted range inside a denied one is
+therefore let through, and allowlisted clients skip the user-agent check.
+
+A background worker checks the files every IP_LISTS_RELOAD_SECONDS and builds a
+new table off the event loop. It is swapped in with one assignment, so a request
+always sees either the old lists or the new ones, never a mix.
+"""
+import asyncio
+import bisect
+import ipaddress
+import os
+import socket
+from typing import Dict, List, Optional, Tuple
+from app.config import get_settings
+from app.utils.logger import logger
+from app.utils.metrics import metrics
+
+settings = get_settings()
+
+DENY = True
+ALLOW = False
+
+_V4_MAPPED_PREFIX = b"\x00" * 10 + b"\xff\xff"
+
+
+class CIDRTable:
+    """
+    Longest-prefix match over IPv4 and IPv6 networks.
+
+    CIDR blocks are either nested or disjoint, so the prefix set is flattened
+    once into sorted, non-overlapping ranges, each carrying the value of the
+    longest prefix covering it. Lookups go through a 65536-way radix level on
+    the top 16 address bits: most buckets hold a single value, the rest a few
+    ranges searched with bisect. A lookup is one list index plus, at most, a
+    bisect over a handful of ranges, independent of how many prefixes are loaded.
+    """
+
+    INDEX_BITS = 16
+
+    def __init__(self, index: Dict[int, list] = None, size: int = 0):
+        # Keyed by packed address length: 4 (IPv4) or 16 (IPv6). Each bucket is a value
+        # (DENY, ALLOW or None) or a (starts, values) pair of ranges within the bucket
+        self._index = index or {4: [None] * (1 << self.INDEX_BITS), 16: [None] * (1 << self.INDEX_BITS)}
+        self.size = size
+
+    @staticmethod
+    def _flatten(networks: List[Tuple[ipaddress._BaseNetwork, bool]]) -> Tuple[List[int], List[Optional[bool]]]:
+        """Sorted range starts and the value from each start up to the next."""
+        starts: List[int] = []
+        values: List[Optional[bool]] = []
+
+        def mark(position: int, value: Optional[bool]) -> None:
+            # From position on, value applies; merge with the range before when possible
+            if starts and starts[-1] == position:
+                starts.pop()
+                values.pop()
+            if values and values[-1] == value or not values and value is None:
+                return
+            starts.append(position)
+            values.append(value)
+
+        # Outer blocks before the blocks they contain; on an exact tie, allow comes last and wins
+        networks = sorted(networks, key=lambda item: (int(item[0].network_address), item[0].prefixlen, not item[1]))
+        open_blocks: List[Tuple[int, Optional[bool]]] = []  # (last address, value), innermost last
+        for network, value in networks:
+            first = int(network.network_address)
+            while open_blocks and open_blocks[-1][0] < first:
+                last, _ = open_blocks.pop()
+                mark(last + 1, open_blocks[-1][1] if open_blocks else None)
+            mark(first, value)
+            open_blocks.append((int(network.broadcast_address), value))
+        while open_blocks:
+            last, _ = open_blocks.pop()
+            mark(last + 1, open_blocks[-1][1] if open_blocks else None)
+        return starts, values
+
+    @classmethod
+    def _build_index(cls, starts: List[int], values: List[Optional[bool]], address_bits: int) -> list:
+        shift = address_bits - cls.INDEX_BITS
+        index = []
+        current = None
+        i = 0
+        for bucket in range(1 << cls.INDEX_BITS):
+            bucket_start = bucket << shift
+            bucket_end = (bucket + 1) << shift
+            while i < len(starts) and starts[i] <= bucket_start:
+                current = values[i]
+                i += 1
+            j = i
+            while j < len(starts) and starts[j] < bucket_end:
+                j += 1
+            if j == i:
+                index.append(current)
+                continue
+            index.append(([bucket_start] + starts[i:j], [current] + values[i:j]))
+            current = values[j - 1]
+            i = j
+        return index
+
+    @classmethod
+    def build(cls, prefixes: List[Tuple[ipaddress._BaseNetwork, bool]]) -> "CIDRTable":
+        index = {}
+        for packed_length, address_bits in ((4, 32), (16, 128)):
+            starts, values = cls._flatten([item for item in prefixes if item[0].max_prefixlen == address_bits])
+            index[packed_length] = cls._build_index(starts, values, address_bits)
+        return cls(index, len(prefixes))
+
+    def lookup_packed(self, packed: bytes) -> Optional[bool]:
+        # The top 16 bits are the first two bytes; most buckets need nothing more
+        entry = self._index[len(packed)][packed[0] << 8 | packed[1]]
+        if entry.__class__ is tuple:
+            starts, values = entry
+            return values[bisect.bisect_right(starts, int.from_bytes(packed, "big")) - 1]
+        return entry
+
+    def lookup(self, ip: str) -> Optional[bool]:
+        """DENY, ALLOW, or None if no prefix covers the address (or it is not an IP)."""
+        try:
+            packed = socket.inet_pton(socket.AF_INET6, ip) if ":" in ip else socket.inet_pton(socket.AF_INET, ip)
+        except OSError:
+            return None
+        if len(packed) == 16 and packed[:12] == _V4_MAPPED_PREFIX:
+            packed = packed[12:]
+        return self.lookup_packed(packed)
+
+
+def read_prefixes_file(path: str) -> List[ipaddress._BaseNetwork]:
+    networks = []
+    invalid = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            entry = line.split("#", 1)[0].strip()
+            if not entry:
+                continue
+            try:
+                networks.append(ipaddress.ip_network(entry, strict=False))
+            except ValueError:
+                invalid.append(entry)
+    if invalid:
+        logger.warning(f"IP Filter: Skipped {len(invalid)} invalid entries in {path} - first: {invalid[0]}")
+    return networks
+
+
+class IPAccessLists:
+    def __init__(
+        self,
+        denylist_file: str = settings.IP_DENYLIST_FILE,
+        allowlist_file: str = settings.IP_ALLOWLIST_FILE,
+        reload_interval: float = settings.IP_LISTS_RELOAD_SECONDS,
+    ):
+        self.denylist_file = denylist_file
+        self.allowlist_file = allowlist_file
+        self.reload_interval = reload_interval
+        self._table = CIDRTable()
+        self._mtimes: Optional[Tuple[Optional[float], Optional[float]]] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self._denied = metrics.counter("ip_filter_denied_total", "Requests rejected by the IP denylist")
+        self._allowed = metrics.counter("ip_filter_allowed_total", "Requests let through by the IP allowlist")
+        metrics.gauge("ip_filter_prefixes", "Prefixes loaded into the IP allow and deny lists", lambda: self._table.size)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.denylist_file or self.allowlist_file)
+
+    def verdict(self, ip: str) -> Optional[bool]:
+        verdict = self._table.lookup(ip)
+        if verdict is DENY:
+            self._denied.inc()
+        elif verdict is ALLOW:
+            self._allowed.inc()
+        return verdict
+
+    @staticmethod
+    def _mtime(path: str) -> Optional[float]:
+        if not path:
+            return None
+        try:
+            return os.stat(path).st_mtime
+        except OSError:
+            return None
+
+    def reload(self) -> bool:
+        """Rebuild the table if either file changed. Blocking; keeps the current lists on error."""
+        mtimes = (self._mtime(self.denylist_file), self._mtime(self.allowlist_file))
+        if mtimes == self._mtimes:
+            return False
+        try:
+            prefixes = []
+            for path, value in ((self.denylist_file, DENY), (self.allowlist_file, ALLOW)):
+                if path:
+                    prefixes.extend((network, value) for network in read_prefixes_file(path))
+            table = CIDRTable.build(prefixes)
+        except OSError as e:
+            logger.error(f"IP Filter: Failed to load IP lists, keeping the current ones - error: {str(e)}")
+            return False
+        self._table, self._mtimes = table, mtimes
+        logger.info(f"IP Filter: Loaded {table.size} prefixes")
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                # Parsing and building 100k prefixes takes a while; keep it off the event loop
+                await asyncio.to_thread(self.reload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"IP Filter: Error reloading IP lists - error: {str(e)}", exc_info=True)
+
+    def start(self) -> None:
+        if not self.enabled:
+            return
+        # Load before serving so the lists apply from the first request
+        self.reload()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+
+ip_access_lists = IPAccessLists()
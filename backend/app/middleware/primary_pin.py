@@ -0,0 +1,52 @@
+"""
+Read-after-write pinning for read replicas.
+
+A client that just wrote reads from the primary for READ_AFTER_WRITE_PIN_SECONDS,
+so it sees its own writes before the replicas catch up (see get_read_db). The
+pin is a cookie, set only on responses to requests whose read-write session
+committed a write; routes marked @no_primary_pin never set it.
+"""
+import time
+from starlette.datastructures import MutableHeaders
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.config import get_settings
+from app.database import PRIMARY_PIN_COOKIE
+
+settings = get_settings()
+
+
+class PrimaryPinMiddleware:
+    """
+    Middleware that adds the primary pin cookie once get_db has committed a write.
+    Pure ASGI; get_db flags the request in its state after the commit, which runs
+    before the response starts.
+    """
+
+    def __init__(self, app: ASGIApp, pin_seconds: int = settings.READ_AFTER_WRITE_PIN_SECONDS):
+        self.app = app
+        self.pin_seconds = pin_seconds
+
+    def _cookie(self) -> str:
+        cookie = Response()
+        cookie.set_cookie(
+            key=PRIMARY_PIN_COOKIE,
+            value=str(int(time.time() + self.pin_seconds)),
+            httponly=True,
+            secure=True,
+            samesite="lax",
+            max_age=self.pin_seconds
+        )
+        return cookie.headers["set-cookie"]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_pin(message: Message) -> None:
+            if message["type"] == "http.response.start" and scope.get("state", {}).get("wrote_to_primary"):
+                MutableHeaders(scope=message).append("set-cookie", self._cookie())
+            await send(message)
+
+        await self.app(scope, receive, send_with_pin)
@@ -0,0 +1,272 @@
+"""
+Bounded in-process storage for rate limit counters (bounded-memory://).
+
+limits' MemoryStorage keeps one counter or event list per key until it
+expires, so a scraper rotating through millions of source addresses grows
+the worker without bound. This storage holds at most max_keys keys:
+
+- keys are spread over shards, each with its own lock and a fixed share of
+  the cap, so concurrent checks on different keys rarely contend
+- per-key state lives in slot-indexed arrays (counter, expiry, reference
+  bit); moving windows keep their timestamps in a compact array('d')
+- when a shard is full, a clock hand sweeps its slots: expired keys are
+  reclaimed immediately, recently used keys get a second chance, and the
+  first idle key found is evicted. Evicting a live key only forgets its
+  history, i.e. it errs on the side of admitting.
+"""
+import bisect
+import math
+import threading
+import time
+import urllib.parse
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+from limits.storage import MovingWindowSupport, SlidingWindowCounterSupport, Storage
+from limits.storage.base import TimestampedSlidingWindow
+from app.utils.metrics import metrics
+
+
+class _Shard:
+    __slots__ = ("lock", "capacity", "slots", "keys", "counts", "expires", "referenced", "windows", "free", "hand")
+
+    def __init__(self, capacity: int):
+        self.lock = threading.Lock()
+        self.capacity = capacity
+        self.clear()
+
+    def clear(self) -> None:
+        self.slots: Dict[str, int] = {}
+        # Slot-indexed state, grown on demand up to capacity
+        self.keys: List[Optional[str]] = []
+        self.counts = array("q")
+        self.expires = array("d")
+        self.referenced = bytearray()
+        self.windows: List[Optional[array]] = []
+        self.free: List[int] = []
+        self.hand = 0
+
+
+class BoundedMemoryStorage(Storage, MovingWindowSupport, SlidingWindowCounterSupport, TimestampedSlidingWindow):
+    STORAGE_SCHEME = ["bounded-memory"]
+
+    def __init__(self, uri: Optional[str] = None, wrap_exceptions: bool = False, max_keys: int = 100000, shards: int = 16, **options):
+        # Options may also come from the URI: bounded-memory://?max_keys=50000&shards=8
+        query = dict(urllib.parse.parse_qsl(urllib.parse.urlparse(uri).query)) if uri else {}
+        max_keys = int(query.get("max_keys", max_keys))
+        shards = int(query.get("shards", shards))
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.max_keys = max_keys
+        per_shard = max(1, math.ceil(max_keys / shards))
+        self._shards = [_Shard(per_shard) for _ in range(shards)]
+
+        self._evicted = metrics.counter("rate_limit_storage_evictions_total", "Live rate limit keys evicted to stay under the key cap")
+        self._reclaimed = metrics.counter("rate_limit_storage_reclaimed_total", "Expired rate limit keys reclaimed")
+        metrics.gauge("rate_limit_storage_keys", "Keys held by the bounded rate limit storage", lambda: len(self))
+
+    def __len__(self) -> int:
+        return sum(len(shard.slots) for shard in self._shards)
+
+    @property
+    def base_exceptions(self):
+        return ValueError
+
+    def _shard(self, key: str) -> _Shard:
+        return self._shards[hash(key) % len(self._shards)]
+
+    # Slot management; callers hold the shard lock
+
+    def _release(self, shard: _Shard, slot: int) -> None:
+        del shard.slots[shard.keys[slot]]
+        shard.keys[slot] = None
+        shard.windows[slot] = None
+        shard.free.append(slot)
+
+    def _evict(self, shard: _Shard, now: float) -> None:
+        """Second-chance clock sweep; frees exactly one slot."""
+        while True:
+            slot = shard.hand
+            shard.hand = (slot + 1) % len(shard.keys)
+            if shard.keys[slot] is None:
+                continue
+            if shard.expires[slot] <= now:
+                self._reclaimed.inc()
+            elif shard.referenced[slot]:
+                shard.referenced[slot] = 0
+                continue
+            else:
+                self._evicted.inc()
+            self._release(shard, slot)
+            return
+
+    def _find(self, shard: _Shard, key: str, now: float) -> Optional[int]:
+        """Live slot for key, or None. Expired slots are reclaimed on the way."""
+        slot = shard.slots.get(key)
+        if slot is None:
+            return None
+        if shard.expires[slot] <= now:
+            self._reclaimed.inc()
+            self._release(shard, slot)
+            return None
+        shard.referenced[slot] = 1
+        return slot
+
+    def _allocate(self, shard: _Shard, key: str, expires_at: float, now: float) -> int:
+        if not shard.free and len(shard.keys) >= shard.capacity:
+            self._evict(shard, now)
+        if shard.free:
+            slot = shard.free.pop()
+            shard.keys[slot] = key
+            shard.counts[slot] = 0
+            shard.expires[slot] = expires_at
+            shard.referenced[slot] = 1
+        else:
+            slot = len(shard.keys)
+            shard.keys.append(key)
+            shard.counts.append(0)
+            shard.expires.append(expires_at)
+            shard.referenced.append(1)
+            shard.windows.append(None)
+        shard.slots[key] = slot
+        return slot
+
+    # Counters (fixed window, sliding window counter)
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        now = time.time()
+        shard = self._shard(key)
+        with shard.lock:
+            slot = self._find(shard, key, now)
+            if slot is None:
+                slot = self._allocate(shard, key, now + expiry, now)
+            shard.counts[slot] += amount
+            return shard.counts[slot]
+
+    def decr(self, key: str, amount: int = 1) -> int:
+        now = time.time()
+        shard = self._shard(key)
+        with shard.lock:
+            slot = self._find(shard, key, now)
+            if slot is None:
+                return 0
+            shard.counts[slot] = max(shard.counts[slot] - amount, 0)
+            return shard.counts[slot]
+
+    def get(self, key: str) -> int:
+        now = time.time()
+        shard = self._shard(key)
+        with shard.lock:
+            slot = self._find(shard, key, now)
+            return 0 if slot is None else shard.counts[slot]
+
+    def get_expiry(self, key: str) -> float:
+        now = time.time()
+        shard = self._shard(key)
+        with shard.lock:
+            slot = self._find(shard, key, now)
+            return now if slot is None else shard.expires[slot]
+
+    def clear(self, key: str) -> None:
+        shard = self._shard(key)
+        with shard.lock:
+            slot = shard.slots.get(key)
+            if slot is not None:
+                self._release(shard, slot)
+
+    def check(self) -> bool:
+        return True
+
+    def reset(self) -> int:
+        count = 0
+        for shard in self._shards:
+            with shard.lock:
+                count += len(shard.slots)
+                shard.clear()
+        return count
+
+    # Moving window: per key, the timestamps of its hits in ascending order
+
+    def _window(self, shard: _Shard, key: str, expiry: int, now: float) -> Tuple[Optional[int], Optional[array]]:
+        slot = self._find(shard, key, now)
+        if slot is None:
+            return None, None
+        window = shard.windows[slot]
+        if window is not None:
+            del window[:bisect.bisect_left(window, now - expiry)]
+        return slot, window
+
+    def _acquire_locked(self, shard: _Shard, key: str, expiry: int, amount: int, now: float) -> None:
+        slot, window = self._window(shard, key, expiry, now)
+        if slot is None:
+            slot = self._allocate(shard, key, now + expiry, now)
+        if window is None:
+            window = shard.windows[slot] = array("d")
+        window.extend([now] * amount)
+        shard.expires[slot] = now + expiry
+
+    def acquire_entry(self, key: str, limit: int, expiry: int, amount: int = 1) -> bool:
+        return self.acquire_entries([key], [limit], expiry, amount)
+
+    def acquire_entries(self, keys: Sequence[str], limits: Sequence[int], expiry: int, amount: int = 1) -> bool:
+        """Acquire amount entries under every key, or under none if any key is full (limits[i] applies to keys[i])."""
+        if amount > min(limits):
+            return False
+        shards = sorted({id(shard): shard for shard in map(self._shard, keys)}.values(), key=id)
+        # Lock in a fixed order so concurrent multi-key acquisitions cannot deadlock
+        for shard in shards:
+            shard.lock.acquire()
+        try:
+            now = time.time()
+            for key, limit in zip(keys, limits):
+                _, window = self._window(self._shard(key), key, expiry, now)
+                if window is not None and len(window) + amount > limit:
+                    return False
+            for key in keys:
+                self._acquire_locked(self._shard(key), key, expiry, amount, now)
+            return True
+        finally:
+            for shard in shards:
+                shard.lock.release()
+
+    def get_moving_window(self, key: str, limit: int, expiry: int) -> Tuple[float, int]:
+        now = time.time()
+        shard = self._shard(key)
+        with shard.lock:
+            _, window = self._window(shard, key, expiry, now)
+            if not window:
+                return now, 0
+            return window[0], len(window)
+
+    # Sliding window counter, on top of the counters (as in limits' MemoryStorage)
+
+    def acquire_sliding_window_entry(self, key: str, limit: int, expiry: int, amount: int = 1) -> bool:
+        if amount > limit:
+            return False
+        now = time.time()
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        previous_count, previous_ttl, current_count, _ = self._get_sliding_window_info(previous_key, current_key, expiry, now)
+        if math.floor(previous_count * previous_ttl / expiry + current_count) + amount > limit:
+            return False
+        current_count = self.incr(current_key, 2 * expiry, amount=amount)
+        if math.floor(previous_count * previous_ttl / expiry + current_count) > limit:
+            # Lost a race with another hit: take it back
+            self.decr(current_key, amount)
+            return False
+        return True
+
+    def _get_sliding_window_info(self, previous_key: str, current_key: str, expiry: int, now: float) -> Tuple[int, float, int, float]:
+        previous_count = self.get(previous_key)
+        current_count = self.get(current_key)
+        previous_ttl = 0.0 if previous_count == 0 else (1 - (((now - expiry) / expiry) % 1)) * expiry
+        current_ttl = (1 - ((now / expiry) % 1)) * expiry + expiry
+        return previous_count, previous_ttl, current_count, current_ttl
+
+    def get_sliding_window(self, key: str, expiry: int) -> Tuple[int, float, int, float]:
+        now = time.time()
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        return self._get_sliding_window_info(previous_key, current_key, expiry, now)
+
+    def clear_sliding_window(self, key: str, expiry: int) -> None:
+        now = time.time()
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        self.clear(previous_key)
+        self.clear(current_key)
@@ -0,0 +1,233 @@
+"""
+Local short-circuiting in front of the shared rate limit storage.
+
+With a shared backend (Redis) every limit check is a network round trip from
+the event loop. Most clients are either far below their limit or already
+blocked, and both cases can be answered in-process:
+
+- over:  once the shared storage rejects a key, it is rejected locally until
+         the storage reported the window frees up again.
+- under: a successful check reserves a small lease of extra hits in the same
+         atomic storage operation; those hits are then admitted locally. Leased
+         hits are already counted in the shared window, so the global limit is
+         never exceeded - an unused lease only makes the limit slightly stricter.
+
+A key may name several identities at once, joined with KEY_SEPARATOR (e.g. the
+user and the client IP the user comes from). The first is limited by the item
+itself; the others are shared by many clients and get shared_multiplier times
+its limit. All of them are charged in one all-or-nothing storage operation: a
+request is admitted only if every identity has room.
+"""
+import time
+from collections import OrderedDict
+from typing import List, Sequence, Tuple
+from limits import RateLimitItem
+from limits.storage import RedisStorage, RedisClusterStorage
+from limits.strategies import FixedWindowRateLimiter, MovingWindowRateLimiter, RateLimiter
+from limits.util import WindowStats
+from app.utils.metrics import metrics
+
+KEY_SEPARATOR = "|"
+
+# Rough per-entry cost of a moving-window log entry (timestamp + list slot + object header)
+MOVING_WINDOW_ENTRY_BYTES = 64
+KEY_OVERHEAD_BYTES = 120
+
+# limits' acquire_moving_window.lua, generalised to several keys with a limit each
+# (ARGV[3 + i] for KEYS[i]): either every key gets the entries or none does
+ACQUIRE_MOVING_WINDOW_MULTI_LUA = """
+local timestamp = tonumber(ARGV[1])
+local expiry = tonumber(ARGV[2])
+local amount = tonumber(ARGV[3])
+
+for i, key in ipairs(KEYS) do
+    local limit = tonumber(ARGV[3 + i])
+    if amount > limit then
+        return false
+    end
+    local entry = redis.call('lindex', key, limit - amount)
+    if entry and tonumber(entry) >= timestamp - expiry then
+        return false
+    end
+end
+
+local entries = {}
+for i = 1, amount do
+    entries[i] = timestamp
+end
+
+for i, key in ipairs(KEYS) do
+    for j = 1, #entries, 5000 do
+        redis.call('lpush', key, unpack(entries, j, math.min(j + 4999, #entries)))
+    end
+    redis.call('ltrim', key, 0, tonumber(ARGV[3 + i]) - 1)
+    redis.call('expire', key, expiry)
+end
+
+return true
+"""
+
+# (item the identity is limited by, identifiers)
+Identity = Tuple[RateLimitItem, Tuple[str, ...]]
+
+
+class LocalShortCircuitRateLimiter(RateLimiter):
+    def __init__(self, inner: RateLimiter, lease_fraction: float = 0.05, max_keys: int = 100000, short_circuit: bool = True, shared_multiplier: int = 1):
+        super().__init__(inner.storage)
+        self.inner = inner
+        # Without short-circuiting every check goes to storage; composite keys still apply
+        self.short_circuit = short_circuit
+        self.lease_fraction = lease_fraction
+        self.max_keys = max_keys
+        self.shared_multiplier = shared_multiplier
+        # Fixed window INCRs even when the charge is rejected, so a refused bulk lease would
+        # still be counted; only all-or-nothing strategies (moving / sliding window) lease
+        self._can_lease = not isinstance(inner, FixedWindowRateLimiter)
+        # key -> unix time the shared window frees up
+        self._blocked: "OrderedDict[str, float]" = OrderedDict()
+        # key -> (hits left, lease expiry)
+        self._leases: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        # storage key -> (time its last entry expires, estimated bytes), oldest first
+        self._accounted: "OrderedDict[str, Tuple[float, int]]" = OrderedDict()
+        self._accounted_bytes = 0
+        self._multi_acquire = self._build_multi_acquire()
+
+        self._local_hits = metrics.counter("rate_limit_local_admits_total", "Rate limit checks admitted from a local lease")
+        self._local_rejects = metrics.counter("rate_limit_local_rejects_total", "Rate limit checks rejected from the local over-limit cache")
+        self._remote_checks = metrics.counter("rate_limit_storage_checks_total", "Rate limit checks that went to the shared storage")
+        metrics.gauge("rate_limit_state_keys", "Rate limit keys that may still hold state in the storage", lambda: len(self._accounted))
+        metrics.gauge("rate_limit_state_bytes", "Upper-bound estimate of rate limit state held in the storage", lambda: self._accounted_bytes)
+
+    def _build_multi_acquire(self):
+        """One all-or-nothing storage operation for several moving-window keys, if the storage allows it."""
+        if not isinstance(self.inner, MovingWindowRateLimiter):
+            return None
+        storage = self.inner.storage
+        if hasattr(storage, "acquire_entries"):
+            return storage.acquire_entries
+        if isinstance(storage, RedisStorage) and not isinstance(storage, RedisClusterStorage):
+            script = storage.get_connection().register_script(ACQUIRE_MOVING_WINDOW_MULTI_LUA)
+
+            def acquire_redis(keys: List[str], limits: List[int], expiry: int, amount: int) -> bool:
+                return bool(script([storage.prefixed_key(key) for key in keys], [time.time(), expiry, amount, *limits]))
+
+            return acquire_redis
+        if hasattr(storage, "get_moving_window") and not isinstance(storage, RedisStorage):
+            # In-process storage: check-then-acquire cannot interleave with another request,
+            # since checks run synchronously on the event loop thread
+            def acquire_local(keys: List[str], limits: List[int], expiry: int, amount: int) -> bool:
+                if any(storage.get_moving_window(key, limit, expiry)[1] + amount > limit for key, limit in zip(keys, limits)):
+                    return False
+                for key, limit in zip(keys, limits):
+                    storage.acquire_entry(key, limit, expiry, amount)
+                return True
+
+            return acquire_local
+        return None
+
+    def _identities(self, item: RateLimitItem, identifiers: Sequence[str]) -> List[Identity]:
+        """("user:5|ip:10.0.0.1", "scope") -> [(item, ("user:5", "scope")), (shared item, ("ip:10.0.0.1", "scope"))]"""
+        if not identifiers or KEY_SEPARATOR not in identifiers[0]:
+            return [(item, tuple(identifiers))]
+        first, *shared = identifiers[0].split(KEY_SEPARATOR)
+        scope = tuple(identifiers[1:])
+        shared_item = type(item)(item.amount * self.shared_multiplier, item.multiples, item.namespace)
+        return [(item, (first, *scope))] + [(shared_item, (identity, *scope)) for identity in shared]
+
+    def _account(self, identities: List[Identity], now: float) -> None:
+        """Track which keys can still hold state, and roughly how much, without scanning the storage."""
+        moving_window = isinstance(self.inner, MovingWindowRateLimiter)
+        for item, identity in identities:
+            expiry = item.get_expiry()
+            entries = item.amount if moving_window else 1
+            key = item.key_for(*identity)
+            previous = self._accounted.pop(key, None)
+            size = previous[1] if previous else KEY_OVERHEAD_BYTES + len(key) + entries * MOVING_WINDOW_ENTRY_BYTES
+            if previous is None:
+                self._accounted_bytes += size
+            self._accounted[key] = (now + expiry, size)
+        # Refreshed keys move to the end, so everything expired sits at the front
+        while self._accounted:
+            key, (expires_at, size) = next(iter(self._accounted.items()))
+            if expires_at > now:
+                break
+            del self._accounted[key]
+            self._accounted_bytes -= size
+
+    def _storage_hit(self, identities: List[Identity], cost: int) -> bool:
+        if len(identities) == 1:
+            item, identity = identities[0]
+            return self.inner.hit(item, *identity, cost=cost)
+        if self._multi_acquire is not None:
+            keys = [item.key_for(*identity) for item, identity in identities]
+            limits = [item.amount for item, _ in identities]
+            return self._multi_acquire(keys, limits, identities[0][0].get_expiry(), cost)
+        # No atomic multi-key support (fixed window, Redis cluster): charge one by one
+        return all([self.inner.hit(item, *identity, cost=cost) for item, identity in identities])
+
+    def _remember(self, table: "OrderedDict", key: str, value) -> None:
+        table[key] = value
+        table.move_to_end(key)
+        while len(table) > self.max_keys:
+            table.popitem(last=False)
+
+    def _lease_size(self, item: RateLimitItem) -> int:
+        if not self._can_lease or not self.short_circuit:
+            return 0
+        return int(item.amount * self.lease_fraction)
+
+    def hit(self, item: RateLimitItem, *identifiers: str, cost: int = 1) -> bool:
+        key = item.key_for(*identifiers)
+        now = time.time()
+
+        blocked_until = self._blocked.get(key)
+        if blocked_until is not None:
+            if now < blocked_until:
+                self._local_rejects.inc()
+                return False
+            del self._blocked[key]
+
+        lease = self._leases.get(key)
+        if lease is not None:
+            remaining, expires_at = lease
+            if now < expires_at and remaining >= cost:
+                self._leases[key] = (remaining - cost, expires_at)
+                self._local_hits.inc()
+                return True
+            del self._leases[key]
+
+        self._remote_checks.inc()
+        identities = self._identities(item, identifiers)
+        self._account(identities, now)
+        lease_size = self._lease_size(item)
+        if lease_size and self._storage_hit(identities, cost + lease_size):
+            # Leased hits age out of the shared window early, so keep the lease short
+            self._remember(self._leases, key, (lease_size, now + item.get_expiry() * self.lease_fraction))
+            return True
+
+        if self._storage_hit(identities, cost):
+            return True
+        if not self.short_circuit:
+            return False
+
+        reset_time = self.get_window_stats(item, *identifiers).reset_time
+        if reset_time > now:
+            self._remember(self._blocked, key, reset_time)
+        return False
+
+    def test(self, item: RateLimitItem, *identifiers: str, cost: int = 1) -> bool:
+        return all(self.inner.test(limit, *identity, cost=cost) for limit, identity in self._identities(item, identifiers))
+
+    def get_window_stats(self, item: RateLimitItem, *identifiers: str) -> WindowStats:
+        # The tightest identity decides: least remaining, and it frees up last
+        stats = [self.inner.get_window_stats(limit, *identity) for limit, identity in self._identities(item, identifiers)]
+        remaining = min(stat.remaining for stat in stats)
+        reset_time = max(stat.reset_time for stat in stats if stat.remaining == remaining)
+        return WindowStats(reset_time, remaining)
+
+    def clear(self, item: RateLimitItem, *identifiers: str) -> None:
+        key = item.key_for(*identifiers)
+        self._blocked.pop(key, None)
+        self._leases.pop(key, None)
+        for limit, identity in self._identities(item, identifiers):
+            self.inner.clear(limit, *identity)
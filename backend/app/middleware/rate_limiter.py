@@ -2,15 +2,134 @@
 Rate limiting configuration using slowapi.
 Prevents aggressive scraping and API abuse.
 """
+import ipaddress
+from typing import List, Optional
+from limits.strategies import STRATEGIES
 from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from fastapi import Request
+from app.config import get_settings
+from app.middleware.rate_limit_storage import BoundedMemoryStorage
+from app.middleware.rate_limit_strategy import KEY_SEPARATOR, LocalShortCircuitRateLimiter
 from app.utils.logger import logger
 
+settings = get_settings()
+
+
+def parse_networks(value: str) -> List[ipaddress._BaseNetwork]:
+    networks = []
+    for entry in value.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        try:
+            networks.append(ipaddress.ip_network(entry, strict=False))
+        except ValueError:
+            logger.warning(f"Rate Limiter: Ignoring invalid TRUSTED_PROXIES entry - value: {entry}")
+    return networks
+
+
+TRUSTED_PROXY_NETWORKS = parse_networks(settings.TRUSTED_PROXIES)
+
+
+def _parse_ip(value: str) -> Optional[ipaddress._BaseAddress]:
+    try:
+        return ipaddress.ip_address(value.strip())
+    except ValueError:
+        return None
+
+
+def _is_trusted(ip: ipaddress._BaseAddress) -> bool:
+    return any(ip in network for network in TRUSTED_PROXY_NETWORKS)
+
+
+def get_client_ip(request: Request) -> str:
+    """
+    Client IP address, honouring X-Forwarded-For only as far as it was written by trusted proxies.
+    
+    Each proxy appends the address it received the connection from, so the header is
+    walked right to left from the direct peer: the first address not in TRUSTED_PROXIES
+    is the client. Anything left of it was supplied by the client and cannot be trusted.
+    
+    Args:
+        request: FastAPI request object
+        
+    Returns:
+        Client IP address, or "unknown" without a peer address
+    """
+    peer = request.client.host if request.client else None
+    if peer is None:
+        return "unknown"
+    client = _parse_ip(peer)
+    if client is None or not _is_trusted(client):
+        return peer
+
+    for hop in reversed(request.headers.get("X-Forwarded-For", "").split(",")):
+        hop_ip = _parse_ip(hop)
+        if hop_ip is None:
+            # Garbage in the chain: stop at the last address a trusted proxy vouched for
+            break
+        client = hop_ip
+        if not _is_trusted(hop_ip):
+            break
+    return str(client)
+
+
+def get_rate_limit_key(request: Request) -> str:
+    """
+    Custom key function for rate limiting.
+    Authenticated requests are charged to the user, wherever they come from, and to the
+    users of their client IP, whose limit is RATE_LIMIT_SHARED_IP_MULTIPLIER times larger:
+    users behind the same NAT do not use up each other's budget, but one address cannot
+    run an unbounded number of accounts. Both are checked in one storage operation.
+    Anonymous requests are charged to the client IP, in a bucket of their own.
+    
+    Args:
+        request: FastAPI request object
+        
+    Returns:
+        String identifier for rate limiting ("user:<id>|users-ip:<ip>" or "ip:<ip>")
+    """
+    ip = get_client_ip(request)
+    principal = getattr(request.state, "principal", None)
+    if principal is not None:
+        return f"user:{principal.user_id}{KEY_SEPARATOR}users-ip:{ip}"
+    return f"ip:{ip}"
+
+
 # Create rate limiter instance
-# Uses IP address for rate limiting
-limiter = Limiter(key_func=get_remote_address)
+# Keys on the authenticated user and the proxy-aware client IP. Counters live in
+# RATE_LIMIT_STORAGE_URI (bounded-memory:// is per process; point it at Redis so all workers
+# and instances share one budget). If the shared storage goes down, limits keep being
+# enforced per process until it recovers.
+bounded_storage_options = {
+    "max_keys": settings.RATE_LIMIT_STORAGE_MAX_KEYS,
+    "shards": settings.RATE_LIMIT_STORAGE_SHARDS,
+}
+limiter = Limiter(
+    key_func=get_rate_limit_key,
+    strategy=settings.RATE_LIMIT_STRATEGY,
+    storage_uri=settings.RATE_LIMIT_STORAGE_URI,
+    storage_options=bounded_storage_options if settings.RATE_LIMIT_STORAGE_URI.startswith("bounded-memory:") else {},
+    in_memory_fallback_enabled=True,
+)
+# slowapi has no hook for the strategy objects or its (unbounded) fallback storage; replace
+# them so composite user|ip keys are split, optionally short-circuited locally, and the
+# fallback cannot grow without bound while Redis is down
+limiter._limiter = LocalShortCircuitRateLimiter(
+    limiter._limiter,
+    lease_fraction=settings.RATE_LIMIT_LOCAL_LEASE_FRACTION,
+    max_keys=settings.RATE_LIMIT_LOCAL_CACHE_SIZE,
+    short_circuit=settings.RATE_LIMIT_LOCAL_CACHE,
+    shared_multiplier=settings.RATE_LIMIT_SHARED_IP_MULTIPLIER,
+)
+if limiter._fallback_limiter is not None:
+    limiter._fallback_storage = BoundedMemoryStorage(**bounded_storage_options)
+    limiter._fallback_limiter = LocalShortCircuitRateLimiter(
+        STRATEGIES[settings.RATE_LIMIT_STRATEGY](limiter._fallback_storage),
+        short_circuit=False,
+        shared_multiplier=settings.RATE_LIMIT_SHARED_IP_MULTIPLIER,
+    )
 
 # Rate limit configurations
 # Format: "number of requests / time period"
@@ -39,30 +158,6 @@ AUTH_RATE_LIMIT_PER_HOUR = "100/hour"  # 100 requests per hour per IP
 HEALTH_RATE_LIMIT = "300/hour"  # 300 requests per hour per IP
 
 
-def get_rate_limit_key(request: Request) -> str:
-    """
-    Custom key function for rate limiting.
-    Uses IP address as the primary identifier.
-    
-    Args:
-        request: FastAPI request object
-        
-    Returns:
-        String identifier for rate limiting (IP address)
-    """
-    # Get client IP address
-    # Check for forwarded IP (when behind proxy/load balancer)
-    forwarded_for = request.headers.get("X-Forwarded-For")
-    if forwarded_for:
-        # Take the first IP if multiple are present
-        ip = forwarded_for.split(",")[0].strip()
-    else:
-        # Fall back to direct client IP
-        ip = request.client.host if request.client else "unknown"
-    
-    return ip
-
-
 def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
     """
     Custom handler for rate limit exceeded errors.
@@ -79,9 +174,8 @@ def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
     from fastapi import status
     
     # Log the rate limit violation
-    client_ip = get_rate_limit_key(request)
     logger.warning(
-        f"Rate limit exceeded - IP: {client_ip}, "
+        f"Rate limit exceeded - Key: {get_rate_limit_key(request)}, "
         f"Path: {request.url.path}, "
         f"Method: {request.method}, "
         f"Limit: {exc.detail}"
@@ -92,7 +186,7 @@ def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
         status_code=status.HTTP_429_TOO_MANY_REQUESTS,
         content={
             "error": "Rate limit exceeded",
-            "message": "Too many requests from this IP address. Please try again later.",
+            "message": "Too many requests. Please try again later.",
             "retry_after": exc.retry_after if hasattr(exc, 'retry_after') else None
         },
         headers={
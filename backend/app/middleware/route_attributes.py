@@ -0,0 +1,63 @@
+"""
+Per-route settings declared with decorators (@admission, @deadline,
+@route_cost, @track_breadth) and their lookup.
+
+Routing happens further in than the middleware that needs these settings, so
+the request's route is resolved here. Only routes that declare the attribute
+are considered: those without path parameters by a dict lookup on the path, the
+few others with a regular route match.
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+from starlette.routing import Match
+from starlette.types import Scope
+
+Endpoint = TypeVar("Endpoint", bound=Callable)
+
+
+def route_attribute(attribute: str, value: Any) -> Callable[[Endpoint], Endpoint]:
+    """
+    Decorator storing value on the endpoint, for a RouteAttributeLookup of the same
+    attribute. Place it directly below the @router decorator, so the route registers
+    the decorated function.
+    """
+    def decorator(func: Endpoint) -> Endpoint:
+        setattr(func, attribute, value)
+        return func
+    return decorator
+
+
+class RouteAttributeLookup:
+    def __init__(self, attribute: str):
+        self.attribute = attribute
+        self._static_routes: Optional[Dict[str, Tuple[str, Any]]] = None
+        self._param_routes: List[Tuple[Any, Any]] = []
+
+    def _build(self, routes) -> None:
+        self._static_routes = {}
+        for route in routes:
+            value = getattr(getattr(route, "endpoint", None), self.attribute, None)
+            if value is None:
+                continue
+            if "{" in route.path:
+                self._param_routes.append((route, value))
+            else:
+                self._static_routes[route.path] = (route.path, value)
+
+    def __call__(self, scope: Scope) -> Tuple[Optional[str], Any]:
+        """(route path, attribute value) for the request, or (None, None) if its route declares none."""
+        path, value, _ = self.match(scope)
+        return path, value
+
+    def match(self, scope: Scope) -> Tuple[Optional[str], Any, Dict[str, Any]]:
+        """Like calling the lookup, plus the request's path parameters."""
+        # Built lazily since routers are included after the middleware is added
+        if self._static_routes is None:
+            self._build(scope["app"].routes)
+        found = self._static_routes.get(scope["path"])
+        if found is not None:
+            return (*found, {})
+        for route, value in self._param_routes:
+            match, child_scope = route.matches(scope)
+            if match == Match.FULL:
+                return route.path, value, child_scope["path_params"]
+        return None, None, {}
@@ -0,0 +1,323 @@
+"""
+Adaptive scraper detection.
+
+Fixed per-IP limits either block legitimate bursts or miss a slow crawl spread
+over many addresses. Scrapers give themselves away by breadth instead: they
+fetch many different blogs, where readers come back to a few. Every request is
+profiled under three keys - client IP, its network (/24, or /48 for IPv6) and
+its user agent - in sliding-window count-min sketches:
+
+- requests: how many requests each key made in the window
+- breadth:  how many distinct blogs each key fetched, for routes marked with
+            @track_breadth. A (key, blog) pair counts once per window; pairs
+            already seen are recognised by a sliding Bloom filter.
+- clients:  how many distinct IPs fetched blogs with each user agent, counted
+            the same way
+
+Breadth over SCRAPER_BREADTH_PER_* makes a key suspect: its clients are held to
+SCRAPER_SUSPECT_MAX_REQUESTS per window and get 429 beyond that. Breadth over
+SCRAPER_BLOCK_FACTOR times the threshold blocks the IP or network with 403.
+
+A user agent is shared by many honest clients: a common browser's covers the
+whole site in a busy window. Its threshold therefore grows with its clients, to
+SCRAPER_BREADTH_PER_USER_AGENT_CLIENT distinct blogs per IP on average, so it
+only becomes suspect when a few addresses share the breadth (a crawler fleet),
+and it never blocks on its own. Escalations last one window after the last
+detection.
+
+Sketches and filters are allocated up front and escalations are capped at
+SCRAPER_MAX_FLAGGED keys, so memory stays fixed however many clients are seen.
+Counts are approximate but never underestimate; a (rare) false "already seen"
+only lowers a breadth count, i.e. errs on the side of admitting.
+"""
+import ipaddress
+import math
+import operator
+import time
+from array import array
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+from fastapi import Request, status
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+from app.config import get_settings
+from app.middleware.rate_limiter import get_client_ip
+from app.middleware.route_attributes import RouteAttributeLookup, route_attribute
+from app.utils.logger import logger
+from app.utils.metrics import metrics
+
+settings = get_settings()
+
+# Each window is kept as this many slices; the oldest is dropped as time moves on
+WINDOW_SLICES = 5
+
+NORMAL, SUSPECT, BLOCKED = 0, 1, 2
+
+IP, NETWORK, USER_AGENT = "ip", "network", "user_agent"
+
+
+def track_breadth(path_param: str):
+    """Count the distinct values of path_param a client fetches."""
+    return route_attribute("__track_breadth__", path_param)
+
+
+def _hashes(key: str) -> Tuple[int, int]:
+    # str hashes are salted per process, which is fine for sketches that live in one process
+    return hash(key), hash((key,)) | 1
+
+
+class SlidingCountMinSketch:
+    """
+    Count-min sketch over the last window_seconds.
+
+    Counts go to the current one of WINDOW_SLICES slices and to a running total;
+    when a slice slides out of the window it is subtracted from the total, so an
+    estimate reads one counter per row.
+    """
+
+    def __init__(self, window_seconds: float, width: int, depth: int):
+        self.width = width
+        self.depth = depth
+        self.slice_seconds = window_seconds / WINDOW_SLICES
+        self._slices = [self._new_counts() for _ in range(WINDOW_SLICES)]
+        self._total = self._new_counts()
+        self._epoch = 0
+
+    def _new_counts(self) -> array:
+        return array("I", bytes(4 * self.width * self.depth))
+
+    @property
+    def nbytes(self) -> int:
+        return (WINDOW_SLICES + 1) * 4 * self.width * self.depth
+
+    def _current(self, now: float) -> array:
+        epoch = int(now // self.slice_seconds)
+        if epoch != self._epoch:
+            if epoch - self._epoch >= WINDOW_SLICES:
+                # Idle for a whole window: nothing is left in it
+                self._slices = [self._new_counts() for _ in range(WINDOW_SLICES)]
+                self._total = self._new_counts()
+            else:
+                for expired in range(self._epoch + 1, epoch + 1):
+                    index = expired % WINDOW_SLICES
+                    self._total = array("I", map(operator.sub, self._total, self._slices[index]))
+                    self._slices[index] = self._new_counts()
+            self._epoch = epoch
+        return self._slices[epoch % WINDOW_SLICES]
+
+    def positions(self, key: str) -> List[int]:
+        """One counter per row, as offsets into the flattened rows."""
+        h1, h2 = _hashes(key)
+        return [row * self.width + (h1 + row * h2) % self.width for row in range(self.depth)]
+
+    def add(self, positions: List[int], now: float, amount: int = 1) -> None:
+        counts = self._current(now)
+        total = self._total
+        for position in positions:
+            counts[position] += amount
+            total[position] += amount
+
+    def estimate(self, positions: List[int], now: float) -> int:
+        self._current(now)
+        return min(map(self._total.__getitem__, positions))
+
+
+class SlidingBloomFilter:
+    """
+    Bloom filter over the last window_seconds. Each cell holds the slice it was
+    last set in (from 1, wrapping after 65535 slices; 0 is never set), so old
+    entries age out without clearing anything.
+    """
+
+    def __init__(self, window_seconds: float, cells: int, hash_count: int = 4):
+        self.cells = cells
+        self.hash_count = hash_count
+        self.slice_seconds = window_seconds / WINDOW_SLICES
+        self._tags = array("H", bytes(2 * cells))
+
+    @property
+    def nbytes(self) -> int:
+        return 2 * self.cells
+
+    def add(self, key: str, now: float) -> bool:
+        """Add key; True if it was (probably) seen within the window already."""
+        tag = int(now // self.slice_seconds) % 65535 + 1
+        h1, h2 = _hashes(key)
+        tags = self._tags
+        seen = True
+        for i in range(self.hash_count):
+            position = (h1 + i * h2) % self.cells
+            previous = tags[position]
+            if not previous or (tag - previous) % 65535 >= WINDOW_SLICES:
+                seen = False
+            tags[position] = tag
+        return seen
+
+
+def network_of(ip: str) -> str:
+    if "." in ip and ":" not in ip:
+        return ip.rsplit(".", 1)[0] + ".0/24"
+    try:
+        return str(ipaddress.ip_network(f"{ip}/48", strict=False))
+    except ValueError:
+        return ip
+
+
+def client_keys(client_ip: str, user_agent: str) -> List[Tuple[str, str]]:
+    """(dimension, key) pairs a request is profiled under."""
+    return [(IP, f"ip:{client_ip}"), (NETWORK, f"net:{network_of(client_ip)}"), (USER_AGENT, f"ua:{user_agent}")]
+
+
+class ScraperDetector:
+    def __init__(
+        self,
+        window_seconds: float = settings.SCRAPER_WINDOW_SECONDS,
+        sketch_width: int = settings.SCRAPER_SKETCH_WIDTH,
+        sketch_depth: int = settings.SCRAPER_SKETCH_DEPTH,
+        seen_filter_cells: int = settings.SCRAPER_SEEN_FILTER_CELLS,
+        breadth_per_ip: int = settings.SCRAPER_BREADTH_PER_IP,
+        breadth_per_network: int = settings.SCRAPER_BREADTH_PER_NETWORK,
+        breadth_per_user_agent: int = settings.SCRAPER_BREADTH_PER_USER_AGENT,
+        breadth_per_user_agent_client: float = settings.SCRAPER_BREADTH_PER_USER_AGENT_CLIENT,
+        block_factor: float = settings.SCRAPER_BLOCK_FACTOR,
+        suspect_max_requests: int = settings.SCRAPER_SUSPECT_MAX_REQUESTS,
+        max_flagged: int = settings.SCRAPER_MAX_FLAGGED,
+    ):
+        self.window_seconds = window_seconds
+        self.thresholds = {IP: breadth_per_ip, NETWORK: breadth_per_network, USER_AGENT: breadth_per_user_agent}
+        self.breadth_per_user_agent_client = breadth_per_user_agent_client
+        self.block_factor = block_factor
+        self.suspect_max_requests = suspect_max_requests
+        self.max_flagged = max_flagged
+        self.requests = SlidingCountMinSketch(window_seconds, sketch_width, sketch_depth)
+        self.breadth = SlidingCountMinSketch(window_seconds, sketch_width, sketch_depth)
+        self.clients = SlidingCountMinSketch(window_seconds, sketch_width, sketch_depth)
+        self.seen = SlidingBloomFilter(window_seconds, seen_filter_cells)
+        # key -> (level, flagged until), oldest first
+        self._flagged: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+
+        self._detections = {
+            (dimension, level): metrics.counter(
+                f"scraper_{name}_{dimension}_total", f"Scraper detections escalating a {dimension.replace('_', ' ')} to {name}"
+            )
+            for dimension in (IP, NETWORK, USER_AGENT)
+            for level, name in ((SUSPECT, "suspect"), (BLOCKED, "blocked"))
+            if not (dimension == USER_AGENT and level == BLOCKED)
+        }
+        metrics.gauge("scraper_flagged_keys", "IPs, networks and user agents currently escalated", lambda: len(self._flagged))
+        metrics.gauge(
+            "scraper_sketch_bytes", "Fixed memory held by the scraper detection sketches",
+            lambda: self.requests.nbytes + self.breadth.nbytes + self.clients.nbytes + self.seen.nbytes
+        )
+
+    def level(self, keys: List[Tuple[str, str]], now: float) -> int:
+        level = NORMAL
+        for _, key in keys:
+            flagged = self._flagged.get(key)
+            if flagged is None:
+                continue
+            if flagged[1] <= now:
+                del self._flagged[key]
+                continue
+            level = max(level, flagged[0])
+        return level
+
+    def _flag(self, dimension: str, key: str, level: int, now: float) -> None:
+        previous = self._flagged.pop(key, (NORMAL, 0.0))[0]
+        if level > previous:
+            self._detections[dimension, level].inc()
+            logger.warning(f"Scraper Detector: Escalated {dimension} {key} to {'blocked' if level == BLOCKED else 'suspect'}")
+        self._flagged[key] = (max(level, previous), now + self.window_seconds)
+        while len(self._flagged) > self.max_flagged:
+            self._flagged.popitem(last=False)
+
+    def observe(self, keys: List[Tuple[str, str]], item: Optional[str], now: float) -> None:
+        """Count a request by every key (as from client_keys); item is the blog fetched, if the route tracks breadth."""
+        for dimension, key in keys:
+            positions = self.requests.positions(key)
+            self.requests.add(positions, now)
+            if item is None:
+                continue
+            # The same hash family is used for every sketch, so the positions carry over
+            if dimension == USER_AGENT and not self.seen.add(f"{key}|{keys[0][1]}", now):
+                self.clients.add(positions, now)
+            if self.seen.add(f"{key}|{item}", now):
+                continue
+            self.breadth.add(positions, now)
+            breadth = self.breadth.estimate(positions, now)
+            threshold = self.thresholds[dimension]
+            if dimension == USER_AGENT and breadth >= threshold:
+                threshold = max(threshold, self.breadth_per_user_agent_client * self.clients.estimate(positions, now))
+            score = breadth / threshold
+            if score >= self.block_factor and dimension != USER_AGENT:
+                self._flag(dimension, key, BLOCKED, now)
+            elif score >= 1:
+                self._flag(dimension, key, SUSPECT, now)
+
+    def over_suspect_limit(self, ip_key: str, now: float) -> bool:
+        return self.requests.estimate(self.requests.positions(ip_key), now) > self.suspect_max_requests
+
+
+scraper_detector = ScraperDetector()
+
+
+class ScraperDetectionMiddleware:
+    """
+    Middleware that profiles every request and throttles or blocks escalated clients.
+    Pure ASGI; runs before authentication so rejected scrapers cost as little as possible.
+    """
+
+    def __init__(self, app: ASGIApp, detector: ScraperDetector = scraper_detector):
+        self.app = app
+        self.detector = detector
+        self._tracked_param = RouteAttributeLookup("__track_breadth__")
+        self._throttled = metrics.counter("scraper_throttled_requests_total", "Requests from suspect clients rejected with 429")
+        self._blocked = metrics.counter("scraper_blocked_requests_total", "Requests from blocked clients rejected with 403")
+
+    def _tracked_item(self, scope: Scope) -> Optional[str]:
+        _, path_param, path_params = self._tracked_param.match(scope)
+        if path_param is None:
+            return None
+        return str(path_params.get(path_param))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request = Request(scope)
+        client_ip = get_client_ip(request)
+        keys = client_keys(client_ip, Headers(scope=scope).get("user-agent", ""))
+        now = time.time()
+        self.detector.observe(keys, self._tracked_item(scope), now)
+
+        level = self.detector.level(keys, now)
+        if level == BLOCKED:
+            self._blocked.inc()
+            response = JSONResponse(
+                status_code=status.HTTP_403_FORBIDDEN,
+                content={
+                    "error": "Automated access detected",
+                    "message": "This client has been blocked for scraping"
+                }
+            )
+            await response(scope, receive, send)
+            return
+        if level == SUSPECT and self.detector.over_suspect_limit(keys[0][1], now):
+            self._throttled.inc()
+            retry_after = math.ceil(self.detector.requests.slice_seconds)
+            logger.warning(f"Scraper Detector: Throttled suspect client - IP: {client_ip}, Path: {request.url.path}")
+            response = JSONResponse(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                content={
+                    "error": "Rate limit exceeded",
+                    "message": "Too many requests. Please try again later.",
+                    "retry_after": retry_after
+                },
+                headers={"Retry-After": str(retry_after)}
+            )
+            await response(scope, receive, send)
+            return
+
+        await self.app(scope, receive, send)
@@ -1,4 +1,5 @@
-from app.models.user import User, RefreshToken
+from app.models.user import User, RefreshToken, RevokedAccessToken
 from app.models.blog import Blog
+from app.models.email_outbox import EmailOutbox
 
-__all__ = ["User", "RefreshToken", "Blog"]
\ No newline at end of file
+__all__ = ["User", "RefreshToken", "RevokedAccessToken", "Blog", "EmailOutbox"]
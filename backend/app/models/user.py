@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Index, LargeBinary, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -11,9 +11,10 @@ class User(Base):
     email = Column(String(255), unique=True, index=True, nullable=False)
     hashed_password = Column(String(255), nullable=False)
     is_verified = Column(Boolean, default=False)
-    verification_token = Column(String(255), nullable=True)
+    # Tokens are stored as SHA-256 digests of the value sent to the user (see hash_token)
+    verification_token_hash = Column(LargeBinary(32), nullable=True)
     verification_token_expires = Column(DateTime(timezone=True), nullable=True)
-    reset_token = Column(String(255), nullable=True)
+    reset_token_hash = Column(LargeBinary(32), nullable=True)
     reset_token_expires = Column(DateTime(timezone=True), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -21,15 +22,50 @@ class User(Base):
     refresh_tokens = relationship("RefreshToken", back_populates="user", cascade="all, delete-orphan")
     blogs = relationship("Blog", back_populates="user", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # Only users with an outstanding token are indexed, which keeps both indexes tiny
+        Index(
+            "ix_users_verification_token_hash",
+            "verification_token_hash",
+            unique=True,
+            postgresql_where=text("verification_token_hash IS NOT NULL"),
+        ),
+        Index(
+            "ix_users_reset_token_hash",
+            "reset_token_hash",
+            unique=True,
+            postgresql_where=text("reset_token_hash IS NOT NULL"),
+        ),
+    )
+
 
 class RefreshToken(Base):
     __tablename__ = "refresh_tokens"
 
     id = Column(Integer, primary_key=True, index=True)
-    token = Column(String(255), unique=True, index=True, nullable=False)
+    token_hash = Column(LargeBinary(32), unique=True, index=True, nullable=False)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
-    expires_at = Column(DateTime(timezone=True), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
     revoked = Column(Boolean, default=False)
+    # When it was revoked; revoked tokens are kept for reuse detection counting from here
+    revoked_at = Column(DateTime(timezone=True), nullable=True)
+    # Why: rotated, reuse, logout, revoke_all or password_reset; only rotated tokens count as replays
+    revoked_reason = Column(String(16), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     user = relationship("User", back_populates="refresh_tokens")
+
+    __table_args__ = (
+        # Only live tokens are looked up by user (revoke-all on reset / reuse detection)
+        Index("ix_refresh_tokens_active_user_id", "user_id", postgresql_where=text("NOT revoked")),
+        # The purge finds revoked tokens past the retention window by revoked_at
+        Index("ix_refresh_tokens_revoked_at", "revoked_at", postgresql_where=text("revoked")),
+    )
+
+
+class RevokedAccessToken(Base):
+    __tablename__ = "revoked_access_tokens"
+
+    jti = Column(String(64), primary_key=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -1,9 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Response, Cookie, Request
+from fastapi import APIRouter, Depends, HTTPException, status, Response, Cookie, Request, BackgroundTasks
 from typing import Optional
 from pydantic import ValidationError
 from jose.exceptions import JWTError
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.utils.logger import logger
+from app.middleware.admission import admission, AUTH_ADMISSION
 from app.middleware.rate_limiter import (
     limiter,
     AUTH_RATE_LIMIT,
@@ -22,18 +23,22 @@ from app.services.auth import (
     get_user_by_email,
     create_user,
     verify_password,
+    password_needs_rehash,
+    rehash_user_password,
     create_access_token,
     create_refresh_token,
-    validate_refresh_token,
+    rotate_refresh_token,
     revoke_refresh_token,
     verify_user_email,
     create_password_reset_token,
     reset_user_password,
 )
-from app.services.email import send_verification_email, send_password_reset_email
+from app.services.email import enqueue_password_reset_email
+from app.services.email_worker import email_outbox_worker
 from app.dependencies import get_current_user
 from app.database import get_db
-from app.models.user import User
+from app.services.user_cache import user_cache, UserSnapshot
+from app.services.token_denylist import access_token_denylist
 from app.config import get_settings
 from app.utils.mask import mask_email, mask_token
 
@@ -75,26 +80,30 @@ def clear_access_cookie(response: Response) -> None:
 
 
 @router.post("/register", response_model=MessageResponse, status_code=status.HTTP_201_CREATED)
+@admission(AUTH_ADMISSION)
 @limiter.limit(AUTH_RATE_LIMIT)
 @limiter.limit(AUTH_RATE_LIMIT_PER_HOUR)
-async def register(request: Request, user_data: UserCreate, db: AsyncSession = Depends(get_db)):
+async def register(
+    request: Request,
+    user_data: UserCreate,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db)
+):
     try:
         masked_email = mask_email(user_data.email)
         logger.info(f"Router: Registration attempt - email: {masked_email}")
         
-        existing_user = await get_user_by_email(db, user_data.email)
-        if existing_user:
+        logger.debug(f"Router: Creating user - email: {masked_email}")
+        # Also queues the verification email, in the same statement
+        user = await create_user(db, user_data.email, user_data.password)
+        if user is None:
             logger.warning(f"Router: Registration failed - email already registered: {masked_email}")
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Email already registered"
             )
-        
-        logger.debug(f"Router: Creating user - email: {masked_email}")
-        user = await create_user(db, user_data.email, user_data.password)
-        
-        logger.debug(f"Router: Sending verification email - email: {masked_email}")
-        await send_verification_email(user.email, user.verification_token)
+        # Runs after the response is sent, i.e. after get_db() has committed the outbox row
+        background_tasks.add_task(email_outbox_worker.wake)
         
         logger.info(f"Router: Registration successful - user_id: {user.id}, email: {masked_email}")
         return {"message": "Registration successful. Please check your email to verify your account."}
@@ -116,6 +125,7 @@ async def register(request: Request, user_data: UserCreate, db: AsyncSession = D
 
 
 @router.get("/verify-email/{token}", response_model=MessageResponse)
+@admission(AUTH_ADMISSION)
 async def verify_email(token: str, db: AsyncSession = Depends(get_db)):
     try:
         masked_token = f"{token[:4]}...{token[-4:]}" if len(token) > 8 else "***"
@@ -149,12 +159,14 @@ async def verify_email(token: str, db: AsyncSession = Depends(get_db)):
 
 
 @router.post("/login", response_model=TokenResponse)
+@admission(AUTH_ADMISSION)
 @limiter.limit(AUTH_RATE_LIMIT)
 @limiter.limit(AUTH_RATE_LIMIT_PER_HOUR)
 async def login(
     request: Request,
     login_data: LoginRequest,
     response: Response,
+    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db)
 ):
     try:
@@ -171,7 +183,7 @@ async def login(
             )
         
         logger.debug(f"Router: Verifying password for user_id: {user.id}, email: {masked_email}")
-        if not verify_password(login_data.password, user.hashed_password):
+        if not await verify_password(login_data.password, user.hashed_password):
             logger.warning(f"Router: Login failed - invalid password: user_id: {user.id}, email: {masked_email}")
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -185,6 +197,10 @@ async def login(
                 detail="Please verify your email before logging in"
             )
         
+        if password_needs_rehash(user.hashed_password):
+            logger.debug(f"Router: Scheduling password hash upgrade for user_id: {user.id}")
+            background_tasks.add_task(rehash_user_password, user.id, login_data.password, user.hashed_password)
+        
         logger.debug(f"Router: Creating tokens for user_id: {user.id}, email: {masked_email}")
         access_token = create_access_token(user.id)
         refresh_token = await create_refresh_token(db, user.id)
@@ -221,7 +237,9 @@ async def login(
 
 
 @router.post("/logout", response_model=MessageResponse)
+@admission(AUTH_ADMISSION)
 async def logout(
+    request: Request,
     response: Response,
     db: AsyncSession = Depends(get_db),
     refresh_token: Optional[str] = Cookie(None, alias=REFRESH_TOKEN_COOKIE)
@@ -237,6 +255,19 @@ async def logout(
         else:
             logger.debug(f"Router: No refresh token provided for logout")
         
+        principal = getattr(request.state, "principal", None)
+        if principal is not None:
+            if principal.token_id:
+                logger.debug(f"Router: Revoking access token - user_id: {principal.user_id}")
+                await access_token_denylist.revoke(db, principal.token_id, principal.expires_at)
+            # Local state only changes once the revocation is committed, so a failed
+            # commit cannot leave this worker disagreeing with the others
+            await db.commit()
+            if principal.token_id:
+                access_token_denylist.add(principal.token_id, principal.expires_at)
+            logger.debug(f"Router: Dropping cached user - user_id: {principal.user_id}")
+            user_cache.invalidate(principal.user_id)
+        
         logger.debug(f"Router: Clearing refresh token cookie")
         clear_refresh_cookie(response)
         
@@ -257,6 +288,7 @@ async def logout(
 
 
 @router.post("/refresh", response_model=TokenResponse)
+@admission(AUTH_ADMISSION)
 async def refresh(
     response: Response,
     db: AsyncSession = Depends(get_db),
@@ -264,7 +296,7 @@ async def refresh(
 ):
     try:
         masked_token = f"{refresh_token[:4]}...{refresh_token[-4:]}" if refresh_token and len(refresh_token) > 8 else "none"
-        logger.info(f"Router: Token refresh attempt - refresh_token: {refresh_token}")
+        logger.info(f"Router: Token refresh attempt - refresh_token: {masked_token}")
         
         if not refresh_token:
             logger.warning(f"Router: Token refresh failed - refresh token not found")
@@ -273,9 +305,9 @@ async def refresh(
                 detail="Refresh token not found"
             )
         
-        logger.debug(f"Router: Validating refresh token - token: {masked_token}")
-        user = await validate_refresh_token(db, refresh_token)
-        if not user:
+        logger.debug(f"Router: Rotating refresh token - token: {masked_token}")
+        rotated = await rotate_refresh_token(db, refresh_token)
+        if not rotated:
             logger.warning(f"Router: Token refresh failed - invalid or expired token: {masked_token}")
             clear_refresh_cookie(response)
             raise HTTPException(
@@ -283,20 +315,16 @@ async def refresh(
                 detail="Invalid or expired refresh token"
             )
         
-        logger.debug(f"Router: Revoking old refresh token - token: {masked_token}, user_id: {user.id}")
-        await revoke_refresh_token(db, refresh_token)
-        
-        logger.debug(f"Router: Creating new tokens for user_id: {user.id}")
-        access_token = create_access_token(user.id)
-        new_refresh_token = await create_refresh_token(db, user.id)
+        logger.debug(f"Router: Creating new access token for user_id: {rotated.user_id}")
+        access_token = create_access_token(rotated.user_id)
         
-        logger.debug(f"Router: Setting new refresh token cookie for user_id: {user.id}")
-        set_refresh_cookie(response, new_refresh_token)
+        logger.debug(f"Router: Setting new refresh token cookie for user_id: {rotated.user_id}")
+        set_refresh_cookie(response, rotated.token)
         
-        logger.debug(f"Router: Setting new access token cookie for user_id: {user.id}")
+        logger.debug(f"Router: Setting new access token cookie for user_id: {rotated.user_id}")
         set_access_cookie(response, access_token)
         
-        logger.info(f"Router: Token refresh successful - user_id: {user.id}, email: {mask_email(user.email)}")
+        logger.info(f"Router: Token refresh successful - user_id: {rotated.user_id}, email: {mask_email(rotated.email)}")
         return {"access_token": access_token, "token_type": "bearer"}
     except HTTPException as e:
         logger.warning(f"Router: Token refresh failed with HTTP exception - token: {mask_token(refresh_token) if refresh_token else 'none'}, status: {e.status_code}")
@@ -317,27 +345,33 @@ async def refresh(
 
 
 @router.post("/forgot-password", response_model=MessageResponse)
+@admission(AUTH_ADMISSION)
 @limiter.limit(AUTH_RATE_LIMIT)
 @limiter.limit(AUTH_RATE_LIMIT_PER_HOUR)
-async def forgot_password(request: Request, data: ForgotPasswordRequest, db: AsyncSession = Depends(get_db)):
+async def forgot_password(
+    request: Request,
+    data: ForgotPasswordRequest,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db)
+):
     try:
         masked_email = mask_email(data.email)
         logger.info(f"Router: Forgot password request - email: {masked_email}")
         
-        user = await get_user_by_email(db, data.email)
-        if not user:
+        logger.debug(f"Router: Creating password reset token - email: {masked_email}")
+        reset = await create_password_reset_token(db, data.email)
+        if not reset:
             logger.warning(f"Router: User not found for password reset - email: {masked_email}")
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Email does not exist in our system"
             )
+        user, token = reset
         
-        logger.debug(f"Router: User found, creating password reset token - email: {masked_email}, user_id: {user.id}")
-        token = await create_password_reset_token(db, user)
-        
-        logger.debug(f"Router: Sending password reset email - email: {masked_email}")
-        await send_password_reset_email(user.email, token)
-        logger.info(f"Router: Password reset email sent successfully - email: {masked_email}, user_id: {user.id}")
+        logger.debug(f"Router: Queueing password reset email - email: {masked_email}")
+        await enqueue_password_reset_email(db, user.email, token)
+        background_tasks.add_task(email_outbox_worker.wake)
+        logger.info(f"Router: Password reset email queued successfully - email: {masked_email}, user_id: {user.id}")
         
         return {"message": "Password reset link has been sent to your email."}
     except HTTPException:
@@ -357,6 +391,7 @@ async def forgot_password(request: Request, data: ForgotPasswordRequest, db: Asy
 
 
 @router.post("/reset-password/{token}", response_model=MessageResponse)
+@admission(AUTH_ADMISSION)
 @limiter.limit(AUTH_RATE_LIMIT)
 @limiter.limit(AUTH_RATE_LIMIT_PER_HOUR)
 async def reset_password(
@@ -397,7 +432,8 @@ async def reset_password(
 
 
 @router.get("/me", response_model=UserResponse)
-async def get_me(current_user: User = Depends(get_current_user)):
+@admission(AUTH_ADMISSION)
+async def get_me(current_user: UserSnapshot = Depends(get_current_user)):
     try:
         logger.info(f"Router: Getting current user info - user_id: {current_user.id}, email: {mask_email(current_user.email)}")
         return current_user
@@ -3,7 +3,7 @@ from app.schemas.blog import CreateBlogRequest, CreateBlogResponse, GetAllBlogsR
 from fastapi import APIRouter, Depends, HTTPException, status, Request, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.dependencies import get_current_user_id
-from app.database import get_db
+from app.database import get_db, get_read_db, no_primary_pin
 from app.models.user import User
 from app.utils.logger import logger
 from pydantic import ValidationError
@@ -15,6 +15,10 @@ from app.middleware.rate_limiter import (
     BLOG_LIST_RATE_LIMIT,
     BLOG_LIST_RATE_LIMIT_PER_MINUTE
 )
+from app.middleware.cost_limiter import route_cost, BLOG_COST, BLOG_LIST_COST, MY_BLOGS_COST, ANALYTICS_COST
+from app.middleware.scraper_detector import track_breadth
+from app.middleware.admission import admission, LIST_SCAN_ADMISSION, ANALYTICS_ADMISSION
+from app.middleware.deadline import deadline, LIST_SCAN_DEADLINE, ANALYTICS_DEADLINE
 
 router = APIRouter()
 
@@ -72,12 +76,14 @@ async def update_blog_endpoint(
         )
 
 @router.post("/get_blog/{blog_id}", response_model=CreateBlogResponse)
+@route_cost(BLOG_COST)
+@track_breadth("blog_id")
 @limiter.limit(BLOG_RATE_LIMIT)
 @limiter.limit(BLOG_RATE_LIMIT_PER_MINUTE)
 async def get_blog_by_id(
     request: Request,
     blog_id: int,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     try:
         logger.info(f"Getting blog by id - blog_id: {blog_id}")
@@ -101,12 +107,14 @@ async def get_blog_by_id(
         )
 
 @router.post("/get_blog_by_slug/{slug}", response_model=CreateBlogResponse)
+@route_cost(BLOG_COST)
+@track_breadth("slug")
 @limiter.limit(BLOG_RATE_LIMIT)
 @limiter.limit(BLOG_RATE_LIMIT_PER_MINUTE)
 async def get_blog_by_slug(
     request: Request,
     slug: str,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     try:
         logger.info(f"Getting blog by slug - slug: '{slug}'")
@@ -124,11 +132,14 @@ async def get_blog_by_slug(
         )
 
 @router.post("/get_all_blogs", response_model=GetAllBlogsResponse)
+@route_cost(BLOG_LIST_COST)
+@admission(LIST_SCAN_ADMISSION)
+@deadline(LIST_SCAN_DEADLINE)
 @limiter.limit(BLOG_LIST_RATE_LIMIT)
 @limiter.limit(BLOG_LIST_RATE_LIMIT_PER_MINUTE)
 async def get_all_blogs_endpoint(
     request: Request,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user_id: int = Depends(get_current_user_id)
 ):
     try:
@@ -283,8 +294,11 @@ async def create_sample_blogs_endpoint(
         )
 
 @router.get("/my-blogs", response_model=MyBlogsResponse)
+@route_cost(MY_BLOGS_COST)
+@admission(LIST_SCAN_ADMISSION)
+@deadline(LIST_SCAN_DEADLINE)
 async def get_my_blogs(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     status: Optional[str] = Query(None, description="Filter by status: published or draft"),
     current_user_id: int = Depends(get_current_user_id)
 ):
@@ -304,6 +318,7 @@ async def get_my_blogs(
         )
 
 @router.post("/increment-views/{blog_id}")
+@no_primary_pin
 async def increment_views(
     blog_id: int,
     db: AsyncSession = Depends(get_db)
@@ -326,8 +341,11 @@ async def increment_views(
         )
 
 @router.get("/analytics", response_model=BlogAnalytics)
+@route_cost(ANALYTICS_COST)
+@admission(ANALYTICS_ADMISSION)
+@deadline(ANALYTICS_DEADLINE)
 async def get_analytics(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user_id: int = Depends(get_current_user_id)
 ):
     """Get comprehensive analytics for current user's blogs."""
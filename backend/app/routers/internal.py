@@ -0,0 +1,27 @@
+from fastapi import APIRouter, HTTPException, status, Header
+from typing import Optional
+import hmac
+from app.config import get_settings
+from app.middleware.admission import admission, HEALTH_ADMISSION
+from app.utils.logger import logger
+from app.utils.metrics import metrics
+
+router = APIRouter()
+settings = get_settings()
+
+
+def verify_metrics_token(token: Optional[str]) -> None:
+    # Without a configured token the endpoint does not exist as far as clients can tell
+    if not settings.METRICS_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not token or not hmac.compare_digest(token, settings.METRICS_TOKEN):
+        logger.warning(f"Router: Metrics access denied - invalid or missing token")
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+
+
+@router.get("/metrics")
+@admission(HEALTH_ADMISSION)
+async def get_metrics(x_metrics_token: Optional[str] = Header(None)):
+    """Per-process operational metrics (latency histograms, queue depths, cache hit rates)."""
+    verify_metrics_token(x_metrics_token)
+    return metrics.snapshot()
@@ -1,33 +1,69 @@
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+import hashlib
+from typing import NamedTuple, Optional, Tuple
 import uuid
 from jose import jwt, JWTError
-from passlib.context import CryptContext
 from fastapi import HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, and_
+from sqlalchemy.engine import Row
+from sqlalchemy import select, insert, update, and_, func, text
 from app.config import get_settings
 from app.models.user import User, RefreshToken
+from app.services.email import verification_email
+from app.services.password_pool import password_hash_pool
+from app.services.hasher import get_hasher
+from app.services.user_cache import user_cache
+from app.database import async_session
 from app.utils.logger import logger
 from app.utils.mask import mask_email, mask_token
 
 settings = get_settings()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+async def hash_password(password: str) -> str:
+    return await password_hash_pool.run(get_hasher().hash, password)
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await password_hash_pool.run(get_hasher().verify, plain_password, hashed_password)
+
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    return get_hasher().needs_rehash(hashed_password)
+
+
+async def rehash_user_password(user_id: int, plain_password: str, old_hashed_password: str) -> None:
+    """Upgrade a user's hash to the current cost. Runs as a background task after login responds."""
+    try:
+        logger.debug(f"Service: Rehashing password with current cost - user_id: {user_id}")
+        new_hashed_password = await hash_password(plain_password)
+        async with async_session() as session:
+            # Only replace the hash we verified against, so a concurrent password reset wins
+            result = await session.execute(
+                update(User)
+                .where(
+                    and_(
+                        User.id == user_id,
+                        User.hashed_password == old_hashed_password
+                    )
+                )
+                .values(hashed_password=new_hashed_password)
+            )
+            await session.commit()
+        if result.rowcount:
+            logger.info(f"Service: Password hash upgraded - user_id: {user_id}")
+        else:
+            logger.debug(f"Service: Password hash changed concurrently, skipping upgrade - user_id: {user_id}")
+    except Exception as e:
+        logger.error(f"Service: Error upgrading password hash - user_id: {user_id}, error: {str(e)}", exc_info=True)
 
 
 def create_access_token(user_id: int) -> str:
     try:
         logger.debug(f"Service: Creating access token for user_id: {user_id}")
         expire = datetime.now(timezone.utc) + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-        payload = {"sub": str(user_id), "exp": expire, "type": "access"}
+        # jti lets a single access token be revoked before it expires (see token_denylist)
+        payload = {"sub": str(user_id), "exp": expire, "type": "access", "jti": uuid.uuid4().hex}
         token = jwt.encode(payload, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
         logger.debug(f"Service: Access token created successfully for user_id: {user_id}")
         return token
@@ -51,7 +87,8 @@ def create_access_token(user_id: int) -> str:
         )
 
 
-def decode_access_token(token: str) -> Optional[int]:
+def decode_access_token_claims(token: str) -> Optional[dict]:
+    """Verify an access token and return its claims, or None if it is invalid, expired or not an access token."""
     try:
         masked_token = mask_token(token)
         logger.debug(f"Service: Decoding access token - token: {masked_token}")
@@ -59,13 +96,11 @@ def decode_access_token(token: str) -> Optional[int]:
         if payload.get("type") != "access":
             logger.warning(f"Service: Invalid token type - token: {masked_token}")
             return None
-        user_id = payload.get("sub")
-        result = int(user_id) if user_id else None
-        if result:
-            logger.debug(f"Service: Access token decoded successfully - user_id: {result}, token: {masked_token}")
-        else:
+        if not payload.get("sub"):
             logger.warning(f"Service: No user_id in token payload - token: {masked_token}")
-        return result
+            return None
+        logger.debug(f"Service: Access token decoded successfully - user_id: {payload.get('sub')}, token: {masked_token}")
+        return payload
     except JWTError as e:
         logger.warning(f"Service: JWT error decoding access token - token: {mask_token(token)}, error: {str(e)}")
         return None
@@ -78,6 +113,15 @@ def generate_token() -> str:
     return str(uuid.uuid4())
 
 
+def hash_token(token: str) -> bytes:
+    """Digest stored in place of a refresh/verification/reset token.
+
+    Tokens are random, so a fast unsalted hash is enough; a database leak no
+    longer hands out usable tokens and lookups hit a 32-byte bytea index.
+    """
+    return hashlib.sha256(token.encode()).digest()
+
+
 async def create_refresh_token(db: AsyncSession, user_id: int) -> str:
     try:
         logger.info(f"Service: Creating refresh token for user_id: {user_id}")
@@ -87,15 +131,15 @@ async def create_refresh_token(db: AsyncSession, user_id: int) -> str:
         expires_at = datetime.now(timezone.utc) + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
         
         logger.debug(f"Service: Inserting refresh token to database for user_id: {user_id}")
-        refresh_token = RefreshToken(
-            token=token,
-            user_id=user_id,
-            expires_at=expires_at,
-            revoked=False
+        # Plain INSERT: nothing is read back, so no flush/refresh round trips
+        await db.execute(
+            insert(RefreshToken).values(
+                token_hash=hash_token(token),
+                user_id=user_id,
+                expires_at=expires_at,
+                revoked=False
+            )
         )
-        db.add(refresh_token)
-        await db.flush()  # Use flush() instead of commit() - let get_db() handle the commit
-        await db.refresh(refresh_token)
         
         logger.info(f"Service: Refresh token created successfully for user_id: {user_id}, token: {mask_token(token)}")
         return token
@@ -114,46 +158,81 @@ async def create_refresh_token(db: AsyncSession, user_id: int) -> str:
         )
 
 
-async def validate_refresh_token(db: AsyncSession, token: str) -> Optional[User]:
+class RotatedRefreshToken(NamedTuple):
+    user_id: int
+    email: str
+    token: str
+
+
+# One round trip for the whole rotation. Data-modifying CTEs all see the same snapshot:
+#   rotated - revokes the presented token if it is active
+#   issued  - inserts its replacement for the same user
+#   reused  - only when nothing was rotated and the presented token was already rotated:
+#             someone replayed an old token, so every active token of that user is revoked.
+#             Tokens revoked for any other reason (logout, password reset) just fail: a
+#             stale tab presenting one must not end the user's fresh sessions
+ROTATE_REFRESH_TOKEN_SQL = text("""
+    WITH rotated AS (
+        UPDATE refresh_tokens SET revoked = true, revoked_at = now(), revoked_reason = 'rotated'
+        WHERE token_hash = :token_hash AND revoked = false AND expires_at > now()
+        RETURNING user_id
+    ),
+    issued AS (
+        INSERT INTO refresh_tokens (token_hash, user_id, expires_at, revoked)
+        SELECT :new_token_hash, user_id, :expires_at, false FROM rotated
+        RETURNING user_id
+    ),
+    reused AS (
+        UPDATE refresh_tokens SET revoked = true, revoked_at = now(), revoked_reason = 'reuse'
+        WHERE revoked = false
+          AND NOT EXISTS (SELECT 1 FROM rotated)
+          AND user_id = (SELECT user_id FROM refresh_tokens WHERE token_hash = :token_hash AND revoked_reason = 'rotated')
+        RETURNING user_id
+    )
+    SELECT users.id AS user_id, users.email AS email, false AS reused
+    FROM users JOIN issued ON users.id = issued.user_id
+    UNION ALL
+    SELECT DISTINCT reused.user_id, NULL::varchar, true FROM reused
+""")
+
+
+async def rotate_refresh_token(db: AsyncSession, token: str) -> Optional[RotatedRefreshToken]:
+    """Atomically revoke an active refresh token and issue its replacement.
+
+    Returns None when the token is unknown, expired or already revoked. Presenting an
+    already-rotated token also revokes all of that user's active refresh tokens; one
+    revoked by logout or a password reset does not.
+    """
     try:
         masked_token = mask_token(token)
-        logger.info(f"Service: Validating refresh token - token: {masked_token}")
+        logger.info(f"Service: Rotating refresh token - token: {masked_token}")
         
-        logger.debug(f"Service: Querying refresh token - token: {masked_token}")
-        now = datetime.now(timezone.utc)
+        new_token = generate_token()
+        expires_at = datetime.now(timezone.utc) + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
         result = await db.execute(
-            select(RefreshToken)
-            .where(
-                and_(
-                RefreshToken.token == token,
-                RefreshToken.revoked == False,
-                    RefreshToken.expires_at > now
-                )
-            )
+            ROTATE_REFRESH_TOKEN_SQL,
+            {"token_hash": hash_token(token), "new_token_hash": hash_token(new_token), "expires_at": expires_at}
         )
-        refresh_token = result.scalar_one_or_none()
+        row = result.first()
         
-        if not refresh_token:
+        if row is None:
             logger.warning(f"Service: Refresh token not found or invalid - token: {masked_token}")
             return None
         
-        user_id = refresh_token.user_id
-        
-        logger.debug(f"Service: Refresh token found, fetching user - token: {masked_token}, user_id: {user_id}")
-        user_result = await db.execute(select(User).where(User.id == user_id))
-        user = user_result.scalar_one_or_none()
-        
-        if not user:
-            logger.warning(f"Service: User not found for refresh token - token: {masked_token}, user_id: {user_id}")
+        if row.reused:
+            logger.warning(f"Service: Refresh token reuse detected, revoked all tokens - token: {masked_token}, user_id: {row.user_id}")
+            # The caller answers 401, which would roll the revocation back in get_db()
+            await db.commit()
             return None
         
-            logger.info(f"Service: Refresh token validated successfully - token: {masked_token}, user_id: {user.id}")
-        return user
+        logger.info(f"Service: Refresh token rotated successfully - token: {masked_token}, new_token: {mask_token(new_token)}, user_id: {row.user_id}")
+        return RotatedRefreshToken(user_id=row.user_id, email=row.email, token=new_token)
     except Exception as e:
-        logger.error(f"Service: Database error validating refresh token - token: {mask_token(token)}, error: {str(e)}", exc_info=True)
+        await db.rollback()
+        logger.error(f"Service: Database error rotating refresh token - token: {mask_token(token)}, error: {str(e)}", exc_info=True)
         raise HTTPException(
             status_code=500,
-            detail="Database error occurred while validating refresh token"
+            detail="Database error occurred while rotating refresh token"
         )
 
 
@@ -162,23 +241,22 @@ async def revoke_refresh_token(db: AsyncSession, token: str) -> bool:
         masked_token = mask_token(token)
         logger.info(f"Service: Revoking refresh token - token: {masked_token}")
         
-        logger.debug(f"Service: Querying refresh token - token: {masked_token}")
-        result = await db.execute(select(RefreshToken).where(RefreshToken.token == token))
-        refresh_token = result.scalar_one_or_none()
-        
-        if not refresh_token:
-            logger.warning(f"Service: Refresh token not found for revocation - token: {masked_token}")
-            return False
-        
-        user_id = refresh_token.user_id
-        
-        logger.debug(f"Service: Refresh token found, revoking - token: {masked_token}, user_id: {user_id}")
-        await db.execute(
+        result = await db.execute(
             update(RefreshToken)
-            .where(RefreshToken.token == token)
-            .values(revoked=True)
+            .where(
+                and_(
+                    RefreshToken.token_hash == hash_token(token),
+                    RefreshToken.revoked == False
+                )
+            )
+            .values(revoked=True, revoked_at=func.now(), revoked_reason="logout")
+            .returning(RefreshToken.user_id)
         )
-        await db.flush()  # Use flush() instead of commit() - let get_db() handle the commit
+        user_id = result.scalar_one_or_none()
+        
+        if user_id is None:
+            logger.warning(f"Service: Refresh token not found or already revoked - token: {masked_token}")
+            return False
         
         logger.info(f"Service: Refresh token revoked successfully - token: {masked_token}, user_id: {user_id}")
         return True
@@ -191,37 +269,24 @@ async def revoke_refresh_token(db: AsyncSession, token: str) -> bool:
         )
 
 
-async def revoke_all_user_tokens(db: AsyncSession, user_id: int) -> None:
+async def revoke_all_user_tokens(db: AsyncSession, user_id: int) -> int:
     try:
         logger.info(f"Service: Revoking all tokens for user - user_id: {user_id}")
         
-        logger.debug(f"Service: Querying all active tokens for user_id: {user_id}")
+        # Single UPDATE, committed by get_db() together with the rest of the request
         result = await db.execute(
-            select(RefreshToken)
+            update(RefreshToken)
             .where(
                 and_(
                     RefreshToken.user_id == user_id,
                     RefreshToken.revoked == False
                 )
             )
+            .values(revoked=True, revoked_at=func.now(), revoked_reason="revoke_all")
         )
-        tokens = result.scalars().all()
-        logger.debug(f"Service: Found {len(tokens)} active tokens for user_id: {user_id}")
         
-        if tokens:
-            await db.execute(
-                update(RefreshToken)
-                .where(
-                    and_(
-                        RefreshToken.user_id == user_id,
-                        RefreshToken.revoked == False
-                    )
-                )
-                .values(revoked=True)
-            )
-            await db.commit()
-        
-        logger.info(f"Service: Revoked {len(tokens)} tokens for user_id: {user_id}")
+        logger.info(f"Service: Revoked {result.rowcount} tokens for user_id: {user_id}")
+        return result.rowcount
     except Exception as e:
         await db.rollback()
         logger.error(f"Service: Database error revoking all user tokens - user_id: {user_id}, error: {str(e)}", exc_info=True)
@@ -282,47 +347,69 @@ async def get_user_by_id(db: AsyncSession, user_id: int) -> Optional[User]:
         )
 
 
-async def create_user(db: AsyncSession, email: str, password: str) -> User:
+# The new user and its verification email in one statement; the outbox row is only
+# written if the INSERT did not run into an existing email (ON CONFLICT covers the race
+# between the existence check and the insert)
+CREATE_USER_SQL = text("""
+    WITH created AS (
+        INSERT INTO users (email, hashed_password, is_verified, verification_token_hash, verification_token_expires)
+        VALUES (:email, :hashed_password, false, :token_hash, :token_expires)
+        ON CONFLICT (email) DO NOTHING
+        RETURNING id, email
+    ),
+    queued AS (
+        INSERT INTO email_outbox (recipient, subject, body, status, attempts)
+        SELECT email, :subject, :body, 'pending', 0 FROM created
+    )
+    SELECT id, email FROM created
+""")
+
+
+async def create_user(db: AsyncSession, email: str, password: str) -> Optional[Row]:
+    """Insert a new unverified user and queue their verification email.
+
+    Returns the user's (id, email) row, or None if the email is already registered.
+    """
     try:
         masked_email = mask_email(email)
         logger.info(f"Service: Creating user - email: {masked_email}")
         
+        # Checked before hashing, so registering a taken email does not cost a slot on the hash pool
+        existing = await db.execute(select(User.id).where(User.email == email))
+        if existing.first() is not None:
+            logger.warning(f"Service: User already exists - email: {masked_email}")
+            return None
+        
         logger.debug(f"Service: Generating verification token for email: {masked_email}")
         verification_token = generate_token()
         verification_expires = datetime.now(timezone.utc) + timedelta(hours=24)
+        subject, body = verification_email(verification_token)
         
         logger.debug(f"Service: Hashing password for email: {masked_email}")
-        hashed_pwd = hash_password(password)
+        hashed_pwd = await hash_password(password)
         
         logger.debug(f"Service: Inserting user to database for email: {masked_email}")
-        user = User(
-            email=email,
-            hashed_password=hashed_pwd,
-            is_verified=False,
-            verification_token=verification_token,
-            verification_token_expires=verification_expires,
-            reset_token=None,
-            reset_token_expires=None
+        result = await db.execute(
+            CREATE_USER_SQL,
+            {
+                "email": email,
+                "hashed_password": hashed_pwd,
+                "token_hash": hash_token(verification_token),
+                "token_expires": verification_expires,
+                "subject": subject,
+                "body": body,
+            }
         )
-        db.add(user)
-        await db.flush()  # Use flush() instead of commit() - let get_db() handle the commit
-        await db.refresh(user)
+        user = result.first()
         
-        logger.info(f"Service: User created successfully - user_id: {user.id}, email: {masked_email}")
+        if user is None:
+            logger.warning(f"Service: User already exists - email: {masked_email}")
+            return None
+        
+        logger.info(f"Service: User created successfully, verification email queued - user_id: {user.id}, email: {masked_email}, token: {mask_token(verification_token)}")
         return user
-    except Exception as e:
-        await db.rollback()
-        logger.error(f"Service: Database error creating user - email: {mask_email(email)}, error: {str(e)}", exc_info=True)
-        error_str = str(e).lower()
-        if "duplicate" in error_str or "unique" in error_str or "already exists" in error_str:
-            raise HTTPException(
-                status_code=409,
-                detail="User with this email already exists"
-            )
-        raise HTTPException(
-            status_code=500,
-            detail="Database error occurred while creating user"
-        )
+    except HTTPException:
+        raise
     except ValueError as e:
         await db.rollback()
         logger.error(f"Service: Invalid input creating user - email: {mask_email(email)}, error: {str(e)}")
@@ -330,6 +417,13 @@ async def create_user(db: AsyncSession, email: str, password: str) -> User:
             status_code=400,
             detail=f"Invalid input: {str(e)}"
         )
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Service: Database error creating user - email: {mask_email(email)}, error: {str(e)}", exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail="Database error occurred while creating user"
+        )
 
 
 async def verify_user_email(db: AsyncSession, token: str) -> Optional[User]:
@@ -337,16 +431,22 @@ async def verify_user_email(db: AsyncSession, token: str) -> Optional[User]:
         masked_token = mask_token(token)
         logger.info(f"Service: Verifying user email - token: {masked_token}")
         
-        logger.debug(f"Service: Querying user by verification token - token: {masked_token}")
         now = datetime.now(timezone.utc)
         result = await db.execute(
-            select(User)
+            update(User)
             .where(
                 and_(
-                User.verification_token == token,
+                    User.verification_token_hash == hash_token(token),
                     User.verification_token_expires > now
                 )
             )
+            .values(
+                is_verified=True,
+                verification_token_hash=None,
+                verification_token_expires=None
+            )
+            .returning(User)
+            .execution_options(synchronize_session=False)
         )
         user = result.scalar_one_or_none()
         
@@ -354,12 +454,9 @@ async def verify_user_email(db: AsyncSession, token: str) -> Optional[User]:
             logger.warning(f"Service: Invalid or expired verification token - token: {masked_token}")
             return None
         
-        logger.debug(f"Service: User found, verifying email - token: {masked_token}, user_id: {user.id}, email: {mask_email(user.email)}")
-        user.is_verified = True
-        user.verification_token = None
-        user.verification_token_expires = None
-        await db.flush()  # Use flush() instead of commit() - let get_db() handle the commit
-        await db.refresh(user)
+        # Committed before the cached snapshot is dropped, so a concurrent request cannot cache the old row again
+        await db.commit()
+        user_cache.invalidate(user.id)
         
         logger.info(f"Service: Email verified successfully - user_id: {user.id}, email: {mask_email(user.email)}")
         return user
@@ -378,72 +475,89 @@ async def verify_user_email(db: AsyncSession, token: str) -> Optional[User]:
         )
 
 
-async def create_password_reset_token(db: AsyncSession, user: User) -> str:
+async def create_password_reset_token(db: AsyncSession, email: str) -> Optional[Tuple[User, str]]:
+    """Store a fresh reset token on the user with this email. Returns None if there is no such user."""
     try:
-        masked_email = mask_email(user.email)
-        logger.info(f"Service: Creating password reset token - user_id: {user.id}, email: {masked_email}")
+        masked_email = mask_email(email)
+        logger.info(f"Service: Creating password reset token - email: {masked_email}")
         
-        logger.debug(f"Service: Generating password reset token for user_id: {user.id}")
         token = generate_token()
         expires_at = datetime.now(timezone.utc) + timedelta(hours=1)
         
-        logger.debug(f"Service: Updating user with reset token - user_id: {user.id}, email: {masked_email}")
-        user.reset_token = token
-        user.reset_token_expires = expires_at
-        await db.flush()  # Use flush() instead of commit() - let get_db() handle the commit
-        await db.refresh(user)
+        result = await db.execute(
+            update(User)
+            .where(User.email == email)
+            .values(reset_token_hash=hash_token(token), reset_token_expires=expires_at)
+            .returning(User)
+            .execution_options(synchronize_session=False)
+        )
+        user = result.scalar_one_or_none()
+        
+        if user is None:
+            logger.debug(f"Service: User not found for password reset token - email: {masked_email}")
+            return None
         
         logger.info(f"Service: Password reset token created successfully - user_id: {user.id}, email: {masked_email}, token: {mask_token(token)}")
-        return token
+        return user, token
     except Exception as e:
         await db.rollback()
-        logger.error(f"Service: Database error creating password reset token - user_id: {user.id}, email: {mask_email(user.email)}, error: {str(e)}", exc_info=True)
+        logger.error(f"Service: Database error creating password reset token - email: {mask_email(email)}, error: {str(e)}", exc_info=True)
         raise HTTPException(
             status_code=500,
             detail="Database error occurred while creating password reset token"
         )
 
 
-async def reset_user_password(db: AsyncSession, token: str, new_password: str) -> Optional[User]:
+# Consumes the reset token, stores the new hash and revokes every refresh token of the
+# user in one statement; the revoking CTE runs even though its result is not selected.
+RESET_PASSWORD_SQL = text("""
+    WITH reset AS (
+        UPDATE users
+        SET hashed_password = :hashed_password,
+            reset_token_hash = NULL,
+            reset_token_expires = NULL,
+            updated_at = now()
+        WHERE reset_token_hash = :token_hash AND reset_token_expires > now()
+        RETURNING id, email
+    ),
+    revoked AS (
+        UPDATE refresh_tokens SET revoked = true, revoked_at = now(), revoked_reason = 'password_reset'
+        WHERE revoked = false AND user_id IN (SELECT id FROM reset)
+    )
+    SELECT id, email FROM reset
+""")
+
+
+async def reset_user_password(db: AsyncSession, token: str, new_password: str) -> Optional[Row]:
+    """Reset the password for a valid reset token. Returns the user's (id, email) row, or None."""
     try:
         masked_token = mask_token(token)
         logger.info(f"Service: Resetting user password - token: {masked_token}")
         
-        logger.debug(f"Service: Querying user by reset token - token: {masked_token}")
-        now = datetime.now(timezone.utc)
-        result = await db.execute(
-            select(User)
-            .where(
-                and_(
-                User.reset_token == token,
-                    User.reset_token_expires > now
-                )
-            )
+        # Checked before hashing, so a bogus token does not cost a slot on the hash pool
+        token_hash = hash_token(token)
+        pending = await db.execute(
+            select(User.id).where(and_(User.reset_token_hash == token_hash, User.reset_token_expires > func.now()))
         )
-        user = result.scalar_one_or_none()
+        if pending.first() is None:
+            logger.warning(f"Service: Invalid or expired reset token - token: {masked_token}")
+            return None
+        
+        logger.debug(f"Service: Hashing new password - token: {masked_token}")
+        hashed_pwd = await hash_password(new_password)
+        
+        result = await db.execute(RESET_PASSWORD_SQL, {"token_hash": token_hash, "hashed_password": hashed_pwd})
+        user = result.first()
         
         if not user:
             logger.warning(f"Service: Invalid or expired reset token - token: {masked_token}")
             return None
         
-        masked_email = mask_email(user.email)
-    
-        logger.debug(f"Service: User found, resetting password - token: {masked_token}, user_id: {user.id}, email: {masked_email}")
-        
-        logger.debug(f"Service: Hashing new password for user_id: {user.id}")
-        hashed_pwd = hash_password(new_password)
-            
-        logger.debug(f"Service: Revoking all user tokens for user_id: {user.id}")
-        await revoke_all_user_tokens(db, user.id)
-        
-        logger.debug(f"Service: Updating user password - user_id: {user.id}")
-        user.hashed_password = hashed_pwd
-        user.reset_token = None
-        user.reset_token_expires = None
-        await db.flush()  # Use flush() instead of commit() - let get_db() handle the commit
-        await db.refresh(user)
+        # Committed before the cached snapshot is dropped, so a concurrent request cannot cache the old row again
+        await db.commit()
+        user_cache.invalidate(user.id)
             
-        logger.info(f"Service: Password reset successfully - user_id: {user.id}, email: {masked_email}")
+        logger.info(f"Service: Password reset successfully - user_id: {user.id}, email: {mask_email(user.email)}")
         return user
     except ValueError as e:
         logger.error(f"Service: Invalid token format or password - token: {mask_token(token)}, error: {str(e)}")
@@ -451,6 +565,8 @@ async def reset_user_password(db: AsyncSession, token: str, new_password: str) -
             status_code=400,
             detail=f"Invalid input: {str(e)}"
         )
+    except HTTPException:
+        raise
     except Exception as e:
         await db.rollback()
         logger.error(f"Service: Database error resetting user password - token: {mask_token(token)}, error: {str(e)}", exc_info=True)
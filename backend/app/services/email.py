@@ -1,6 +1,9 @@
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi import HTTPException
+from email.message import EmailMessage
+from typing import List, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.config import get_settings
+from app.models.email_outbox import EmailOutbox
+from app.services.smtp_pool import SMTPConnectionPool
 from app.utils.logger import logger
 from app.utils.mask import mask_email, mask_token
 
@@ -8,31 +11,44 @@ settings = get_settings()
 
 # Port 465 requires SSL/TLS from the start (implicit TLS)
 # Port 587 uses STARTTLS (explicit TLS)
-mail_config = ConnectionConfig(
-    MAIL_USERNAME=settings.MAIL_USERNAME,
-    MAIL_PASSWORD=settings.MAIL_PASSWORD,
-    MAIL_FROM=settings.MAIL_FROM,
-    MAIL_PORT=settings.MAIL_PORT,
-    MAIL_SERVER=settings.MAIL_SERVER,
-    MAIL_STARTTLS=settings.MAIL_PORT != 465,  # False for port 465, True for port 587
-    MAIL_SSL_TLS=settings.MAIL_PORT == 465,   # True for port 465, False for port 587
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True
+smtp_pool = SMTPConnectionPool(
+    hostname=settings.MAIL_SERVER,
+    port=settings.MAIL_PORT,
+    username=settings.MAIL_USERNAME,
+    password=settings.MAIL_PASSWORD,
+    use_tls=settings.MAIL_PORT == 465,    # True for port 465, False for port 587
+    start_tls=settings.MAIL_PORT != 465,  # False for port 465, True for port 587
+    validate_certs=True,
+    max_size=settings.SMTP_POOL_SIZE,
+    max_messages_per_connection=settings.SMTP_MAX_MESSAGES_PER_CONNECTION,
+    idle_timeout=settings.SMTP_IDLE_TIMEOUT_SECONDS,
+    timeout=settings.SMTP_TIMEOUT_SECONDS,
 )
 
-fast_mail = FastMail(mail_config)
 
+async def enqueue_email(db: AsyncSession, recipient: str, subject: str, body: str) -> EmailOutbox:
+    """Queue an email in the outbox as part of the caller's transaction.
 
-async def send_verification_email(email: str, token: str) -> None:
-    try:
-        masked_email = mask_email(email)
-        masked_token = mask_token(token)
-        logger.info(f"Email Service: Sending verification email - email: {masked_email}, token: {masked_token}")
-        
-        verification_url = f"{settings.FRONTEND_URL}/verify-email?token={token}"
-        logger.debug(f"Email Service: Creating verification email message - email: {masked_email}")
-        
-        html = f"""
+    The row is committed together with whatever the request wrote (e.g. the new
+    user), and the background worker in app.services.email_worker delivers it.
+    """
+    masked_email = mask_email(recipient)
+    logger.debug(f"Email Service: Queueing email - email: {masked_email}, subject: '{subject}'")
+    message = EmailOutbox(
+        recipient=recipient,
+        subject=subject,
+        body=body,
+        status="pending",
+        attempts=0
+    )
+    db.add(message)  # No flush - the INSERT goes out with the request's commit
+    return message
+
+
+def verification_email(token: str) -> Tuple[str, str]:
+    """Subject and body of the verification email. create_user queues it in the same statement as the user."""
+    verification_url = f"{settings.FRONTEND_URL}/verify-email?token={token}"
+    html = f"""
         <html>
             <body>
                 <h2>Verify Your Email</h2>
@@ -42,53 +58,16 @@ async def send_verification_email(email: str, token: str) -> None:
             </body>
         </html>
         """
-        message = MessageSchema(
-            subject="Verify Your Email",
-            recipients=[email],
-            body=html,
-            subtype=MessageType.html
-        )
-        
-        logger.debug(f"Email Service: Sending verification email via SMTP - email: {masked_email}")
-        await fast_mail.send_message(message)
-        
-        logger.info(f"Email Service: Verification email sent successfully - email: {masked_email}, token: {masked_token}")
-    except ConnectionError as e:
-        logger.error(f"Email Service: SMTP connection error sending verification email - email: {mask_email(email)}, error: {str(e)}", exc_info=True)
-        raise HTTPException(
-            status_code=500,
-            detail="Failed to connect to email server. Please try again later."
-        )
-    except TimeoutError as e:
-        logger.error(f"Email Service: Email sending timeout - email: {mask_email(email)}, error: {str(e)}", exc_info=True)
-        raise HTTPException(
-            status_code=500,
-            detail="Email sending timed out. Please try again later."
-        )
-    except ValueError as e:
-        logger.error(f"Email Service: Invalid email format or settings - email: {mask_email(email)}, error: {str(e)}")
-        raise HTTPException(
-            status_code=400,
-            detail=f"Invalid email configuration: {str(e)}"
-        )
-    except Exception as e:
-        logger.error(f"Email Service: Unexpected error sending verification email - email: {mask_email(email)}, error: {str(e)}", exc_info=True)
-        raise HTTPException(
-            status_code=500,
-            detail="Failed to send verification email. Please try again later."
-        )
+    return "Verify Your Email", html
 
 
-async def send_password_reset_email(email: str, token: str) -> None:
-    try:
-        masked_email = mask_email(email)
-        masked_token = mask_token(token)
-        logger.info(f"Email Service: Sending password reset email - email: {masked_email}, token: {masked_token}")
-        
-        reset_url = f"{settings.FRONTEND_URL}/reset-password?token={token}"
-        logger.debug(f"Email Service: Creating password reset email message - email: {masked_email}")
-        
-        html = f"""
+async def enqueue_password_reset_email(db: AsyncSession, email: str, token: str) -> EmailOutbox:
+    masked_email = mask_email(email)
+    masked_token = mask_token(token)
+    logger.info(f"Email Service: Queueing password reset email - email: {masked_email}, token: {masked_token}")
+    
+    reset_url = f"{settings.FRONTEND_URL}/reset-password?token={token}"
+    html = f"""
         <html>
             <body>
                 <h2>Reset Your Password</h2>
@@ -99,39 +78,26 @@ async def send_password_reset_email(email: str, token: str) -> None:
             </body>
         </html>
         """
-        message = MessageSchema(
-            subject="Reset Your Password",
-            recipients=[email],
-            body=html,
-            subtype=MessageType.html
-        )
-        
-        logger.debug(f"Email Service: Sending password reset email via SMTP - email: {masked_email}")
-        await fast_mail.send_message(message)
-        
-        logger.info(f"Email Service: Password reset email sent successfully - email: {masked_email}, token: {masked_token}")
-    except ConnectionError as e:
-        logger.error(f"Email Service: SMTP connection error sending password reset email - email: {mask_email(email)}, error: {str(e)}", exc_info=True)
-        raise HTTPException(
-            status_code=500,
-            detail="Failed to connect to email server. Please try again later."
-        )
-    except TimeoutError as e:
-        logger.error(f"Email Service: Email sending timeout - email: {mask_email(email)}, error: {str(e)}", exc_info=True)
-        raise HTTPException(
-            status_code=500,
-            detail="Email sending timed out. Please try again later."
-        )
-    except ValueError as e:
-        logger.error(f"Email Service: Invalid email format or settings - email: {mask_email(email)}, error: {str(e)}")
-        raise HTTPException(
-            status_code=400,
-            detail=f"Invalid email configuration: {str(e)}"
-        )
-    except Exception as e:
-        logger.error(f"Email Service: Unexpected error sending password reset email - email: {mask_email(email)}, error: {str(e)}", exc_info=True)
-        raise HTTPException(
-            status_code=500,
-            detail="Failed to send password reset email. Please try again later."
-        )
+    return await enqueue_email(db, email, "Reset Your Password", html)
+
+
+def build_message(recipient: str, subject: str, body: str) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = settings.MAIL_FROM
+    message["To"] = recipient
+    message["Subject"] = subject
+    message.set_content(body, subtype="html")
+    return message
+
+
+async def deliver_emails(messages: List[EmailMessage]) -> List[Optional[Exception]]:
+    """Send a batch of emails over pooled SMTP sessions.
 
+    Returns one entry per message: None when it was accepted, otherwise the error,
+    so the outbox worker can retry failures individually.
+    """
+    logger.debug(f"Email Service: Sending {len(messages)} emails via pooled SMTP")
+    results = await smtp_pool.send_batch(messages)
+    sent = sum(1 for result in results if result is None)
+    logger.info(f"Email Service: Batch delivered - sent: {sent}, failed: {len(results) - sent}")
+    return results
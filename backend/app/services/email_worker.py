@@ -0,0 +1,154 @@
+"""
+Background worker that drains the email outbox.
+
+Request handlers only INSERT into email_outbox inside their own transaction;
+this worker picks up due rows, sends them over SMTP and retries failures with
+exponential backoff.
+
+A batch is claimed in one short transaction that marks its rows 'sending' with a
+lease, and the results are recorded in another; no transaction, row lock or pool
+connection is held while SMTP runs. Rows whose lease runs out (the worker died
+mid-send) become due again, so delivery is at least once.
+"""
+import asyncio
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+from sqlalchemy import text, update
+from sqlalchemy.engine import Row
+from app.config import get_settings
+from app.database import async_session
+from app.models.email_outbox import EmailOutbox
+from app.services.email import build_message, deliver_emails, smtp_pool
+from app.utils.logger import logger
+from app.utils.mask import mask_email
+
+settings = get_settings()
+
+# SKIP LOCKED lets several app instances claim from the same outbox without double-sending
+CLAIM_BATCH_SQL = text("""
+    UPDATE email_outbox
+    SET status = 'sending', next_attempt_at = now() + make_interval(secs => :lease_seconds)
+    WHERE id IN (
+        SELECT id FROM email_outbox
+        WHERE status IN ('pending', 'sending') AND next_attempt_at <= now()
+        ORDER BY next_attempt_at
+        LIMIT :batch_size
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id, recipient, subject, body, attempts
+""")
+
+
+class EmailOutboxWorker:
+    def __init__(
+        self,
+        session_factory=async_session,
+        poll_interval: float = settings.EMAIL_OUTBOX_POLL_INTERVAL_SECONDS,
+        batch_size: int = settings.EMAIL_OUTBOX_BATCH_SIZE,
+        max_attempts: int = settings.EMAIL_OUTBOX_MAX_ATTEMPTS,
+        backoff_base: float = settings.EMAIL_OUTBOX_BACKOFF_BASE_SECONDS,
+        backoff_max: float = settings.EMAIL_OUTBOX_BACKOFF_MAX_SECONDS,
+        lease_seconds: float = settings.EMAIL_OUTBOX_LEASE_SECONDS,
+    ):
+        self._session_factory = session_factory
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.lease_seconds = lease_seconds
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            logger.info("Email Worker: Starting outbox delivery worker")
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        logger.info("Email Worker: Stopping outbox delivery worker")
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await smtp_pool.close()
+
+    def wake(self) -> None:
+        """Skip the rest of the current poll interval, e.g. right after a request queued mail."""
+        self._wakeup.set()
+
+    def backoff_delay(self, attempts: int) -> float:
+        """Exponential backoff with jitter: base * 2^(attempts - 1), capped at backoff_max."""
+        delay = min(self.backoff_base * (2 ** max(attempts - 1, 0)), self.backoff_max)
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _run(self) -> None:
+        while True:
+            processed = 0
+            try:
+                processed = await self.drain_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Email Worker: Error draining outbox - error: {str(e)}", exc_info=True)
+
+            # A full batch means there is probably more work queued; go again immediately
+            if processed >= self.batch_size:
+                continue
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def drain_once(self) -> int:
+        """Deliver one batch of due messages. Returns the number of rows processed."""
+        async with self._session_factory() as session:
+            async with session.begin():
+                result = await session.execute(
+                    CLAIM_BATCH_SQL,
+                    {"lease_seconds": self.lease_seconds, "batch_size": self.batch_size}
+                )
+                messages = result.all()
+        if not messages:
+            return 0
+
+        logger.debug(f"Email Worker: Delivering {len(messages)} queued emails")
+        results = await deliver_emails([
+            build_message(message.recipient, message.subject, message.body)
+            for message in messages
+        ])
+
+        async with self._session_factory() as session:
+            async with session.begin():
+                # Bulk UPDATE by primary key, one statement for the whole batch
+                await session.execute(
+                    update(EmailOutbox),
+                    [self._result_values(message, error) for message, error in zip(messages, results)]
+                )
+        return len(messages)
+
+    def _result_values(self, message: Row, e: Optional[Exception]) -> Dict[str, Any]:
+        masked_email = mask_email(message.recipient)
+        if e is None:
+            return {"id": message.id, "status": "sent", "sent_at": datetime.now(timezone.utc), "last_error": None}
+        attempts = message.attempts + 1
+        values = {"id": message.id, "attempts": attempts, "last_error": str(e)[:1000]}
+        if attempts >= self.max_attempts:
+            values["status"] = "failed"
+            logger.error(f"Email Worker: Giving up on email - outbox_id: {message.id}, email: {masked_email}, attempts: {attempts}, error: {str(e)}")
+        else:
+            delay = self.backoff_delay(attempts)
+            values["status"] = "pending"
+            values["next_attempt_at"] = datetime.now(timezone.utc) + timedelta(seconds=delay)
+            logger.warning(f"Email Worker: Email delivery failed, retrying in {delay:.0f}s - outbox_id: {message.id}, email: {masked_email}, attempts: {attempts}, error: {str(e)}")
+        return values
+
+
+email_outbox_worker = EmailOutboxWorker()
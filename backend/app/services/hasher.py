@@ -0,0 +1,147 @@
+"""
+Password hasher abstraction with startup cost calibration.
+
+The work factor is chosen per deployment: at startup the configured scheme is
+benchmarked at increasing costs and the largest cost whose hash time fits the
+latency budget wins. Hashes made with a lower cost are upgraded on the next
+successful login (see rehash_user_password in app/services/auth.py).
+
+The calibration table for the current machine is printed by
+scripts/bench_password_hashing.py.
+"""
+import statistics
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple, Type
+from passlib.context import CryptContext
+from app.utils.logger import logger
+
+
+class PasswordHasher(ABC):
+    name: str
+    min_cost: int
+    max_cost: int
+
+    def __init__(self, cost: int):
+        self.cost = cost
+
+    @abstractmethod
+    def hash(self, password: str) -> str:
+        ...
+
+    @abstractmethod
+    def verify(self, password: str, hashed: str) -> bool:
+        ...
+
+    @abstractmethod
+    def needs_rehash(self, hashed: str) -> bool:
+        """True when the hash was made with a different scheme or a lower cost than configured."""
+        ...
+
+
+class BcryptHasher(PasswordHasher):
+    name = "bcrypt"
+    min_cost = 4
+    max_cost = 31
+
+    def __init__(self, cost: int):
+        super().__init__(cost)
+        self._context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=cost)
+
+    def hash(self, password: str) -> str:
+        return self._context.hash(password)
+
+    def verify(self, password: str, hashed: str) -> bool:
+        return self._context.verify(password, hashed)
+
+    def needs_rehash(self, hashed: str) -> bool:
+        # Modular crypt format: $2b$<cost>$<salt+digest>. Only upgrade weaker hashes - a smaller
+        # instance calibrating to a lower cost must not downgrade hashes made elsewhere.
+        parts = hashed.split("$")
+        if len(parts) != 4 or parts[1] not in ("2a", "2b", "2y") or not parts[2].isdigit():
+            return True
+        return int(parts[2]) < self.cost
+
+
+# Register additional schemes here (e.g. an argon2 hasher) to make them selectable via PASSWORD_HASHER
+HASHERS: Dict[str, Type[PasswordHasher]] = {
+    BcryptHasher.name: BcryptHasher,
+}
+
+DEFAULT_COST = 12
+
+_active_hasher: Optional[PasswordHasher] = None
+
+
+def benchmark(hasher: PasswordHasher, samples: int = 3) -> float:
+    """Median wall time of one hash, in milliseconds."""
+    timings = []
+    for _ in range(samples):
+        started_at = time.perf_counter()
+        hasher.hash("calibration-password")
+        timings.append((time.perf_counter() - started_at) * 1000)
+    return statistics.median(timings)
+
+
+def calibrate(
+    scheme: str,
+    target_ms: float,
+    min_cost: int,
+    max_cost: int,
+    samples: int = 3,
+) -> Tuple[int, List[Tuple[int, float]]]:
+    """Pick the largest cost whose hash time fits within target_ms.
+
+    Returns (chosen_cost, [(cost, milliseconds), ...]). Falls back to min_cost when
+    even that exceeds the budget.
+    """
+    hasher_cls = HASHERS[scheme]
+    min_cost = max(min_cost, hasher_cls.min_cost)
+    max_cost = min(max_cost, hasher_cls.max_cost)
+
+    table: List[Tuple[int, float]] = []
+    chosen = min_cost
+    for cost in range(min_cost, max_cost + 1):
+        elapsed_ms = benchmark(hasher_cls(cost), samples)
+        table.append((cost, elapsed_ms))
+        if elapsed_ms > target_ms:
+            # Cost is exponential, so every higher setting would overshoot as well
+            break
+        chosen = cost
+    return chosen, table
+
+
+def configure_hasher() -> PasswordHasher:
+    """Build the process-wide hasher from settings, calibrating when no cost is pinned."""
+    from app.config import get_settings
+
+    global _active_hasher
+    settings = get_settings()
+    scheme = settings.PASSWORD_HASHER
+    if scheme not in HASHERS:
+        raise ValueError(f"Unknown PASSWORD_HASHER '{scheme}', expected one of: {', '.join(HASHERS)}")
+
+    if settings.PASSWORD_HASH_ROUNDS is not None:
+        cost = settings.PASSWORD_HASH_ROUNDS
+        logger.info(f"Hasher: Using pinned cost - scheme: {scheme}, cost: {cost}")
+    else:
+        cost, table = calibrate(
+            scheme,
+            settings.PASSWORD_HASH_TARGET_MS,
+            settings.PASSWORD_HASH_MIN_ROUNDS,
+            settings.PASSWORD_HASH_MAX_ROUNDS,
+        )
+        measured = ", ".join(f"{c}={ms:.0f}ms" for c, ms in table)
+        logger.info(f"Hasher: Calibrated cost - scheme: {scheme}, target: {settings.PASSWORD_HASH_TARGET_MS:.0f}ms, cost: {cost}, measured: {measured}")
+
+    _active_hasher = HASHERS[scheme](cost)
+    return _active_hasher
+
+
+def get_hasher() -> PasswordHasher:
+    global _active_hasher
+    if _active_hasher is None:
+        # Not calibrated yet (e.g. scripts, alembic): library default cost
+        _active_hasher = BcryptHasher(DEFAULT_COST)
+    return _active_hasher
+
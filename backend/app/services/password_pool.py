@@ -0,0 +1,75 @@
+"""
+Bounded executor for password hashing.
+
+bcrypt deliberately burns a few hundred milliseconds of CPU per call. Running it
+inline in an async handler freezes the event loop for every other request on the
+worker, so hashing and verification are pushed onto a small thread pool (bcrypt
+releases the GIL) with a cap on how many callers may wait for a slot.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+from fastapi import HTTPException, status
+from app.config import get_settings
+from app.utils.logger import logger
+from app.utils.metrics import metrics
+
+settings = get_settings()
+
+
+class PasswordHashPool:
+    def __init__(
+        self,
+        max_workers: int = settings.PASSWORD_HASH_MAX_WORKERS,
+        max_queue: int = settings.PASSWORD_HASH_MAX_QUEUE,
+        queue_timeout: float = settings.PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS,
+    ):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="password-hash")
+        self._slots = asyncio.Semaphore(max_workers)
+        self._waiting = 0
+
+        self._queue_depth = metrics.gauge("password_hash_queue_depth", "Callers waiting for a hashing slot", lambda: self._waiting)
+        self._queue_wait = metrics.histogram("password_hash_queue_wait_seconds", "Time spent waiting for a hashing slot")
+        self._latency = metrics.histogram("password_hash_latency_seconds", "Time spent hashing or verifying a password")
+        self._rejected = metrics.counter("password_hash_rejected_total", "Calls rejected with 503 because the pool was saturated")
+
+    def _reject(self, reason: str) -> HTTPException:
+        self._rejected.inc()
+        logger.warning(f"Password Pool: Rejecting request - {reason}, waiting: {self._waiting}")
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy. Please try again shortly.",
+            headers={"Retry-After": "1"},
+        )
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        if self._waiting >= self.max_queue:
+            raise self._reject("queue full")
+
+        queued_at = time.perf_counter()
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise self._reject("queue wait timeout")
+        finally:
+            self._waiting -= 1
+
+        started_at = time.perf_counter()
+        self._queue_wait.observe(started_at - queued_at)
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self._latency.observe(time.perf_counter() - started_at)
+            self._slots.release()
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
+
+
+password_hash_pool = PasswordHashPool()
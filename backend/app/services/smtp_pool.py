@@ -0,0 +1,200 @@
+"""
+Pooled SMTP connections for the email outbox worker.
+
+Opening an SMTP session costs a TCP connect, a TLS handshake and an AUTH
+exchange. The pool keeps a few authenticated sessions alive between batches
+and sends many messages over each one before recycling it.
+
+Delivery is at least once. A session that drops before the DATA command is
+issued has not handed the message over, so it is resent on a fresh session.
+One that drops after DATA may have been accepted by the server without us
+seeing the reply; that message is reported as DeliveryOutcomeUnknown rather
+than resent, and the outbox worker retries it on its own backoff.
+"""
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from email.message import EmailMessage
+from typing import AsyncIterator, Deque, List, Optional
+import aiosmtplib
+from aiosmtplib.errors import SMTPServerDisconnected
+from app.utils.logger import logger
+from app.utils.mask import mask_email
+
+
+class DeliveryOutcomeUnknown(Exception):
+    """The session dropped after DATA was sent; the server may or may not have the message."""
+
+
+class _TrackingSMTP(aiosmtplib.SMTP):
+    """Records whether the current message got as far as the DATA command."""
+
+    data_started = False
+
+    async def data(self, *args, **kwargs):
+        self.data_started = True
+        return await super().data(*args, **kwargs)
+
+
+class _PooledConnection:
+    def __init__(self, client: _TrackingSMTP):
+        self.client = client
+        self.messages_sent = 0
+        self.last_used = time.monotonic()
+
+
+class SMTPConnectionPool:
+    def __init__(
+        self,
+        hostname: str,
+        port: int,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        use_tls: bool = False,
+        start_tls: Optional[bool] = None,
+        validate_certs: bool = True,
+        max_size: int = 2,
+        max_messages_per_connection: int = 100,
+        idle_timeout: float = 60.0,
+        keepalive_interval: float = 15.0,
+        timeout: float = 30.0,
+    ):
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.start_tls = start_tls
+        self.validate_certs = validate_certs
+        self.max_size = max_size
+        self.max_messages_per_connection = max_messages_per_connection
+        self.idle_timeout = idle_timeout
+        self.keepalive_interval = keepalive_interval
+        self.timeout = timeout
+        self._idle: Deque[_PooledConnection] = deque()
+        self._semaphore = asyncio.Semaphore(max_size)
+
+    async def _open(self) -> _PooledConnection:
+        logger.debug(f"SMTP Pool: Opening connection - server: {self.hostname}:{self.port}")
+        client = _TrackingSMTP(
+            hostname=self.hostname,
+            port=self.port,
+            username=self.username,
+            password=self.password,
+            use_tls=self.use_tls,
+            start_tls=self.start_tls,
+            validate_certs=self.validate_certs,
+            timeout=self.timeout,
+        )
+        await client.connect()  # Also performs STARTTLS and AUTH when configured
+        return _PooledConnection(client)
+
+    async def _discard(self, conn: _PooledConnection) -> None:
+        try:
+            if conn.client.is_connected:
+                await conn.client.quit()
+        except Exception:
+            conn.client.close()
+
+    async def _is_usable(self, conn: _PooledConnection) -> bool:
+        if not conn.client.is_connected:
+            return False
+        idle_for = time.monotonic() - conn.last_used
+        if idle_for > self.idle_timeout:
+            return False
+        if idle_for > self.keepalive_interval:
+            # Servers silently drop idle sessions; probe before trusting it with a message
+            try:
+                await conn.client.noop()
+            except Exception:
+                return False
+        return True
+
+    async def _acquire(self) -> _PooledConnection:
+        while self._idle:
+            conn = self._idle.pop()  # Most recently used first, so stale ones age out
+            if await self._is_usable(conn):
+                return conn
+            await self._discard(conn)
+        return await self._open()
+
+    async def _release(self, conn: _PooledConnection, healthy: bool) -> None:
+        conn.last_used = time.monotonic()
+        if healthy and conn.client.is_connected and conn.messages_sent < self.max_messages_per_connection:
+            self._idle.append(conn)
+        else:
+            await self._discard(conn)
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator[_PooledConnection]:
+        async with self._semaphore:
+            conn = await self._acquire()
+            healthy = True
+            try:
+                yield conn
+            except SMTPServerDisconnected:
+                healthy = False
+                raise
+            finally:
+                await self._release(conn, healthy)
+
+    async def _send_chunk(self, messages: List[EmailMessage]) -> List[Optional[Exception]]:
+        results: List[Optional[Exception]] = []
+        pending = list(messages)
+        reconnects = 0
+        while pending:
+            try:
+                async with self.connection() as conn:
+                    while pending and conn.messages_sent < self.max_messages_per_connection:
+                        message = pending[0]
+                        conn.client.data_started = False
+                        try:
+                            await conn.client.send_message(message)
+                            results.append(None)
+                        except SMTPServerDisconnected as e:
+                            if conn.client.data_started:
+                                # Resending could deliver it twice; leave the decision to the outbox
+                                logger.warning(f"SMTP Pool: Connection dropped after DATA, outcome unknown - email: {mask_email(str(message['To']))}, error: {str(e)}")
+                                results.append(DeliveryOutcomeUnknown(str(e)))
+                                pending.pop(0)
+                            raise
+                        except Exception as e:
+                            # Rejected recipient/data: the session is still fine, move on
+                            logger.warning(f"SMTP Pool: Message rejected - email: {mask_email(str(message['To']))}, error: {str(e)}")
+                            results.append(e)
+                        conn.messages_sent += 1
+                        pending.pop(0)
+            except SMTPServerDisconnected as e:
+                reconnects += 1
+                if reconnects > 1:
+                    results.extend(e for _ in pending)
+                    break
+                logger.warning(f"SMTP Pool: Connection dropped mid-batch, reconnecting - error: {str(e)}")
+            except Exception as e:
+                # Could not connect or authenticate - every remaining message fails this round
+                logger.error(f"SMTP Pool: Unable to open SMTP session - server: {self.hostname}:{self.port}, error: {str(e)}")
+                results.extend(e for _ in pending)
+                break
+        return results
+
+    async def send_batch(self, messages: List[EmailMessage]) -> List[Optional[Exception]]:
+        """Send messages over pooled sessions.
+
+        Messages are split across up to max_size connections and sent in parallel.
+        Returns one entry per message, in order: None on success, the exception otherwise.
+        Delivery is at least once: a message whose session dropped after DATA comes
+        back as DeliveryOutcomeUnknown and may already be with the server, so
+        retrying it can deliver it twice.
+        """
+        if not messages:
+            return []
+        chunk_count = min(self.max_size, len(messages))
+        chunk_size = -(-len(messages) // chunk_count)
+        chunks = [messages[i:i + chunk_size] for i in range(0, len(messages), chunk_size)]
+        chunk_results = await asyncio.gather(*(self._send_chunk(chunk) for chunk in chunks))
+        return [result for results in chunk_results for result in results]
+
+    async def close(self) -> None:
+        while self._idle:
+            await self._discard(self._idle.pop())
@@ -0,0 +1,58 @@
+"""
+LRU of recently verified access tokens.
+
+An SPA sends the same access token with every request for up to
+ACCESS_TOKEN_EXPIRE_MINUTES, so re-running HMAC verification and JSON parsing
+each time is wasted work. Successful verifications are remembered until the
+token's own `exp`; failures are never cached.
+"""
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+from app.config import get_settings
+from app.utils.metrics import metrics
+
+settings = get_settings()
+
+
+@dataclass(frozen=True)
+class Principal:
+    user_id: int
+    expires_at: float  # Unix timestamp from the token's exp claim
+    token_id: Optional[str] = None  # jti claim; tokens issued before jti existed have none
+
+
+class VerifiedTokenCache:
+    def __init__(self, max_size: int = settings.TOKEN_CACHE_MAX_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Principal]" = OrderedDict()
+
+        self._hits = metrics.counter("token_cache_hits_total", "Access tokens accepted without re-verifying the signature")
+        self._misses = metrics.counter("token_cache_misses_total", "Access tokens that needed full verification")
+        metrics.gauge("token_cache_size", "Verified access tokens currently cached", lambda: len(self._entries))
+
+    def get(self, token: str) -> Optional[Principal]:
+        principal = self._entries.get(token)
+        if principal is None:
+            self._misses.inc()
+            return None
+        if principal.expires_at <= time.time():
+            del self._entries[token]
+            self._misses.inc()
+            return None
+        self._entries.move_to_end(token)
+        self._hits.inc()
+        return principal
+
+    def set(self, token: str, principal: Principal) -> None:
+        self._entries[token] = principal
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def discard(self, token: str) -> None:
+        self._entries.pop(token, None)
+
+
+verified_token_cache = VerifiedTokenCache()
@@ -0,0 +1,211 @@
+"""
+In-memory denylist of revoked access tokens.
+
+Access tokens are stateless JWTs, so logging out used to leave the access
+token valid until it expired. Revoked token ids (the `jti` claim) are now kept
+in a dict until the token's own expiry, making the check on the auth hot path a
+single O(1) lookup, optionally fronted by a Bloom filter.
+
+Revocations are written to the revoked_access_tokens table (so a freshly started
+worker can load them) and broadcast with Postgres NOTIFY, which every worker
+LISTENs on to update its own copy immediately. LISTEN needs a session of its
+own, which a transaction-mode pooler does not provide, so the listener only runs
+over a direct connection; every worker also reloads the table periodically, in
+case it has no listener or a notification went missing. Reloading only reads:
+expired rows are deleted by the purge worker (token_purge).
+"""
+import asyncio
+import hashlib
+import math
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional
+import asyncpg
+from sqlalchemy import select, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import get_settings
+from app.database import async_read_session, engine, to_async_url
+from app.models.user import RevokedAccessToken
+from app.utils.logger import logger
+from app.utils.metrics import metrics
+
+settings = get_settings()
+
+NOTIFY_CHANNEL = "access_token_revoked"
+
+# Persist and broadcast in one round trip; an empty channel skips the NOTIFY
+REVOKE_ACCESS_TOKEN_SQL = text("""
+    WITH stored AS (
+        INSERT INTO revoked_access_tokens (jti, expires_at)
+        VALUES (:jti, :expires_at)
+        ON CONFLICT (jti) DO NOTHING
+    )
+    SELECT pg_notify(:channel, :payload) WHERE :channel <> ''
+""")
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class AccessTokenDenylist:
+    def __init__(
+        self,
+        use_bloom: bool = settings.ACCESS_TOKEN_DENYLIST_BLOOM,
+        bloom_capacity: int = settings.ACCESS_TOKEN_DENYLIST_BLOOM_CAPACITY,
+        sweep_interval: float = settings.ACCESS_TOKEN_DENYLIST_SWEEP_SECONDS,
+        sync: bool = settings.ACCESS_TOKEN_DENYLIST_SYNC,
+        listen_url: str = settings.ACCESS_TOKEN_DENYLIST_LISTEN_URL,
+        reload_interval: float = settings.ACCESS_TOKEN_DENYLIST_RELOAD_SECONDS,
+    ):
+        self.use_bloom = use_bloom
+        self.bloom_capacity = bloom_capacity
+        self.sweep_interval = sweep_interval
+        self.sync = sync
+        self.listen_url = listen_url
+        self.reload_interval = reload_interval
+        self._entries: Dict[str, float] = {}
+        self._bloom: Optional[BloomFilter] = BloomFilter(bloom_capacity) if use_bloom else None
+        self._task: Optional[asyncio.Task] = None
+
+        self._rejected = metrics.counter("token_denylist_rejections_total", "Requests rejected because their access token was revoked")
+        metrics.gauge("token_denylist_size", "Revoked access tokens held until expiry", lambda: len(self._entries))
+
+    def add(self, jti: str, expires_at: float) -> None:
+        if expires_at <= time.time():
+            return
+        self._entries[jti] = expires_at
+        if self._bloom is not None:
+            self._bloom.add(jti)
+
+    def is_revoked(self, jti: Optional[str]) -> bool:
+        if not jti:
+            return False
+        if self._bloom is not None and jti not in self._bloom:
+            return False
+        expires_at = self._entries.get(jti)
+        if expires_at is None or expires_at <= time.time():
+            return False
+        self._rejected.inc()
+        return True
+
+    def sweep(self) -> int:
+        now = time.time()
+        expired = [jti for jti, expires_at in self._entries.items() if expires_at <= now]
+        for jti in expired:
+            del self._entries[jti]
+        if expired and self._bloom is not None:
+            # Bloom filters cannot delete; rebuild from what is still live
+            self._bloom = BloomFilter(max(self.bloom_capacity, len(self._entries)))
+            for jti in self._entries:
+                self._bloom.add(jti)
+        return len(expired)
+
+    async def revoke(self, db: AsyncSession, jti: str, expires_at: float) -> None:
+        """Revoke a token in the caller's transaction.
+
+        Nothing changes until the caller commits: other workers hear about it then, and
+        the caller add()s it to this worker's copy once the commit succeeded.
+        """
+        # NOTIFY is transactional: it is delivered only if the request commits
+        await db.execute(
+            REVOKE_ACCESS_TOKEN_SQL,
+            {
+                "jti": jti,
+                "expires_at": datetime.fromtimestamp(expires_at, tz=timezone.utc),
+                "channel": NOTIFY_CHANNEL if self.sync else "",
+                "payload": f"{jti}:{expires_at}",
+            }
+        )
+
+    async def load(self) -> None:
+        async with async_read_session() as session:
+            result = await session.execute(
+                select(RevokedAccessToken.jti, RevokedAccessToken.expires_at)
+                .where(RevokedAccessToken.expires_at > datetime.now(timezone.utc))
+            )
+            rows = result.all()
+        for jti, expires_at in rows:
+            self.add(jti, expires_at.timestamp())
+        logger.debug(f"Token Denylist: Loaded {len(rows)} revoked access tokens")
+
+    def _on_notify(self, connection, pid, channel, payload: str) -> None:
+        jti, _, expires_at = payload.partition(":")
+        try:
+            self.add(jti, float(expires_at))
+        except ValueError:
+            logger.warning(f"Token Denylist: Ignoring malformed notification - payload: {payload}")
+
+    def _listen_dsn(self) -> Optional[str]:
+        """Connection for LISTEN, or None if there is no direct one to use."""
+        if self.listen_url:
+            url = make_url(to_async_url(self.listen_url))
+        elif settings.DB_POOLER_MODE == "direct":
+            url = engine.url
+        else:
+            # Through a transaction-mode pooler LISTEN is accepted but nothing is ever delivered
+            return None
+        return url.set(drivername="postgresql").render_as_string(hide_password=False)
+
+    async def _run(self) -> None:
+        dsn = self._listen_dsn() if self.sync else None
+        if self.sync and dsn is None:
+            logger.warning(f"Token Denylist: No direct connection for LISTEN (set ACCESS_TOKEN_DENYLIST_LISTEN_URL), other workers' revocations arrive by reload every {self.reload_interval:g}s")
+        while True:
+            connection = None
+            try:
+                if dsn is not None:
+                    connection = await asyncpg.connect(dsn)
+                    await connection.add_listener(NOTIFY_CHANNEL, self._on_notify)
+                # (Re)load after subscribing so nothing revoked in between is missed
+                await self.load()
+                loaded_at = time.monotonic()
+                while connection is None or not connection.is_closed():
+                    await asyncio.sleep(min(self.sweep_interval, self.reload_interval))
+                    self.sweep()
+                    if time.monotonic() - loaded_at >= self.reload_interval:
+                        await self.load()
+                        loaded_at = time.monotonic()
+                logger.warning("Token Denylist: Listener connection lost, reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Token Denylist: Sync error - error: {str(e)}", exc_info=True)
+                await asyncio.sleep(self.sweep_interval)
+            finally:
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+
+access_token_denylist = AccessTokenDenylist()
@@ -0,0 +1,145 @@
+"""
+Background purge of dead refresh tokens.
+
+Every login and refresh inserts a row into refresh_tokens and rows are only
+ever marked revoked, so the table and its token index grow without bound.
+This worker deletes expired rows, and revoked rows once they were revoked longer
+ago than the reuse-detection retention window (counted from revoked_at, not from
+when the token was issued), in small batches addressed by ctid. Expired and
+revoked rows are purged in separate passes, each driven by its own index.
+Each batch is its own short transaction and skips rows other transactions
+hold, so the purge never blocks logins or refreshes.
+
+It also deletes revoked_access_tokens rows whose access token has expired, so
+the denylist workers only ever read that table.
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from sqlalchemy import text
+from app.config import get_settings
+from app.database import async_session
+from app.utils.logger import logger
+from app.utils.metrics import Counter, metrics
+
+settings = get_settings()
+
+PURGE_EXPIRED_BATCH_SQL = text("""
+    DELETE FROM refresh_tokens
+    WHERE ctid = ANY(ARRAY(
+        SELECT ctid FROM refresh_tokens
+        WHERE expires_at < now()
+        LIMIT :batch_size
+        FOR UPDATE SKIP LOCKED
+    ))
+""")
+
+# "revoked AND" matches the partial index ix_refresh_tokens_revoked_at
+PURGE_REVOKED_BATCH_SQL = text("""
+    DELETE FROM refresh_tokens
+    WHERE ctid = ANY(ARRAY(
+        SELECT ctid FROM refresh_tokens
+        WHERE revoked AND revoked_at < :revoked_before
+        LIMIT :batch_size
+        FOR UPDATE SKIP LOCKED
+    ))
+""")
+
+PURGE_REVOKED_ACCESS_TOKENS_BATCH_SQL = text("""
+    DELETE FROM revoked_access_tokens
+    WHERE jti = ANY(ARRAY(
+        SELECT jti FROM revoked_access_tokens
+        WHERE expires_at <= now()
+        LIMIT :batch_size
+        FOR UPDATE SKIP LOCKED
+    ))
+""")
+
+TABLE_SIZE_SQL = text("SELECT pg_total_relation_size('refresh_tokens')")
+
+
+class RefreshTokenPurgeWorker:
+    def __init__(
+        self,
+        session_factory=async_session,
+        interval: float = settings.REFRESH_TOKEN_PURGE_INTERVAL_SECONDS,
+        batch_size: int = settings.REFRESH_TOKEN_PURGE_BATCH_SIZE,
+        batch_pause: float = settings.REFRESH_TOKEN_PURGE_BATCH_PAUSE_SECONDS,
+        revoked_retention_hours: int = settings.REFRESH_TOKEN_REVOKED_RETENTION_HOURS,
+    ):
+        self._session_factory = session_factory
+        self.interval = interval
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.revoked_retention = timedelta(hours=revoked_retention_hours)
+        self._task: Optional[asyncio.Task] = None
+
+        self._purged = metrics.counter("refresh_token_purged_rows_total", "Expired or revoked refresh tokens deleted")
+        self._purged_access_tokens = metrics.counter("revoked_access_token_purged_rows_total", "Denylist entries of expired access tokens deleted")
+        self._batch_seconds = metrics.histogram("refresh_token_purge_batch_seconds", "Time per refresh token purge batch")
+        self._table_bytes = metrics.gauge("refresh_tokens_table_bytes", "refresh_tokens size including indexes and TOAST")
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            logger.info("Token Purge: Starting refresh token purge worker")
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        logger.info("Token Purge: Stopping refresh token purge worker")
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.purge()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Token Purge: Error purging refresh tokens - error: {str(e)}", exc_info=True)
+            await asyncio.sleep(self.interval)
+
+    async def _delete_batch(self, statement, params: dict) -> int:
+        """Run one batch DELETE in its own short transaction. Returns the number deleted."""
+        started_at = time.perf_counter()
+        async with self._session_factory() as session:
+            async with session.begin():
+                result = await session.execute(statement, {**params, "batch_size": self.batch_size})
+        self._batch_seconds.observe(time.perf_counter() - started_at)
+        return result.rowcount
+
+    async def _delete_all(self, statement, params: dict, purged: Counter) -> int:
+        """Run batches until a partial batch comes back, counting them in purged. Returns the total deleted."""
+        total = 0
+        while True:
+            deleted = await self._delete_batch(statement, params)
+            purged.inc(deleted)
+            total += deleted
+            if deleted < self.batch_size:
+                return total
+            # Let autovacuum and concurrent writers breathe between batches
+            await asyncio.sleep(self.batch_pause)
+
+    async def purge(self) -> int:
+        """Purge dead refresh tokens, then expired denylist entries. Returns the refresh tokens deleted."""
+        revoked_before = datetime.now(timezone.utc) - self.revoked_retention
+        total = await self._delete_all(PURGE_EXPIRED_BATCH_SQL, {}, self._purged)
+        total += await self._delete_all(PURGE_REVOKED_BATCH_SQL, {"revoked_before": revoked_before}, self._purged)
+        await self._delete_all(PURGE_REVOKED_ACCESS_TOKENS_BATCH_SQL, {}, self._purged_access_tokens)
+
+        async with self._session_factory() as session:
+            self._table_bytes.set((await session.execute(TABLE_SIZE_SQL)).scalar_one())
+
+        if total:
+            logger.info(f"Token Purge: Deleted {total} expired or revoked refresh tokens")
+        return total
+
+
+refresh_token_purge_worker = RefreshTokenPurgeWorker()
@@ -0,0 +1,78 @@
+"""
+Per-process cache of authenticated user snapshots.
+
+get_current_user used to load the full User row on every authenticated request.
+Identity only needs a handful of columns, so a small immutable snapshot is kept
+in a bounded LRU with a TTL. Entries are dropped explicitly when the user's
+verification state or password changes, or when they log out; the TTL bounds
+staleness across worker processes, which do not share this cache.
+"""
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Tuple
+from app.config import get_settings
+from app.models.user import User
+from app.utils.metrics import metrics
+
+settings = get_settings()
+
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    id: int
+    email: str
+    is_verified: bool
+    created_at: Optional[datetime]
+
+    @classmethod
+    def from_user(cls, user: User) -> "UserSnapshot":
+        return cls(id=user.id, email=user.email, is_verified=bool(user.is_verified), created_at=user.created_at)
+
+
+class UserCache:
+    def __init__(self, max_size: int = settings.USER_CACHE_MAX_SIZE, ttl: float = settings.USER_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, Tuple[float, UserSnapshot]]" = OrderedDict()
+
+        self._hits = metrics.counter("user_cache_hits_total", "Authenticated requests served from the user cache")
+        self._misses = metrics.counter("user_cache_misses_total", "Authenticated requests that had to load the user")
+        self._evictions = metrics.counter("user_cache_evictions_total", "Entries dropped to stay under the size cap")
+        metrics.gauge("user_cache_size", "Cached user snapshots", lambda: len(self._entries))
+        metrics.gauge("user_cache_hit_rate", "Hits / lookups since process start", self.hit_rate)
+
+    def hit_rate(self) -> float:
+        lookups = self._hits.value + self._misses.value
+        return self._hits.value / lookups if lookups else 0.0
+
+    def get(self, user_id: int) -> Optional[UserSnapshot]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            self._misses.inc()
+            return None
+        expires_at, snapshot = entry
+        if expires_at <= time.monotonic():
+            del self._entries[user_id]
+            self._misses.inc()
+            return None
+        self._entries.move_to_end(user_id)
+        self._hits.inc()
+        return snapshot
+
+    def set(self, snapshot: UserSnapshot) -> None:
+        self._entries[snapshot.id] = (time.monotonic() + self.ttl, snapshot)
+        self._entries.move_to_end(snapshot.id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self._evictions.inc()
+
+    def invalidate(self, user_id: int) -> None:
+        self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+user_cache = UserCache()
@@ -0,0 +1,40 @@
+"""
+Per-request database time.
+
+Cursor executions on every engine are timed and added to the running total
+opened by track_db_time(), if any. The async engine runs its sync core in the
+caller's contextvars context, so the total follows the request across awaits.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_request_db_seconds: ContextVar[Optional[List[float]]] = ContextVar("request_db_seconds", default=None)
+
+
+@contextmanager
+def track_db_time() -> Iterator[List[float]]:
+    """Yields a one-element list holding the seconds spent in the database so far."""
+    total = [0.0]
+    token = _request_db_seconds.set(total)
+    try:
+        yield total
+    finally:
+        _request_db_seconds.reset(token)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _request_db_seconds.get() is not None:
+        conn.info["query_started_at"] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started_at = conn.info.pop("query_started_at", None)
+    total = _request_db_seconds.get()
+    if started_at is not None and total is not None:
+        total[0] += time.perf_counter() - started_at
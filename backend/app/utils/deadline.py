@@ -0,0 +1,59 @@
+"""
+Per-request deadlines.
+
+RequestDeadlineMiddleware opens a deadline for every request; anything further
+in (admission queueing, the database layer) reads the budget left with
+remaining(). Like track_db_time(), the deadline lives in a contextvar, so it
+follows the request across awaits and into SQLAlchemy's sync event hooks.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+
+class Deadline:
+    __slots__ = ("at", "server_side")
+
+    def __init__(self, seconds: float, server_side: bool = False):
+        # On the time.monotonic() clock; None once disarmed
+        self.at: Optional[float] = time.monotonic() + seconds
+        # Also enforced by Postgres as statement_timeout/lock_timeout (see app/database.py)
+        self.server_side = server_side
+
+    def disarm(self) -> None:
+        """Lift the deadline, e.g. for background tasks that run after the response is sent.
+
+        Mutated in place rather than reset in the contextvar, so tasks that copied
+        the context (streaming responses send from one) see it too.
+        """
+        self.at = None
+
+
+_request_deadline: ContextVar[Optional[Deadline]] = ContextVar("request_deadline", default=None)
+
+
+@contextmanager
+def request_deadline(seconds: float, server_side: bool = False) -> Iterator[Deadline]:
+    deadline = Deadline(seconds, server_side)
+    token = _request_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _request_deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current request's deadline (may be negative), or None without one."""
+    deadline = _request_deadline.get()
+    if deadline is None or deadline.at is None:
+        return None
+    return deadline.at - time.monotonic()
+
+
+def server_side_remaining() -> Optional[float]:
+    """Like remaining(), but None unless the deadline is also to be enforced by Postgres."""
+    deadline = _request_deadline.get()
+    if deadline is None or deadline.at is None or not deadline.server_side:
+        return None
+    return deadline.at - time.monotonic()
@@ -0,0 +1,93 @@
+"""
+Connection pool instrumentation.
+
+Hooks SQLAlchemy pool events (and a thin pool subclass for the one thing there
+is no event for: how long a checkout waits) into the metrics registry, so pool
+size and overflow can be chosen from data instead of guessed. Everything is
+reported under a per-engine prefix, e.g. db_pool_checkout_seconds.
+"""
+import time
+from sqlalchemy import event, exc
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from app.utils.metrics import metrics
+
+CONNECTION_AGE_BUCKETS = (1, 10, 60, 300, 600, 1800, 3600, 7200, 21600)
+
+
+class InstrumentedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that times every checkout, including queue wait and pre-ping."""
+
+    _checkout_seconds = None
+    _checkout_timeouts = None
+
+    def connect(self):
+        if self._checkout_seconds is None:
+            return super().connect()
+        started_at = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            self._checkout_timeouts.inc()
+            raise
+        finally:
+            self._checkout_seconds.observe(time.perf_counter() - started_at)
+
+    def recreate(self):
+        # engine.dispose() swaps in a fresh pool; keep reporting into the same metrics
+        pool = super().recreate()
+        pool._checkout_seconds = self._checkout_seconds
+        pool._checkout_timeouts = self._checkout_timeouts
+        return pool
+
+
+def instrument_engine(engine: AsyncEngine, prefix: str) -> None:
+    sync_engine = engine.sync_engine
+    pool = sync_engine.pool
+    if isinstance(pool, InstrumentedAsyncQueuePool):
+        pool._checkout_seconds = metrics.histogram(f"{prefix}_checkout_seconds", "Time to check out a connection, including queue wait and pre-ping")
+        pool._checkout_timeouts = metrics.counter(f"{prefix}_checkout_timeouts_total", "Checkouts that gave up after pool_timeout")
+
+    # Read the current pool on every scrape: dispose() replaces it
+    metrics.gauge(f"{prefix}_size", "Configured pool size", lambda: sync_engine.pool.size())
+    metrics.gauge(f"{prefix}_checked_out", "Connections currently in use", lambda: sync_engine.pool.checkedout())
+    metrics.gauge(f"{prefix}_checked_in", "Idle connections in the pool", lambda: sync_engine.pool.checkedin())
+    metrics.gauge(f"{prefix}_overflow", "Connections open beyond pool_size (negative: unused capacity)", lambda: sync_engine.pool.overflow())
+
+    connects = metrics.counter(f"{prefix}_connects_total", "New database connections opened")
+    invalidations = metrics.counter(f"{prefix}_invalidations_total", "Connections invalidated (disconnects, failed pre-pings)")
+    connection_age = metrics.histogram(f"{prefix}_connection_age_seconds", "Lifetime of connections when they are closed", CONNECTION_AGE_BUCKETS)
+    ping_seconds = metrics.histogram(f"{prefix}_pre_ping_seconds", "Round trip of the pool_pre_ping liveness check")
+    ping_failures = metrics.counter(f"{prefix}_pre_ping_failures_total", "Pre-pings that found a dead connection")
+
+    @event.listens_for(sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        connects.inc()
+        connection_record.info["connected_at"] = time.monotonic()
+
+    @event.listens_for(sync_engine, "close")
+    def _on_close(dbapi_connection, connection_record):
+        connected_at = connection_record.info.pop("connected_at", None)
+        if connected_at is not None:
+            connection_age.observe(time.monotonic() - connected_at)
+
+    @event.listens_for(sync_engine, "invalidate")
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        invalidations.inc()
+
+    # There is no pre-ping event; time the dialect's ping for this engine only
+    dialect = sync_engine.dialect
+    do_ping = dialect.do_ping
+
+    def timed_ping(dbapi_connection):
+        started_at = time.perf_counter()
+        alive = False
+        try:
+            alive = do_ping(dbapi_connection)
+            return alive
+        finally:
+            ping_seconds.observe(time.perf_counter() - started_at)
+            if not alive:
+                ping_failures.inc()
+
+    dialect.do_ping = timed_ping
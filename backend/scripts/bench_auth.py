@@ -0,0 +1,79 @@
+"""
+Per-request cost of authenticating an access token.
+
+Before the authentication middleware every protected request verified the JWT
+(HMAC and JSON parsing through python-jose), and routes that needed both the
+user and the user id did it twice. Now the middleware verifies each token once
+and later requests with the same token are answered from the verified-token
+LRU. Times the token handling alone, from the raw request scope to the
+principal. Needs the app's environment (.env), like the app itself.
+
+    cd backend
+    python -m scripts.bench_auth --requests 20000
+"""
+import argparse
+import logging
+import time
+from typing import Callable
+from fastapi import Request
+from app.middleware.auth import authenticate_token, extract_access_token
+from app.services.auth import create_access_token, decode_access_token_claims
+from app.services.token_cache import verified_token_cache
+
+
+def scope(token: str) -> dict:
+    return {
+        "type": "http",
+        "method": "GET",
+        "path": "/blog/my-blogs",
+        "headers": [(b"cookie", f"access_token={token}".encode()), (b"user-agent", b"Mozilla/5.0")],
+    }
+
+
+def per_request_us(requests: int, handle: Callable[[dict], object], token: str) -> float:
+    for _ in range(min(requests, 1000)):
+        handle(scope(token))
+    started_at = time.perf_counter()
+    for _ in range(requests):
+        handle(scope(token))
+    return (time.perf_counter() - started_at) / requests * 1e6
+
+
+def decode_each_time(times: int) -> Callable[[dict], object]:
+    def handle(request_scope: dict) -> object:
+        for _ in range(times):
+            claims = decode_access_token_claims(extract_access_token(Request(request_scope)))
+        return claims
+    return handle
+
+
+def middleware(request_scope: dict) -> object:
+    return authenticate_token(extract_access_token(Request(request_scope)))
+
+
+def middleware_cold(request_scope: dict) -> object:
+    verified_token_cache.discard(extract_access_token(Request(request_scope)))
+    return middleware(request_scope)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--log-level", default="WARNING", help="App log level during the run; at DEBUG (the app's default) every decode also logs")
+    args = parser.parse_args()
+    logging.getLogger("app").setLevel(args.log_level)
+
+    token = create_access_token(42)
+    before_once = per_request_us(args.requests, decode_each_time(1), token)
+    before_twice = per_request_us(args.requests, decode_each_time(2), token)
+    after_miss = per_request_us(args.requests, middleware_cold, token)
+    after_hit = per_request_us(args.requests, middleware, token)
+
+    print(f"before, verified once per request:   {before_once:>7.1f} us")
+    print(f"before, verified twice per request:  {before_twice:>7.1f} us")
+    print(f"after, first request with a token:   {after_miss:>7.1f} us")
+    print(f"after, token already verified:       {after_hit:>7.1f} us  ({before_once / after_hit:.0f}x less than once)")
+
+
+if __name__ == "__main__":
+    main()
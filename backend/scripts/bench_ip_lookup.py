@@ -0,0 +1,70 @@
+"""
+Microbenchmark for the bot blocker's CIDR table.
+
+Builds a table from N random prefixes (IPv4 /8-/32 and IPv6 /16-/64, the
+shape of cloud-provider and ASN lists) and times lookups of random addresses,
+from the string form the middleware sees and from packed bytes. Needs the
+app's environment (.env), like the app itself.
+
+    cd backend
+    python -m scripts.bench_ip_lookup --prefixes 100000
+"""
+import argparse
+import ipaddress
+import random
+import socket
+import time
+import tracemalloc
+from app.middleware.ip_filter import CIDRTable, DENY, ALLOW
+
+
+def random_prefixes(rng: random.Random, count: int, ipv6_share: float):
+    for _ in range(count):
+        if rng.random() < ipv6_share:
+            network = ipaddress.IPv6Network((rng.getrandbits(128), rng.randint(16, 64)), strict=False)
+        else:
+            network = ipaddress.IPv4Network((rng.getrandbits(32), rng.randint(8, 32)), strict=False)
+        yield network, DENY if rng.random() < 0.9 else ALLOW
+
+
+def bench(name: str, lookup, addresses) -> None:
+    started_at = time.perf_counter()
+    for address in addresses:
+        lookup(address)
+    elapsed = time.perf_counter() - started_at
+    print(f"{name:<28} {elapsed / len(addresses) * 1e9:>6.0f} ns/lookup")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prefixes", type=int, default=100_000)
+    parser.add_argument("--lookups", type=int, default=1_000_000)
+    parser.add_argument("--ipv6-share", type=float, default=0.2)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    prefixes = list(random_prefixes(rng, args.prefixes, args.ipv6_share))
+    tracemalloc.start()
+    started_at = time.perf_counter()
+    table = CIDRTable.build(prefixes)
+    build_seconds = time.perf_counter() - started_at
+    table_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"{table.size} prefixes: built in {build_seconds:.2f} s, {table_bytes / 2**20:.1f} MiB")
+
+    # Half the probes fall inside a listed prefix, half are random
+    ipv4 = [str(ipaddress.IPv4Address(rng.getrandbits(32))) for _ in range(args.lookups // 2)]
+    ipv4 += [str(network.network_address + rng.randrange(min(network.num_addresses, 2**32)))
+             for network, _ in rng.choices(prefixes, k=args.lookups // 2) if network.version == 4]
+    ipv6 = [str(network.network_address + rng.randrange(min(network.num_addresses, 2**32)))
+            for network, _ in rng.choices(prefixes, k=args.lookups // 4) if network.version == 6]
+    rng.shuffle(ipv4)
+
+    bench("IPv4 lookup(str)", table.lookup, ipv4)
+    bench("IPv4 lookup_packed(bytes)", table.lookup_packed, [socket.inet_pton(socket.AF_INET, ip) for ip in ipv4])
+    bench("IPv6 lookup(str)", table.lookup, ipv6)
+    bench("IPv6 lookup_packed(bytes)", table.lookup_packed, [socket.inet_pton(socket.AF_INET6, ip) for ip in ipv6])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Throughput and latency of the full middleware stack.
+
+Drives the app in-process over raw ASGI (no server, no sockets) with GET
+/health, first one request at a time, then 100 concurrent, so the numbers
+reflect middleware and routing overhead only. Rate limits are disabled for
+the run. Needs the app's environment (.env), like the app itself.
+
+    cd backend
+    python -m scripts.bench_middleware_stack --requests 5000
+"""
+import argparse
+import asyncio
+import time
+from app.main import app
+from app.middleware.rate_limiter import limiter
+
+SCOPE = {
+    "type": "http",
+    "asgi": {"version": "3.0"},
+    "http_version": "1.1",
+    "method": "GET",
+    "scheme": "http",
+    "path": "/health",
+    "raw_path": b"/health",
+    "query_string": b"",
+    "root_path": "",
+    "headers": [(b"host", b"bench"), (b"user-agent", b"Mozilla/5.0 (X11; Linux x86_64) Chrome/120.0")],
+    "client": ("10.1.2.3", 40000),
+    "server": ("bench", 80),
+}
+
+
+async def request() -> None:
+    received = False
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # Nothing more to read; only a disconnect would come
+        await asyncio.Event().wait()
+
+    async def send(message):
+        pass
+
+    await app(dict(SCOPE), receive, send)
+
+
+async def run(requests: int, concurrency: int) -> None:
+    for _ in range(500):
+        await request()
+
+    latencies = []
+    started_at = time.perf_counter()
+    for _ in range(requests):
+        request_started_at = time.perf_counter()
+        await request()
+        latencies.append(time.perf_counter() - request_started_at)
+    sequential = requests / (time.perf_counter() - started_at)
+    latencies.sort()
+
+    started_at = time.perf_counter()
+    for _ in range(requests // concurrency):
+        await asyncio.gather(*(request() for _ in range(concurrency)))
+    concurrent = requests // concurrency * concurrency / (time.perf_counter() - started_at)
+
+    print(f"sequential:   {sequential:>8,.0f} req/s  p50 {latencies[len(latencies) // 2] * 1e6:.0f} us  p99 {latencies[int(len(latencies) * 0.99)] * 1e6:.0f} us")
+    print(f"{concurrency} concurrent: {concurrent:>8,.0f} req/s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    args = parser.parse_args()
+    limiter.enabled = False
+    asyncio.run(run(args.requests, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Password hashing calibration table for this machine.
+
+Times one hash at increasing costs, the way startup calibration does (see
+app/services/hasher.py), and reports the largest cost that fits the budget.
+Does not need the app's environment.
+
+    cd backend
+    python -m scripts.bench_password_hashing --target-ms 250
+"""
+import argparse
+from app.services.hasher import HASHERS, benchmark
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scheme", default="bcrypt", choices=sorted(HASHERS))
+    parser.add_argument("--target-ms", type=float, default=250.0)
+    parser.add_argument("--min-cost", type=int, default=4)
+    parser.add_argument("--max-cost", type=int, default=16)
+    parser.add_argument("--samples", type=int, default=3)
+    args = parser.parse_args()
+
+    hasher_cls = HASHERS[args.scheme]
+    print(f"{'cost':>4}  {'ms/hash':>9}  fits")
+    chosen = None
+    for cost in range(max(args.min_cost, hasher_cls.min_cost), min(args.max_cost, hasher_cls.max_cost) + 1):
+        elapsed_ms = benchmark(hasher_cls(cost), args.samples)
+        fits = elapsed_ms <= args.target_ms
+        if fits:
+            chosen = cost
+        print(f"{cost:>4}  {elapsed_ms:>9.1f}  {'yes' if fits else 'no'}")
+        if elapsed_ms > args.target_ms * 4:
+            break
+    print(f"\nselected cost for {args.target_ms:.0f}ms budget: {chosen if chosen is not None else 'none (use the minimum)'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Stress benchmark for the bounded rate limit storage.
+
+Hits one limit with N distinct keys (a scraper rotating source addresses) and
+prints resident memory as it goes. With bounded-memory:// RSS levels off once
+the key cap is reached; with memory:// it keeps growing.
+
+    cd backend
+    python -m scripts.bench_rate_limit_storage --keys 10000000
+    python -m scripts.bench_rate_limit_storage --keys 2000000 --storage memory://
+"""
+import argparse
+import gc
+import resource
+import time
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import STRATEGIES
+from app.middleware.rate_limit_storage import BoundedMemoryStorage  # noqa: F401 (registers bounded-memory://)
+
+
+def rss_mib() -> float:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize() / 2**20
+    except OSError:
+        # Peak rather than current, but still shows whether memory levels off
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keys", type=int, default=10_000_000)
+    parser.add_argument("--storage", default="bounded-memory://?max_keys=100000")
+    parser.add_argument("--strategy", default="moving-window", choices=sorted(STRATEGIES))
+    parser.add_argument("--limit", default="300/hour")
+    parser.add_argument("--reports", type=int, default=10)
+    args = parser.parse_args()
+
+    storage = storage_from_string(args.storage)
+    limiter = STRATEGIES[args.strategy](storage)
+    item = parse(args.limit)
+    step = max(1, args.keys // args.reports)
+
+    gc.collect()
+    print(f"storage={args.storage} strategy={args.strategy} limit={args.limit}")
+    print(f"{'keys':>12} {'rss MiB':>10} {'held':>10} {'us/hit':>8}")
+    print(f"{0:>12} {rss_mib():>10.1f} {0:>10} {'':>8}")
+    started_at = time.perf_counter()
+    for start in range(0, args.keys, step):
+        for i in range(start, min(start + step, args.keys)):
+            limiter.hit(item, f"ip:{i >> 24 & 255}.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}")
+        elapsed = time.perf_counter() - started_at
+        done = min(start + step, args.keys)
+        held = len(storage) if hasattr(storage, "__len__") else "-"
+        print(f"{done:>12} {rss_mib():>10.1f} {held:>10} {elapsed / done * 1e6:>8.2f}")
+    # memory:// expires events from a timer thread; do not wait for it
+    if hasattr(storage, "timer"):
+        storage.timer.cancel()
+
+
+if __name__ == "__main__":
+    main()
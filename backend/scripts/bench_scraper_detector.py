@@ -0,0 +1,75 @@
+"""
+Simulation benchmark for the scraper detector.
+
+Replays an hour of synthetic traffic through a ScraperDetector on a simulated
+clock: readers from random addresses fetching a few popular blogs, one fast
+scraper on a single IP, and one slow scraper spread over a /24 (each address
+well under the per-IP rate limits). With --uniform-readers, readers spread over
+the whole site instead, so the shared browser user agent alone is broader than
+SCRAPER_BREADTH_PER_USER_AGENT. Prints when each scraper is escalated,
+whether any reader was, the time per request, and resident memory as the
+number of distinct clients grows. Needs the app's environment (.env), like the
+app itself.
+
+    cd backend
+    python -m scripts.bench_scraper_detector --requests 1000000
+"""
+import argparse
+import random
+import time
+from app.middleware.scraper_detector import BLOCKED, NORMAL, SUSPECT, ScraperDetector, client_keys
+from scripts.bench_rate_limit_storage import rss_mib
+
+LEVELS = {NORMAL: "normal", SUSPECT: "suspect", BLOCKED: "blocked"}
+BROWSER = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1_000_000)
+    parser.add_argument("--duration", type=float, default=3600, help="simulated seconds")
+    parser.add_argument("--blogs", type=int, default=50_000)
+    parser.add_argument("--scraper-share", type=float, default=0.004, help="share of requests from each scraper")
+    parser.add_argument("--uniform-readers", action="store_true", help="readers fetch any blog, not mostly the popular ones")
+    parser.add_argument("--reports", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    detector = ScraperDetector()
+    started = time.time()
+    first_seen = {}
+    reader_levels = {NORMAL: 0, SUSPECT: 0, BLOCKED: 0}
+    fast_scraper, slow_scraper = iter(range(args.blogs)), iter(range(args.blogs))
+    elapsed = 0.0
+
+    for i in range(args.requests):
+        now = started + args.duration * i / args.requests
+        draw = rng.random()
+        if draw < args.scraper_share:
+            actor, ip, blog = "fast scraper", "198.51.100.7", next(fast_scraper)
+        elif draw < 2 * args.scraper_share:
+            actor, ip, blog = "slow scraper", f"203.0.113.{rng.randrange(256)}", next(slow_scraper)
+        else:
+            # Readers: mostly the popular blogs, from anywhere
+            actor, ip = "reader", f"{rng.randrange(1, 224)}.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}"
+            blog = rng.randrange(args.blogs) if args.uniform_readers else int(rng.paretovariate(1.2)) % args.blogs
+        keys = client_keys(ip, BROWSER)
+
+        tick = time.perf_counter()
+        detector.observe(keys, str(blog), now)
+        level = detector.level(keys, now)
+        elapsed += time.perf_counter() - tick
+
+        if actor == "reader":
+            reader_levels[level] += 1
+        elif level != NORMAL and (actor, level) not in first_seen:
+            first_seen[actor, level] = now - started
+            print(f"{actor} {LEVELS[level]} after {now - started:.0f}s")
+        if (i + 1) % (args.requests // args.reports) == 0:
+            print(f"{i + 1:>10} requests  {elapsed / (i + 1) * 1e6:5.1f} us/request  RSS {rss_mib():6.1f} MiB")
+
+    print(f"reader requests by level: { {LEVELS[level]: count for level, count in reader_levels.items()} }")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Email delivery throughput: one SMTP session per message vs the pooled sessions.
+
+Starts a local aiosmtpd sink and sends the same messages twice: first with a
+fresh connection per message (what the service did before the pool), then in
+outbox-sized batches through SMTPConnectionPool. The sink has no TLS or AUTH,
+so --connect-delay-ms stands in for their cost on a real server (it is spent
+once per session, in EHLO). Needs aiosmtpd (requirements-dev.txt).
+
+    cd backend
+    python -m scripts.bench_smtp_pool --messages 500
+    python -m scripts.bench_smtp_pool --messages 500 --connect-delay-ms 0
+"""
+import argparse
+import asyncio
+import socket
+import time
+from email.message import EmailMessage
+import aiosmtplib
+from aiosmtpd.controller import Controller
+from app.services.smtp_pool import SMTPConnectionPool
+
+
+class Sink:
+    def __init__(self, connect_delay: float):
+        self.connect_delay = connect_delay
+        self.received = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        await asyncio.sleep(self.connect_delay)
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return "250 Message accepted"
+
+
+def message(index: int) -> EmailMessage:
+    email = EmailMessage()
+    email["From"] = "bench@example.com"
+    email["To"] = f"user{index}@example.com"
+    email["Subject"] = "Verify Your Email"
+    email.set_content(f"<p>https://example.com/verify-email?token={index:036d}</p>", subtype="html")
+    return email
+
+
+async def per_message(port: int, messages: int, concurrency: int) -> float:
+    slots = asyncio.Semaphore(concurrency)
+
+    async def send(index: int) -> None:
+        async with slots:
+            await aiosmtplib.send(message(index), hostname="127.0.0.1", port=port, start_tls=False)
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(send(index) for index in range(messages)))
+    return messages / (time.perf_counter() - started_at)
+
+
+async def pooled(port: int, messages: int, pool_size: int, batch_size: int) -> float:
+    pool = SMTPConnectionPool(hostname="127.0.0.1", port=port, start_tls=False, max_size=pool_size)
+    started_at = time.perf_counter()
+    for first in range(0, messages, batch_size):
+        results = await pool.send_batch([message(index) for index in range(first, min(first + batch_size, messages))])
+        assert all(result is None for result in results), results
+    rate = messages / (time.perf_counter() - started_at)
+    await pool.close()
+    return rate
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--pool-size", type=int, default=2, help="SMTP_POOL_SIZE; also the per-message concurrency")
+    parser.add_argument("--batch-size", type=int, default=20, help="EMAIL_OUTBOX_BATCH_SIZE")
+    parser.add_argument("--connect-delay-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    # aiosmtpd cannot listen on port 0; take a free one from the OS
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    sink = Sink(args.connect_delay_ms / 1000)
+    controller = Controller(sink, hostname="127.0.0.1", port=port)
+    controller.start()
+    try:
+        before = asyncio.run(per_message(port, args.messages, args.pool_size))
+        after = asyncio.run(pooled(port, args.messages, args.pool_size, args.batch_size))
+    finally:
+        controller.stop()
+
+    print(f"connection per message: {before:>8,.0f} msg/s")
+    print(f"pooled sessions:        {after:>8,.0f} msg/s  ({after / before:.1f}x)")
+    print(f"sink received {sink.received} of {2 * args.messages}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Per-query latency of the hottest queries under each DB_POOLER_MODE.
+
+Runs the app's own statements for the user lookup, the blog-by-slug page and
+the refresh token lookup over a single connection to DATABASE_URL, once with
+the transaction-mode connect arguments (no statement cache, every query parsed
+and planned again) and once with direct mode's statement cache. Prints the
+median and p99 per query. Point DATABASE_URL at Postgres itself, not at a pooler.
+
+    cd backend
+    python -m scripts.bench_statement_cache --queries 3000
+"""
+import argparse
+import asyncio
+import hashlib
+import time
+from typing import Dict, List
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine
+from app.database import database_url, pooler_connect_args
+from app.models.blog import Blog
+from app.models.user import RefreshToken, User
+
+MODES = ["transaction", "direct"]
+
+QUERIES = {
+    "user by id": lambda: select(User).where(User.id == 1),
+    "blog by slug": lambda: select(Blog).where(Blog.slug == "hello-world"),
+    "refresh token lookup": lambda: select(RefreshToken.user_id).where(
+        RefreshToken.token_hash == hashlib.sha256(b"bench").digest(),
+        RefreshToken.revoked == False,
+    ),
+}
+
+
+async def measure(mode: str, queries: int) -> Dict[str, List[float]]:
+    engine = create_async_engine(database_url, pool_size=1, max_overflow=0, connect_args=pooler_connect_args(mode))
+    timings: Dict[str, List[float]] = {}
+    try:
+        async with engine.connect() as connection:
+            for name, statement in QUERIES.items():
+                for _ in range(100):
+                    await connection.execute(statement())
+                samples = []
+                for _ in range(queries):
+                    started_at = time.perf_counter()
+                    await connection.execute(statement())
+                    samples.append(time.perf_counter() - started_at)
+                timings[name] = sorted(samples)
+    finally:
+        await engine.dispose()
+    return timings
+
+
+async def run(queries: int) -> None:
+    results = {mode: await measure(mode, queries) for mode in MODES}
+    print(f"{'median / p99 per query':<24}" + "".join(f"{mode:>22}" for mode in MODES))
+    for name in QUERIES:
+        cells = []
+        for mode in MODES:
+            samples = results[mode][name]
+            cells.append(f"{samples[len(samples) // 2] * 1e6:>9.0f} / {samples[int(len(samples) * 0.99)] * 1e6:>6.0f} us")
+        print(f"{name:<24}" + "".join(f"{cell:>22}" for cell in cells))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=3000)
+    args = parser.parse_args()
+    asyncio.run(run(args.queries))
+
+
+if __name__ == "__main__":
+    main()
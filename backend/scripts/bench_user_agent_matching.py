@@ -0,0 +1,62 @@
+"""
+Microbenchmark for user-agent classification in the bot blocker.
+
+Compares the previous per-pattern re.search loop with the single combined
+regex, with and without the verdict cache, over a mix of browser and bot
+user agents. Needs the app's environment (.env), like the app itself.
+
+    cd backend
+    python -m scripts.bench_user_agent_matching --calls 1000000
+"""
+import argparse
+import random
+import re
+import time
+from app.middleware.bot_blocker import AI_BOT_PATTERNS, UserAgentClassifier
+
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{v}.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.{v} Safari/605.1.15",
+    "Mozilla/5.0 (X11; Linux x86_64; rv:{v}.0) Gecko/20100101 Firefox/{v}.0",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_{v} like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148",
+    "Mozilla/5.0 AppleWebKit/537.36 (KHTML, like Gecko; compatible; GPTBot/1.{v}; +https://openai.com/gptbot)",
+    "CCBot/2.{v} (https://commoncrawl.org/faq/)",
+]
+
+
+def legacy_is_ai_bot(user_agent: str) -> bool:
+    if not user_agent:
+        return False
+    user_agent_lower = user_agent.lower()
+    for pattern in AI_BOT_PATTERNS:
+        if re.search(pattern, user_agent_lower, re.IGNORECASE):
+            return True
+    return False
+
+
+def bench(name: str, classify, sample) -> None:
+    started_at = time.perf_counter()
+    bots = sum(map(classify, sample))
+    elapsed = time.perf_counter() - started_at
+    print(f"{name:<24} {len(sample) / elapsed:>12,.0f} UA/s {elapsed / len(sample) * 1e9:>8.0f} ns/UA  bots={bots}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=1_000_000)
+    parser.add_argument("--distinct", type=int, default=200, help="distinct user agents in the traffic mix")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    corpus = [rng.choice(USER_AGENTS).format(v=rng.randrange(60, 130)) + f" r{i}" for i in range(args.distinct)]
+    sample = [rng.choice(corpus) for _ in range(args.calls)]
+
+    classifier = UserAgentClassifier(patterns_file="")
+    regex = classifier._regex
+    bench("per-pattern re.search", legacy_is_ai_bot, sample)
+    bench("combined regex", lambda user_agent: regex.search(user_agent.lower()) is not None, sample)
+    bench("combined regex + cache", classifier.is_bot, sample)
+
+
+if __name__ == "__main__":
+    main()
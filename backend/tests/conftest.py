@@ -0,0 +1,96 @@
+"""
+Shared fixtures.
+
+The tests run against the Postgres database in DATABASE_URL, migrated with
+`alembic upgrade head`; they are skipped when it cannot be reached. Async tests
+use the anyio plugin (`@pytest.mark.anyio`).
+"""
+import asyncio
+import os
+import uuid
+
+# Settings are read at import time; only fill in what a test run does not care about
+os.environ.setdefault("DATABASE_URL", "postgresql://postgres@localhost:5432/blogydb")
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("MAIL_USERNAME", "test@example.com")
+os.environ.setdefault("MAIL_PASSWORD", "test")
+os.environ.setdefault("MAIL_FROM", "test@example.com")
+os.environ.setdefault("MAIL_SERVER", "localhost")
+os.environ.setdefault("PASSWORD_HASH_ROUNDS", "4")
+
+import asyncpg
+import httpx
+import pytest
+from sqlalchemy import delete, event
+from app.database import async_session, engine
+from app.main import app
+from app.middleware.rate_limiter import limiter
+from app.models.user import User
+
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+def database(anyio_backend):
+    async def reachable() -> bool:
+        dsn = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        try:
+            connection = await asyncpg.connect(dsn, timeout=5)
+        except (OSError, asyncpg.PostgresError):
+            return False
+        await connection.close()
+        return True
+
+    if not asyncio.run(reachable()):
+        pytest.skip(f"Postgres not reachable at {engine.url!r}")
+
+
+@pytest.fixture
+async def db(database):
+    """A read-write session on the primary; the pool is disposed afterwards so no connection outlives the test's event loop."""
+    async with async_session() as session:
+        yield session
+    await engine.dispose()
+
+
+@pytest.fixture
+async def user(db):
+    """A verified user with a throwaway email, deleted (with its tokens) after the test."""
+    email = f"test-{uuid.uuid4().hex[:12]}@example.com"
+    async with async_session() as session:
+        new_user = User(email=email, hashed_password="x", is_verified=True)
+        session.add(new_user)
+        await session.commit()
+    yield new_user
+    async with async_session() as session:
+        await session.execute(delete(User).where(User.id == new_user.id))
+        await session.commit()
+
+
+@pytest.fixture
+def queries():
+    """Statements sent to the primary while the test runs."""
+    statements = []
+
+    def record(connection, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", record)
+    yield statements
+    event.remove(engine.sync_engine, "before_cursor_execute", record)
+
+
+@pytest.fixture
+async def client(db):
+    """HTTP client for the app, on the test's event loop. Rate limits are off; lifespan
+    (and with it the background workers) is not run."""
+    limiter.enabled = False
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="https://testserver") as http_client:
+            yield http_client
+    finally:
+        limiter.enabled = True
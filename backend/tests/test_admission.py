@@ -0,0 +1,126 @@
+import asyncio
+import pytest
+from app.middleware.admission import BULK, CRITICAL, NORMAL, AdmissionController, AdmissionPolicy
+
+pytestmark = pytest.mark.anyio
+
+
+def controller(**options) -> AdmissionController:
+    options = {"max_concurrent": 2, "max_queue": 10, "queue_timeout": 2.0, "critical_reserve": 0, "bulk_share": 1.0, **options}
+    return AdmissionController(**options)
+
+
+async def queued(controller: AdmissionController, policy: AdmissionPolicy, route: str = "/route") -> asyncio.Task:
+    """Start an acquire() and let it reach the queue."""
+    task = asyncio.create_task(controller.acquire(route, policy))
+    await asyncio.sleep(0)
+    assert not task.done()
+    return task
+
+
+async def test_free_slots_go_to_the_highest_class_first():
+    admission = controller()
+    for _ in range(2):
+        assert await admission.acquire("/busy", AdmissionPolicy(NORMAL))
+    bulk = await queued(admission, AdmissionPolicy(BULK))
+    normal = await queued(admission, AdmissionPolicy(NORMAL))
+    critical = await queued(admission, AdmissionPolicy(CRITICAL))
+
+    admission.release(NORMAL, "/busy")
+    assert await critical and not normal.done() and not bulk.done()
+    admission.release(NORMAL, "/busy")
+    assert await normal and not bulk.done()
+    admission.release(CRITICAL, "/route")
+    assert await bulk
+    assert admission.in_flight == 2
+
+
+async def test_the_critical_reserve_and_bulk_share_hold_back_lower_classes():
+    admission = controller(max_concurrent=4, critical_reserve=1, bulk_share=0.5)
+    assert await admission.acquire("/scan", AdmissionPolicy(BULK))
+    assert await admission.acquire("/scan", AdmissionPolicy(BULK))
+    # Bulk holds its share (2 of 4) although a slot is free
+    bulk = await queued(admission, AdmissionPolicy(BULK))
+    # Normal gets that slot, but not the reserved one
+    assert await admission.acquire("/page", AdmissionPolicy(NORMAL))
+    normal = await queued(admission, AdmissionPolicy(NORMAL))
+    assert await admission.acquire("/login", AdmissionPolicy(CRITICAL))
+
+    # A freed slot that only critical may use stays free
+    admission.release(BULK, "/scan")
+    assert not bulk.done() and not normal.done()
+    admission.release(CRITICAL, "/login")
+    assert await normal and not bulk.done()
+    admission.release(NORMAL, "/page")
+    assert await bulk
+
+
+async def test_a_queued_request_is_shed_after_the_queue_timeout():
+    admission = controller(max_concurrent=1, queue_timeout=0.05)
+    assert await admission.acquire("/busy", AdmissionPolicy(NORMAL))
+
+    assert not await admission.acquire("/route", AdmissionPolicy(NORMAL))
+    assert admission.in_flight == 1
+    assert not admission._queues[NORMAL]
+
+
+async def test_a_full_queue_sheds_at_once():
+    admission = controller(max_concurrent=1, max_queue=1)
+    assert await admission.acquire("/busy", AdmissionPolicy(NORMAL))
+    waiting = await queued(admission, AdmissionPolicy(NORMAL))
+
+    assert not await admission.acquire("/route", AdmissionPolicy(NORMAL))
+    # Other classes have queues of their own
+    critical = await queued(admission, AdmissionPolicy(CRITICAL))
+    admission.release(NORMAL, "/busy")
+    assert await critical
+    admission.release(CRITICAL, "/route")
+    assert await waiting
+
+
+async def test_a_request_cancelled_while_queued_leaves_no_trace():
+    admission = controller(max_concurrent=1)
+    assert await admission.acquire("/busy", AdmissionPolicy(NORMAL))
+    task = await queued(admission, AdmissionPolicy(NORMAL, max_concurrent=1))
+
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert not admission._queues[NORMAL]
+    admission.release(NORMAL, "/busy")
+    assert admission.in_flight == 0
+    assert admission._route_in_flight == {}
+
+
+async def test_a_slot_handed_to_a_cancelled_request_is_given_back():
+    admission = controller(max_concurrent=1)
+    assert await admission.acquire("/busy", AdmissionPolicy(NORMAL))
+    task = await queued(admission, AdmissionPolicy(NORMAL, max_concurrent=1))
+
+    # The slot is handed over, but the client goes away before the request resumes
+    admission.release(NORMAL, "/busy")
+    task.cancel()
+    try:
+        # On Python < 3.12 wait_for may return the result and swallow the cancel; the caller then releases
+        if await task:
+            admission.release(NORMAL, "/route")
+    except asyncio.CancelledError:
+        pass
+    assert admission.in_flight == 0
+    assert admission._route_in_flight == {}
+    assert await admission.acquire("/route", AdmissionPolicy(NORMAL, max_concurrent=1))
+
+
+async def test_a_route_cap_does_not_hold_back_its_class():
+    admission = controller(max_concurrent=3)
+    capped = AdmissionPolicy(BULK, max_concurrent=1)
+    assert await admission.acquire("/analytics", capped)
+    assert await admission.acquire("/busy", AdmissionPolicy(NORMAL))
+    assert await admission.acquire("/busy", AdmissionPolicy(NORMAL))
+    held_back = await queued(admission, capped, route="/analytics")
+    other = await queued(admission, AdmissionPolicy(BULK), route="/list")
+
+    admission.release(NORMAL, "/busy")
+    assert await other and not held_back.done()
+    admission.release(BULK, "/analytics")
+    assert await held_back
@@ -0,0 +1,63 @@
+import re
+import uuid
+import pytest
+from sqlalchemy import delete, select
+from app.models.email_outbox import EmailOutbox
+from app.models.user import User
+
+pytestmark = pytest.mark.anyio
+
+MAX_QUERIES = 2
+
+
+async def emailed_token(db, email, path):
+    result = await db.execute(
+        select(EmailOutbox.body).where(EmailOutbox.recipient == email).order_by(EmailOutbox.id.desc()).limit(1)
+    )
+    return re.search(rf"{path}\?token=([0-9a-f-]+)", result.scalar_one()).group(1)
+
+
+@pytest.fixture
+async def email(db):
+    address = f"test-{uuid.uuid4().hex[:12]}@example.com"
+    yield address
+    await db.execute(delete(EmailOutbox).where(EmailOutbox.recipient == address))
+    await db.execute(delete(User).where(User.email == address))
+    await db.commit()
+
+
+async def test_auth_endpoints_run_at_most_two_queries(client, db, email, queries):
+    async def call(method, url, **kwargs):
+        queries.clear()
+        response = await client.request(method, url, **kwargs)
+        assert len(queries) <= MAX_QUERIES, f"{method} {url}: {queries}"
+        return response
+
+    credentials = {"email": email, "password": "correct horse"}
+    assert (await call("POST", "/auth/register", json=credentials)).status_code == 201
+    assert (await call("POST", "/auth/register", json=credentials)).status_code == 400
+
+    token = await emailed_token(db, email, "verify-email")
+    assert (await call("GET", f"/auth/verify-email/{token}")).status_code == 200
+
+    response = await call("POST", "/auth/login", json=credentials)
+    assert response.status_code == 200
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    assert (await call("GET", "/auth/me", headers=headers)).status_code == 200
+    assert (await call("POST", "/auth/refresh")).status_code == 200
+    assert (await call("POST", "/auth/logout", headers=headers)).status_code == 200
+
+    assert (await call("POST", "/auth/forgot-password", json={"email": email})).status_code == 200
+    token = await emailed_token(db, email, "reset-password")
+    assert (await call("POST", f"/auth/reset-password/{token}", json={"password": "battery staple"})).status_code == 200
+    assert (await call("POST", f"/auth/reset-password/{token}", json={"password": "battery staple"})).status_code == 400
+
+
+async def test_duplicate_registration_skips_hashing(client, email, monkeypatch):
+    assert (await client.post("/auth/register", json={"email": email, "password": "correct horse"})).status_code == 201
+
+    async def fail(password):
+        raise AssertionError("password hashed for a taken email")
+
+    monkeypatch.setattr("app.services.auth.hash_password", fail)
+    assert (await client.post("/auth/register", json={"email": email, "password": "correct horse"})).status_code == 400
@@ -0,0 +1,64 @@
+import os
+import pytest
+from app.middleware.bot_blocker import AI_BOT_PATTERNS, UserAgentClassifier, user_agent_classifier
+from app.utils.metrics import metrics
+
+
+def classifier(patterns=AI_BOT_PATTERNS, **options) -> UserAgentClassifier:
+    return UserAgentClassifier(patterns, **{"patterns_file": "", **options})
+
+
+@pytest.mark.parametrize("user_agent, is_bot", [
+    ("Mozilla/5.0 AppleWebKit/537.36 (KHTML, like Gecko; compatible; GPTBot/1.0)", True),
+    ("mozilla/5.0 (compatible; claudebot/1.0)", True),
+    ("Mozilla/5.0 (X11; Linux x86_64) Gecko/20100101 Firefox/121.0", False),
+    ("", False),
+])
+def test_default_patterns_match_case_insensitively(user_agent, is_bot):
+    assert classifier().is_bot(user_agent) is is_bot
+
+
+@pytest.mark.parametrize("pattern, user_agent, is_bot", [
+    (r"Scraper\W", "Scraper/2.0", True),
+    (r"Scraper\W", "scraperbot", False),
+    (r"\bSpider\b", "Mozilla (SPIDER 1.0)", True),
+    (r"\bSpider\b", "Arachnospider", False),
+    (r"\xC9clair", "ÉCLAIR/1.0", True),
+    (r"\xC9clair", "éclair/1.0", True),
+    (r"Fetch\S+", "fetch", False),
+])
+def test_patterns_with_escapes_keep_their_meaning(pattern, user_agent, is_bot):
+    assert classifier([pattern]).is_bot(user_agent) is is_bot
+
+
+def test_no_patterns_match_nothing():
+    assert not classifier([]).is_bot("GPTBot")
+
+
+def test_gauge_counts_patterns():
+    # The gauge reports the app-wide classifier
+    user_agent_classifier.load(["Alpha", r"Beta(?:Bot)?", "(?:Gamma)"])
+    try:
+        assert metrics.snapshot()["bot_blocker_patterns"]["value"] == 3
+    finally:
+        user_agent_classifier.load(AI_BOT_PATTERNS)
+
+
+def test_patterns_file_is_reloaded_when_it_changes(tmp_path):
+    patterns_file = tmp_path / "patterns.txt"
+    patterns_file.write_text("# scrapers\nAlphaBot\n")
+    bots = classifier(patterns_file=str(patterns_file), reload_interval=0)
+    assert bots.is_bot("AlphaBot/1.0")
+    assert not bots.is_bot("BetaBot/1.0")
+
+    patterns_file.write_text("BetaBot\n")
+    os.utime(patterns_file, (1, 1))
+    # Cached verdicts go with the old patterns
+    assert not bots.is_bot("AlphaBot/1.0")
+    assert bots.is_bot("BetaBot/1.0")
+
+    # A broken file is reported and the current patterns stay in use
+    patterns_file.write_text("Gamma(\n")
+    os.utime(patterns_file, (2, 2))
+    assert bots.is_bot("BetaBot/1.0")
+    assert not bots.is_bot("Gamma(")
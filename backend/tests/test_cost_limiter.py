@@ -0,0 +1,67 @@
+"""
+CostLimitMiddleware on an app of its own, with buckets that refill slowly
+enough to stay drained for the length of a test.
+"""
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from app.middleware.cost_limiter import CostLimitMiddleware, RouteCost, TokenBuckets, route_cost
+
+pytestmark = pytest.mark.anyio
+
+buckets = TokenBuckets(capacity=10, refill_per_second=1)
+api = FastAPI()
+api.add_middleware(CostLimitMiddleware, buckets=buckets)
+
+
+@api.get("/cheap")
+@route_cost(RouteCost(static=1))
+async def cheap():
+    return {}
+
+
+@api.get("/export/{name}")
+@route_cost(RouteCost(static=2, per_kib=10))
+async def export(name: str):
+    return PlainTextResponse("x" * 4096)
+
+
+@api.get("/free")
+async def free():
+    return {}
+
+
+@pytest.fixture(autouse=True)
+def full_buckets():
+    buckets._buckets.clear()
+
+
+def client_for(ip: str = "10.0.0.1") -> httpx.AsyncClient:
+    transport = httpx.ASGITransport(app=api, client=(ip, 12345))
+    return httpx.AsyncClient(transport=transport, base_url="https://testserver")
+
+
+async def test_static_cost_is_taken_up_front():
+    async with client_for() as client:
+        statuses = [(await client.get("/cheap")).status_code for _ in range(12)]
+    assert statuses.count(200) == 10
+    assert statuses[-1] == 429
+
+
+async def test_large_responses_leave_the_bucket_in_debt():
+    async with client_for() as client:
+        # Admitted on its static cost; 4 KiB at 10 units per KiB is charged afterwards
+        assert (await client.get("/export/report")).status_code == 200
+
+        response = await client.get("/cheap")
+        assert response.status_code == 429
+        # 10 - 2 - 40 = -32 units, and the next request needs 1 more at 1 unit per second
+        assert 32 <= int(response.headers["Retry-After"]) <= 34
+        assert response.json()["retry_after"] == int(response.headers["Retry-After"])
+
+        # Routes without a declared cost are not limited
+        assert (await client.get("/free")).status_code == 200
+
+    async with client_for(ip="10.0.0.2") as other_client:
+        assert (await other_client.get("/cheap")).status_code == 200
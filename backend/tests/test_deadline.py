@@ -0,0 +1,75 @@
+"""
+RequestDeadlineMiddleware on an app of its own: the 504 when a deadline
+expires, and the timeouts routes with a @deadline hand to Postgres.
+"""
+import time
+import httpx
+import pytest
+from fastapi import Depends, FastAPI
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import DEADLINE_SERVER_GRACE_MS, get_db, get_read_db
+from app.middleware.deadline import RequestDeadlineMiddleware, deadline
+
+pytestmark = pytest.mark.anyio
+
+TIMEOUTS_SQL = text("SELECT name, setting::int FROM pg_settings WHERE name IN ('statement_timeout', 'lock_timeout')")
+
+api = FastAPI()
+api.add_middleware(RequestDeadlineMiddleware, default_seconds=30)
+
+
+async def timeouts(db: AsyncSession) -> dict:
+    return dict((await db.execute(TIMEOUTS_SQL)).all())
+
+
+@api.get("/slow")
+@deadline(0.2)
+async def slow(db: AsyncSession = Depends(get_db)):
+    await db.execute(text("SELECT pg_sleep(5)"))
+
+
+@api.get("/read-timeouts")
+@deadline(5)
+async def read_timeouts(db: AsyncSession = Depends(get_read_db)):
+    return await timeouts(db)
+
+
+@api.get("/write-timeouts")
+@deadline(5)
+async def write_timeouts(db: AsyncSession = Depends(get_db)):
+    return await timeouts(db)
+
+
+@api.get("/default-timeouts")
+async def default_timeouts(db: AsyncSession = Depends(get_db)):
+    return await timeouts(db)
+
+
+@pytest.fixture
+async def client(db):
+    transport = httpx.ASGITransport(app=api)
+    async with httpx.AsyncClient(transport=transport, base_url="https://testserver") as http_client:
+        yield http_client
+
+
+async def test_expired_deadline_cancels_the_query_with_504(client):
+    started_at = time.monotonic()
+    response = await client.get("/slow")
+    assert response.status_code == 504
+    assert time.monotonic() - started_at < 2
+
+
+@pytest.mark.parametrize("path", ["/read-timeouts", "/write-timeouts"])
+async def test_declared_deadline_bounds_the_transaction(client, db, path):
+    settings = (await client.get(path)).json()
+    for name in ("statement_timeout", "lock_timeout"):
+        # What was left of 5 s when the transaction began, plus the grace period
+        assert 4000 < settings[name] <= 5000 + DEADLINE_SERVER_GRACE_MS
+
+    # Set transaction-locally: the connection goes back to the pool without them
+    assert await timeouts(db) == {"statement_timeout": 0, "lock_timeout": 0}
+
+
+async def test_default_deadline_leaves_postgres_timeouts_alone(client):
+    assert (await client.get("/default-timeouts")).json() == {"statement_timeout": 0, "lock_timeout": 0}
@@ -0,0 +1,146 @@
+import socket
+from datetime import datetime, timezone
+from email.message import EmailMessage
+import psycopg2
+import pytest
+from aiosmtpd.controller import Controller
+from sqlalchemy import delete, insert, select
+from app.database import engine
+from app.models.email_outbox import EmailOutbox
+from app.services import email
+from app.services.email_worker import EmailOutboxWorker
+from app.services.smtp_pool import DeliveryOutcomeUnknown, SMTPConnectionPool
+
+pytestmark = pytest.mark.anyio
+
+REJECTED = "rejected@example.com"
+LONG_AGO = datetime(2000, 1, 1, tzinfo=timezone.utc)
+
+
+class Sink:
+    """SMTP handler that keeps what it receives and checks the outbox while a message is in flight."""
+
+    def __init__(self, dsn):
+        self.dsn = dsn
+        self.received = []
+        self.row_states = []
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address == REJECTED:
+            return "550 No such user"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received.extend(envelope.rcpt_tos)
+        # The claim must be committed and its row lock gone by the time SMTP runs
+        with psycopg2.connect(self.dsn) as connection, connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT status FROM email_outbox WHERE recipient = ANY(%s) FOR UPDATE NOWAIT",
+                (list(envelope.rcpt_tos),)
+            )
+            self.row_states.extend(status for status, in cursor.fetchall())
+        return "250 Message accepted"
+
+
+class DroppingSink:
+    """SMTP handler that drops the session once, in the given stage, for the first message."""
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.received = []
+
+    def _drop_once(self, server, stage):
+        if stage == self.stage:
+            self.stage = None
+            server.transport.close()
+            return True
+        return False
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if self._drop_once(server, "RCPT"):
+            return "421 Closing connection"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        # The message is accepted either way; only the reply may never reach the client
+        self.received.extend(envelope.rcpt_tos)
+        self._drop_once(server, "DATA")
+        return "250 Message accepted"
+
+
+def free_port() -> int:
+    # aiosmtpd cannot listen on port 0; take a free one from the OS
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def build(recipient: str) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = "noreply@example.com"
+    message["To"] = recipient
+    message["Subject"] = "Hi"
+    message.set_content("Hi")
+    return message
+
+
+@pytest.fixture
+def smtp_sink(monkeypatch):
+    sink = Sink(engine.url.set(drivername="postgresql").render_as_string(hide_password=False))
+    port = free_port()
+    controller = Controller(sink, hostname="127.0.0.1", port=port)
+    controller.start()
+    monkeypatch.setattr(email, "smtp_pool", SMTPConnectionPool(hostname="127.0.0.1", port=port, start_tls=False, timeout=5))
+    yield sink
+    controller.stop()
+
+
+async def test_drain_sends_outside_the_claim_transaction(db, smtp_sink):
+    recipients = ["first@example.com", "second@example.com", REJECTED]
+    # Due long ago, so they come before anything else waiting in the outbox
+    ids = (await db.execute(
+        insert(EmailOutbox).returning(EmailOutbox.id),
+        [
+            {"recipient": recipient, "subject": "Hi", "body": "<p>Hi</p>", "status": "pending", "attempts": 0, "next_attempt_at": LONG_AGO}
+            for recipient in recipients
+        ]
+    )).scalars().all()
+    await db.commit()
+    try:
+        assert await EmailOutboxWorker(batch_size=len(recipients)).drain_once() == len(recipients)
+
+        assert sorted(smtp_sink.received) == sorted(recipients[:2])
+        assert smtp_sink.row_states == ["sending", "sending"]
+        rows = {
+            row.recipient: row
+            for row in (await db.execute(select(EmailOutbox).where(EmailOutbox.id.in_(ids)))).scalars()
+        }
+        assert [rows[recipient].status for recipient in recipients[:2]] == ["sent", "sent"]
+        assert rows[REJECTED].status == "pending" and rows[REJECTED].attempts == 1 and rows[REJECTED].last_error
+    finally:
+        await email.smtp_pool.close()
+        await db.execute(delete(EmailOutbox).where(EmailOutbox.id.in_(ids)))
+        await db.commit()
+
+
+@pytest.mark.parametrize("stage, first_result", [
+    ("RCPT", None),
+    ("DATA", DeliveryOutcomeUnknown),
+])
+async def test_dropped_session_resends_only_what_the_server_cannot_have(stage, first_result):
+    sink = DroppingSink(stage)
+    port = free_port()
+    controller = Controller(sink, hostname="127.0.0.1", port=port)
+    controller.start()
+    pool = SMTPConnectionPool(hostname="127.0.0.1", port=port, start_tls=False, max_size=1, timeout=5)
+    try:
+        results = await pool.send_batch([build("first@example.com"), build("second@example.com")])
+    finally:
+        await pool.close()
+        controller.stop()
+
+    # Each message reaches the server exactly once; the outbox decides about the unknown one
+    assert sink.received == ["first@example.com", "second@example.com"]
+    assert [type(result) if result else None for result in results] == [first_result, None]
@@ -0,0 +1,55 @@
+import pytest
+from sqlalchemy import select, update
+from app.models.user import User
+from app.services import hasher
+from app.services.auth import rehash_user_password
+from app.services.hasher import BcryptHasher
+
+pytestmark = pytest.mark.anyio
+
+PASSWORD = "correct horse battery"
+
+
+@pytest.mark.parametrize("stored_cost, needs_rehash", [(4, True), (5, False), (6, False)])
+def test_needs_rehash_only_upgrades_weaker_hashes(stored_cost, needs_rehash):
+    assert BcryptHasher(5).needs_rehash(BcryptHasher(stored_cost).hash(PASSWORD)) is needs_rehash
+
+
+@pytest.mark.parametrize("stored", ["x", "$1$salt$digest", "$2b$xx$digest", "$argon2id$v=19$m=65536,t=3,p=4$salt$digest"])
+def test_needs_rehash_replaces_unknown_formats(stored):
+    assert BcryptHasher(5).needs_rehash(stored)
+
+
+@pytest.fixture
+def current_hasher(monkeypatch):
+    monkeypatch.setattr(hasher, "_active_hasher", BcryptHasher(5))
+
+
+async def stored_hash(db, user) -> str:
+    db.expire_all()
+    return (await db.execute(select(User.hashed_password).where(User.id == user.id))).scalar_one()
+
+
+async def test_login_upgrades_a_weaker_hash(client, db, user, current_hasher):
+    await db.execute(update(User).where(User.id == user.id).values(hashed_password=BcryptHasher(4).hash(PASSWORD)))
+    await db.commit()
+
+    response = await client.post("/auth/login", json={"email": user.email, "password": PASSWORD})
+    assert response.status_code == 200
+
+    # The background task has run by the time the transport returns the response
+    upgraded = await stored_hash(db, user)
+    assert upgraded.startswith("$2b$05$")
+    assert BcryptHasher(5).verify(PASSWORD, upgraded)
+
+
+async def test_upgrade_does_not_overwrite_a_concurrent_reset(db, user, current_hasher):
+    verified_against = BcryptHasher(4).hash(PASSWORD)
+    reset_to = BcryptHasher(5).hash("a brand new password")
+    # A reset landed between the login verifying the old hash and the upgrade running
+    await db.execute(update(User).where(User.id == user.id).values(hashed_password=reset_to))
+    await db.commit()
+
+    await rehash_user_password(user.id, PASSWORD, verified_against)
+
+    assert await stored_hash(db, user) == reset_to
@@ -0,0 +1,69 @@
+import asyncio
+import pytest
+from fastapi.routing import APIRoute
+from starlette.responses import StreamingResponse
+from app.main import app
+from app.middleware.rate_limiter import limiter
+
+pytestmark = pytest.mark.anyio
+
+CHUNKS = [b"first;", b"second;", b"third;"]
+
+
+@pytest.fixture
+def streaming_route():
+    delivered = [asyncio.Event() for _ in CHUNKS]
+
+    async def chunks():
+        for index, chunk in enumerate(CHUNKS):
+            yield chunk
+            # Only goes on once the client has this chunk; a buffering middleware never lets it
+            await asyncio.wait_for(delivered[index].wait(), timeout=2)
+
+    async def stream():
+        return StreamingResponse(chunks(), media_type="text/plain")
+
+    route = APIRoute("/test-stream", stream, methods=["GET"])
+    app.router.routes.append(route)
+    limiter.enabled = False
+    yield delivered
+    limiter.enabled = True
+    app.router.routes.remove(route)
+
+
+async def test_streaming_response_is_forwarded_chunk_by_chunk(streaming_route):
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "https",
+        "path": "/test-stream",
+        "raw_path": b"/test-stream",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"testserver"), (b"user-agent", b"Mozilla/5.0 (X11; Linux x86_64) Chrome/120.0")],
+        "client": ("10.1.2.3", 40000),
+        "server": ("testserver", 443),
+    }
+    request_sent = False
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.Event().wait()
+
+    bodies = []
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            assert message["status"] == 200
+        elif message["type"] == "http.response.body" and message.get("body"):
+            bodies.append(message["body"])
+            streaming_route[len(bodies) - 1].set()
+
+    await asyncio.wait_for(app(scope, receive, send), timeout=5)
+
+    assert bodies == CHUNKS
@@ -0,0 +1,44 @@
+import asyncio
+import time
+import pytest
+from sqlalchemy import update
+from app.models.user import User
+from app.services.hasher import BcryptHasher
+
+pytestmark = pytest.mark.anyio
+
+STORM_SIZE = 16
+PROBE_INTERVAL = 0.01
+
+
+async def test_requests_are_served_during_a_login_storm(client, db, user, monkeypatch):
+    # A real bcrypt cost, so every login keeps a hashing thread busy for a while
+    hasher = BcryptHasher(cost=11)
+    hashed = hasher.hash("correct horse")
+    started_at = time.perf_counter()
+    hasher.verify("wrong", hashed)
+    verify_seconds = time.perf_counter() - started_at
+    monkeypatch.setattr("app.services.auth.get_hasher", lambda: hasher)
+    await db.execute(update(User).where(User.id == user.id).values(hashed_password=hashed))
+    await db.commit()
+
+    storm = asyncio.gather(*(
+        client.post("/auth/login", json={"email": user.email, "password": "wrong"})
+        for _ in range(STORM_SIZE)
+    ))
+
+    # Health checks on a fixed cadence for as long as the storm lasts; each one's
+    # lateness is how long the event loop was unavailable to other requests
+    served, lateness = 0, []
+    while not storm.done():
+        started_at = time.perf_counter()
+        assert (await client.get("/health")).status_code == 200
+        await asyncio.sleep(PROBE_INTERVAL)
+        served += 1
+        lateness.append(time.perf_counter() - started_at - PROBE_INTERVAL)
+    responses = await storm
+
+    # Inline hashing would stall the loop for a whole verify at a time
+    assert served >= 5
+    assert max(lateness) < verify_seconds
+    assert {response.status_code for response in responses} <= {401, 503}
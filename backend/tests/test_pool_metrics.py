@@ -0,0 +1,87 @@
+"""
+Pool instrumentation on an engine of its own: one connection, no overflow and
+a short pool_timeout, reporting under the test_pool prefix.
+"""
+import asyncio
+import pytest
+from sqlalchemy import exc, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from app.database import engine as app_engine
+from app.utils.metrics import metrics
+from app.utils.pool_metrics import InstrumentedAsyncQueuePool, instrument_engine
+
+pytestmark = pytest.mark.anyio
+
+
+def value(name: str):
+    snapshot = metrics.snapshot()[f"test_pool_{name}"]
+    return snapshot["count"] if snapshot["type"] == "histogram" else snapshot["value"]
+
+
+single_connection_engine = create_async_engine(
+    app_engine.url,
+    poolclass=InstrumentedAsyncQueuePool,
+    pool_size=1,
+    max_overflow=0,
+    pool_timeout=0.2,
+    pool_pre_ping=True,
+)
+instrument_engine(single_connection_engine, "test_pool")
+
+
+@pytest.fixture
+async def small_engine(database):
+    """The test engine, disposed afterwards so no connection outlives the test's event loop."""
+    yield single_connection_engine
+    await single_connection_engine.dispose()
+
+
+async def test_checkouts_and_pool_occupancy(small_engine):
+    checkouts, connects = value("checkout_seconds"), value("connects_total")
+
+    async with small_engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+        assert (value("size"), value("checked_out"), value("checked_in"), value("overflow")) == (1, 1, 0, 0)
+
+        # The only connection is taken; the next checkout waits out pool_timeout
+        timeouts = value("checkout_timeouts_total")
+        with pytest.raises(exc.TimeoutError):
+            async with small_engine.connect():
+                pass
+        assert value("checkout_timeouts_total") == timeouts + 1
+
+    assert (value("checked_out"), value("checked_in")) == (0, 1)
+    assert value("checkout_seconds") == checkouts + 2
+    assert value("connects_total") == connects + 1
+
+
+async def test_dead_connections_are_found_by_the_pre_ping(small_engine):
+    async with small_engine.connect() as connection:
+        pid = (await connection.execute(text("SELECT pg_backend_pid()"))).scalar_one()
+    pings, failures, invalidations, closed = value("pre_ping_seconds"), value("pre_ping_failures_total"), value("invalidations_total"), value("connection_age_seconds")
+
+    async with app_engine.connect() as admin:
+        await admin.execute(text("SELECT pg_terminate_backend(:pid)"), {"pid": pid})
+    await app_engine.dispose()
+    await asyncio.sleep(0.1)
+
+    # The pre-ping finds the idle connection dead and the pool replaces it
+    async with small_engine.connect() as connection:
+        assert (await connection.execute(text("SELECT 1"))).scalar_one() == 1
+
+    assert value("pre_ping_seconds") == pings + 1
+    assert value("pre_ping_failures_total") == failures + 1
+    assert value("invalidations_total") == invalidations + 1
+    assert value("connection_age_seconds") == closed + 1
+
+
+async def test_metrics_survive_dispose(small_engine):
+    async with small_engine.connect():
+        pass
+    checkouts = value("checkout_seconds")
+
+    # dispose() swaps in a fresh pool, which must keep reporting
+    await small_engine.dispose()
+    async with small_engine.connect():
+        pass
+    assert value("checkout_seconds") == checkouts + 1
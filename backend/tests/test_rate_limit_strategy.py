@@ -0,0 +1,83 @@
+"""
+LocalShortCircuitRateLimiter against the in-process storages. Set TEST_REDIS_URL
+(e.g. redis://localhost:6379/15) to also run them against Redis and its Lua script;
+the database is flushed.
+"""
+import os
+import time
+import pytest
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import MovingWindowRateLimiter
+from app.middleware.rate_limit_strategy import KEY_SEPARATOR, LocalShortCircuitRateLimiter
+import app.middleware.rate_limit_storage  # noqa: F401  (registers bounded-memory://)
+
+
+@pytest.fixture(params=["memory://", "bounded-memory://", "redis"])
+def storage(request):
+    uri = request.param
+    if uri == "redis":
+        uri = os.environ.get("TEST_REDIS_URL")
+        if not uri:
+            pytest.skip("TEST_REDIS_URL not set")
+    storage = storage_from_string(uri)
+    storage.reset()
+    yield storage
+    storage.reset()
+
+
+def limiter_for(storage, **options) -> LocalShortCircuitRateLimiter:
+    return LocalShortCircuitRateLimiter(MovingWindowRateLimiter(storage), **options)
+
+
+def user_key(user_id: int, ip: str = "10.0.0.1") -> str:
+    return f"user:{user_id}{KEY_SEPARATOR}users-ip:{ip}"
+
+
+def test_users_behind_one_address_share_a_larger_limit(storage):
+    limiter = limiter_for(storage, lease_fraction=0, shared_multiplier=2)
+    item = parse("5/minute")
+
+    assert sum(limiter.hit(item, user_key(1)) for _ in range(10)) == 5
+    # The address has room for a second user's full limit, and no more
+    assert sum(limiter.hit(item, user_key(2)) for _ in range(10)) == 5
+    assert not limiter.hit(item, user_key(3))
+    assert limiter.hit(item, user_key(3, ip="10.0.0.2"))
+    # Anonymous visitors from the address have a bucket of their own
+    assert limiter.hit(item, "ip:10.0.0.1")
+
+
+def test_a_rejected_identity_charges_none(storage):
+    limiter = limiter_for(storage, lease_fraction=0, shared_multiplier=2)
+    item = parse("5/minute")
+
+    for user_id in range(1, 3):
+        assert sum(limiter.hit(item, user_key(user_id, ip=f"10.0.0.{user_id}")) for _ in range(5)) == 5
+    # User 1 is full at 10.0.0.2; the address must not be charged for the rejected hit
+    assert not limiter.hit(item, user_key(1, ip="10.0.0.2"))
+    assert limiter.get_window_stats(item, user_key(3, ip="10.0.0.2")).remaining == 5
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_leases_admit_exactly_the_limit(storage, workers):
+    # Workers share the storage; each keeps its own leases and blocked keys
+    limiters = [limiter_for(storage, lease_fraction=0.1) for _ in range(workers)]
+    item = parse("50/minute")
+
+    admitted = sum(limiters[attempt % workers].hit(item, "ip:10.0.0.1") for attempt in range(200))
+    assert admitted == 50
+    assert all(not limiter.hit(item, "ip:10.0.0.1") for limiter in limiters)
+
+
+def test_blocked_keys_are_refused_until_the_window_frees_up(storage):
+    limiter = limiter_for(storage)
+    item = parse("3/second")
+
+    assert sum(limiter.hit(item, "ip:10.0.0.1") for _ in range(4)) == 3
+    # Refused from the local cache: emptying the storage behind its back changes nothing
+    storage.reset()
+    assert not limiter.hit(item, "ip:10.0.0.1")
+    assert limiter.hit(item, "ip:10.0.0.2")
+
+    time.sleep(1.05)
+    assert limiter.hit(item, "ip:10.0.0.1")
@@ -0,0 +1,30 @@
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import async_read_session, settings
+from app.models.user import User
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_a_retried_read_leaves_earlier_results_loaded(user, monkeypatch):
+    monkeypatch.setattr(settings, "DB_READ_RETRY_BASE_DELAY_SECONDS", 0)
+    execute = AsyncSession.execute
+    failures = []
+
+    async def fail_once(session, statement, *args, **kwargs):
+        if not failures:
+            failures.append(statement)
+            raise ConnectionResetError("connection reset by peer")
+        return await execute(session, statement, *args, **kwargs)
+
+    async with async_read_session() as session:
+        loaded = (await session.execute(select(User).where(User.id == user.id))).scalar_one()
+        monkeypatch.setattr(AsyncSession, "execute", fail_once)
+
+        email = (await session.execute(select(User.email).where(User.id == user.id))).scalar_one()
+
+        assert failures
+        assert email == user.email
+        # Not expired by the retry: reading it does not go back to the database
+        assert loaded.email == user.email
@@ -0,0 +1,48 @@
+import pytest
+from sqlalchemy import select
+from app.models.user import RefreshToken
+from app.services.auth import create_refresh_token, revoke_refresh_token, rotate_refresh_token
+
+pytestmark = pytest.mark.anyio
+
+
+async def active_tokens(db, user_id):
+    result = await db.execute(select(RefreshToken.id).where(RefreshToken.user_id == user_id, RefreshToken.revoked == False))
+    return len(result.all())
+
+
+async def test_rotation_is_one_query(db, user, queries):
+    token = await create_refresh_token(db, user.id)
+    await db.commit()
+    queries.clear()
+
+    rotated = await rotate_refresh_token(db, token)
+
+    assert rotated is not None and rotated.user_id == user.id and rotated.email == user.email
+    assert len(queries) == 1
+    await db.commit()
+    assert await active_tokens(db, user.id) == 1
+
+
+async def test_replaying_a_rotated_token_revokes_the_family(db, user):
+    stolen = await create_refresh_token(db, user.id)
+    await db.commit()
+    assert await rotate_refresh_token(db, stolen) is not None
+    await create_refresh_token(db, user.id)
+    await db.commit()
+    assert await active_tokens(db, user.id) == 2
+
+    assert await rotate_refresh_token(db, stolen) is None
+    assert await active_tokens(db, user.id) == 0
+
+
+async def test_presenting_a_logged_out_token_leaves_other_sessions(db, user):
+    stale = await create_refresh_token(db, user.id)
+    await create_refresh_token(db, user.id)
+    await db.commit()
+    assert await revoke_refresh_token(db, stale)
+    await db.commit()
+
+    assert await rotate_refresh_token(db, stale) is None
+    await db.commit()
+    assert await active_tokens(db, user.id) == 1
@@ -0,0 +1,83 @@
+"""
+Read replica routing and read-after-write pinning, with the primary itself
+standing in for the replica.
+"""
+import httpx
+import pytest
+from fastapi import Depends, FastAPI, HTTPException
+from sqlalchemy import select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import database as app_database
+from app.database import PRIMARY_PIN_COOKIE, ReplicaRouter, engine, get_db, get_read_db, no_primary_pin
+from app.middleware.primary_pin import PrimaryPinMiddleware
+from app.models.user import User
+
+pytestmark = pytest.mark.anyio
+
+api = FastAPI()
+
+
+@api.get("/read")
+async def read(db: AsyncSession = Depends(get_read_db)):
+    await db.execute(select(User.id).limit(1))
+    return {"primary": db.bind is app_database.read_engine}
+
+
+@api.post("/write/{user_id}")
+async def write(user_id: int, db: AsyncSession = Depends(get_db)):
+    await db.execute(update(User).where(User.id == user_id).values(is_verified=True))
+
+
+@api.post("/raw-write/{user_id}")
+async def raw_write(user_id: int, db: AsyncSession = Depends(get_db)):
+    await db.execute(text("UPDATE users SET is_verified = true WHERE id = :id"), {"id": user_id})
+
+
+@api.post("/raw-read")
+async def raw_read(db: AsyncSession = Depends(get_db)):
+    await db.execute(text("SELECT count(*) FROM users"))
+
+
+@api.post("/failed-write/{user_id}")
+async def failed_write(user_id: int, db: AsyncSession = Depends(get_db)):
+    await db.execute(update(User).where(User.id == user_id).values(is_verified=True))
+    raise HTTPException(status_code=409)
+
+
+@api.post("/counter/{user_id}")
+@no_primary_pin
+async def counter(user_id: int, db: AsyncSession = Depends(get_db)):
+    await db.execute(update(User).where(User.id == user_id).values(is_verified=True))
+
+
+@pytest.fixture
+async def client(db, monkeypatch):
+    replicas = ReplicaRouter([engine.url.render_as_string(hide_password=False)])
+    await replicas.check_health()
+    monkeypatch.setattr(app_database, "replica_router", replicas)
+    transport = httpx.ASGITransport(app=PrimaryPinMiddleware(api))
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="https://testserver") as http_client:
+            yield http_client
+    finally:
+        await replicas.stop()
+
+
+async def test_reads_go_to_the_replica_until_the_client_writes(client, user):
+    assert (await client.get("/read")).json() == {"primary": False}
+
+    response = await client.post(f"/write/{user.id}")
+    assert PRIMARY_PIN_COOKIE in response.headers.get("set-cookie", "")
+    assert (await client.get("/read")).json() == {"primary": True}
+
+
+@pytest.mark.parametrize("path, pins", [
+    ("/write/{id}", True),
+    ("/raw-write/{id}", True),
+    ("/raw-read", False),
+    ("/failed-write/{id}", False),
+    ("/counter/{id}", False),
+])
+async def test_only_committed_writes_pin_the_client(client, user, path, pins):
+    response = await client.post(path.format(id=user.id))
+    assert (PRIMARY_PIN_COOKIE in response.headers.get("set-cookie", "")) == pins
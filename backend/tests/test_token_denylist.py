@@ -0,0 +1,79 @@
+import asyncio
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+import pytest
+from sqlalchemy import delete, select
+from app.models.user import RevokedAccessToken
+from app.services import token_denylist
+from app.services.token_denylist import AccessTokenDenylist
+from app.services.token_purge import RefreshTokenPurgeWorker
+
+pytestmark = pytest.mark.anyio
+
+
+def test_no_listener_through_a_transaction_pooler(monkeypatch):
+    monkeypatch.setattr(token_denylist.settings, "DB_POOLER_MODE", "transaction")
+    assert AccessTokenDenylist(listen_url="")._listen_dsn() is None
+    assert AccessTokenDenylist(listen_url="postgresql://app@db-direct/blogy")._listen_dsn() == "postgresql://app@db-direct/blogy"
+
+    monkeypatch.setattr(token_denylist.settings, "DB_POOLER_MODE", "direct")
+    assert AccessTokenDenylist(listen_url="")._listen_dsn() is not None
+
+
+async def test_revocations_reach_other_workers_by_reload(db, monkeypatch):
+    monkeypatch.setattr(token_denylist.settings, "DB_POOLER_MODE", "transaction")
+    other_worker = AccessTokenDenylist(listen_url="", sweep_interval=0.05, reload_interval=0.05)
+    other_worker.start()
+    jti = uuid.uuid4().hex
+    try:
+        await AccessTokenDenylist(sync=False).revoke(db, jti, time.time() + 60)
+        await db.commit()
+
+        for _ in range(40):
+            if other_worker.is_revoked(jti):
+                break
+            await asyncio.sleep(0.05)
+        assert other_worker.is_revoked(jti)
+    finally:
+        await other_worker.stop()
+        await db.execute(delete(RevokedAccessToken).where(RevokedAccessToken.jti == jti))
+        await db.commit()
+
+
+async def test_revocation_takes_effect_locally_only_once_added_after_commit(db):
+    denylist = AccessTokenDenylist(sync=False)
+    jti = uuid.uuid4().hex
+    try:
+        await denylist.revoke(db, jti, time.time() + 60)
+        assert not denylist.is_revoked(jti)
+        await db.rollback()
+
+        await denylist.load()
+        assert not denylist.is_revoked(jti)
+    finally:
+        await db.execute(delete(RevokedAccessToken).where(RevokedAccessToken.jti == jti))
+        await db.commit()
+
+
+async def test_reload_only_reads_and_the_purge_deletes_expired_entries(db, queries):
+    expired, live = uuid.uuid4().hex, uuid.uuid4().hex
+    now = datetime.now(timezone.utc)
+    db.add_all([
+        RevokedAccessToken(jti=expired, expires_at=now - timedelta(seconds=1)),
+        RevokedAccessToken(jti=live, expires_at=now + timedelta(minutes=1)),
+    ])
+    await db.commit()
+    try:
+        denylist = AccessTokenDenylist(sync=False)
+        queries.clear()
+        await denylist.load()
+        assert denylist.is_revoked(live) and not denylist.is_revoked(expired)
+        assert queries and not [statement for statement in queries if "DELETE" in statement.upper()]
+
+        await RefreshTokenPurgeWorker().purge()
+        stored = await db.execute(select(RevokedAccessToken.jti).where(RevokedAccessToken.jti.in_([expired, live])))
+        assert stored.scalars().all() == [live]
+    finally:
+        await db.execute(delete(RevokedAccessToken).where(RevokedAccessToken.jti.in_([expired, live])))
+        await db.commit()
@@ -0,0 +1,52 @@
+import pytest
+from sqlalchemy import select, text
+from app.models.user import RefreshToken, User
+from app.services import hasher
+from app.services.auth import create_password_reset_token, create_refresh_token, generate_token, hash_token, reset_user_password, rotate_refresh_token
+from app.services.hasher import BcryptHasher
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_digest_matches_the_migration_backfill(db):
+    token = generate_token()
+    # 005_hashed_tokens converted tokens already handed out with sha256() in SQL
+    backfilled = (await db.execute(text("SELECT sha256(convert_to(:token, 'UTF8'))"), {"token": token})).scalar_one()
+    assert hash_token(token) == backfilled
+    assert len(backfilled) == 32
+
+
+async def test_refresh_tokens_are_stored_and_found_by_digest(db, user):
+    token = await create_refresh_token(db, user.id)
+    await db.commit()
+
+    stored = (await db.execute(select(RefreshToken.token_hash).where(RefreshToken.user_id == user.id))).scalars().all()
+    assert stored == [hash_token(token)]
+    assert await rotate_refresh_token(db, token) is not None
+    await db.commit()
+
+
+async def test_reset_tokens_are_stored_and_found_by_digest(db, user, monkeypatch):
+    monkeypatch.setattr(hasher, "_active_hasher", BcryptHasher(4))
+    _, token = await create_password_reset_token(db, user.email)
+    await db.commit()
+    assert (await db.execute(select(User.reset_token_hash).where(User.id == user.id))).scalar_one() == hash_token(token)
+
+    assert await reset_user_password(db, generate_token(), "battery staple") is None
+    assert (await reset_user_password(db, token, "battery staple")).id == user.id
+    # Consumed: the digest is cleared with the reset
+    assert await reset_user_password(db, token, "battery staple") is None
+    await db.commit()
+
+
+@pytest.mark.parametrize("lookup, index", [
+    ("SELECT id FROM refresh_tokens WHERE token_hash = :digest", "ix_refresh_tokens_token_hash"),
+    ("SELECT id FROM users WHERE verification_token_hash = :digest", "ix_users_verification_token_hash"),
+    ("SELECT id FROM users WHERE reset_token_hash = :digest", "ix_users_reset_token_hash"),
+])
+async def test_lookups_can_use_the_digest_indexes(db, lookup, index):
+    # Small test tables are cheaper to scan; take that option away to see which index applies
+    await db.execute(text("SET LOCAL enable_seqscan = off"))
+    plan = (await db.execute(text(f"EXPLAIN {lookup}"), {"digest": hash_token(generate_token())})).scalars().all()
+    await db.rollback()
+    assert index in "\n".join(plan)
@@ -0,0 +1,30 @@
+import hashlib
+import uuid
+from datetime import datetime, timedelta, timezone
+import pytest
+from sqlalchemy import select
+from app.models.user import RefreshToken
+from app.services.token_purge import RefreshTokenPurgeWorker
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_purge_keeps_live_and_recently_revoked_tokens(db, user):
+    now = datetime.now(timezone.utc)
+    tokens = {
+        "live": dict(expires_at=now + timedelta(days=7)),
+        "expired": dict(expires_at=now - timedelta(seconds=1)),
+        "revoked recently": dict(expires_at=now + timedelta(days=7), revoked=True, revoked_at=now - timedelta(hours=1)),
+        "revoked long ago": dict(expires_at=now + timedelta(days=7), revoked=True, revoked_at=now - timedelta(hours=25)),
+    }
+    for name, columns in tokens.items():
+        db.add(RefreshToken(token_hash=hashlib.sha256(f"{name}-{uuid.uuid4()}".encode()).digest(), user_id=user.id, **columns))
+    await db.commit()
+
+    await RefreshTokenPurgeWorker(revoked_retention_hours=24).purge()
+
+    kept = await db.execute(select(RefreshToken.expires_at, RefreshToken.revoked_at).where(RefreshToken.user_id == user.id))
+    assert sorted(kept.all(), key=lambda row: row.revoked_at is not None) == [
+        (tokens["live"]["expires_at"], None),
+        (tokens["revoked recently"]["expires_at"], tokens["revoked recently"]["revoked_at"]),
+    ]
@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta, timezone
+import psycopg2
+import pytest
+from sqlalchemy import update
+from app.database import engine
+from app.models.user import User
+from app.services import auth
+from app.services.auth import create_access_token, generate_token, hash_token, verify_user_email
+from app.services.user_cache import UserCache, UserSnapshot, user_cache
+
+pytestmark = pytest.mark.anyio
+
+
+def snapshot(user_id: int) -> UserSnapshot:
+    return UserSnapshot(id=user_id, email=f"user-{user_id}@example.com", is_verified=True, created_at=None)
+
+
+def user_queries(queries) -> list:
+    return [statement for statement in queries if "FROM users" in statement]
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = UserCache(max_size=2, ttl=60)
+    for user_id in (1, 2):
+        cache.set(snapshot(user_id))
+    assert cache.get(1) is not None
+    cache.set(snapshot(3))
+    assert cache.get(2) is None
+    assert cache.get(1) is not None and cache.get(3) is not None
+
+
+def test_entries_expire_after_the_ttl():
+    cache = UserCache(max_size=2, ttl=0)
+    cache.set(snapshot(1))
+    assert cache.get(1) is None
+
+
+async def test_authenticated_requests_load_the_user_once(client, user, queries):
+    headers = {"Authorization": f"Bearer {create_access_token(user.id)}"}
+    assert (await client.get("/auth/me", headers=headers)).json()["email"] == user.email
+    assert len(user_queries(queries)) == 1
+
+    queries.clear()
+    assert (await client.get("/auth/me", headers=headers)).json()["email"] == user.email
+    assert user_queries(queries) == []
+
+
+async def test_logout_drops_the_cached_user(client, user):
+    headers = {"Authorization": f"Bearer {create_access_token(user.id)}"}
+    assert (await client.get("/auth/me", headers=headers)).status_code == 200
+    assert user_cache.get(user.id) is not None
+
+    assert (await client.post("/auth/logout", headers=headers)).status_code == 200
+    assert user_cache.get(user.id) is None
+
+
+def committed_is_verified(user_id: int) -> bool:
+    """Read the user from another connection: only committed changes are visible."""
+    dsn = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+    with psycopg2.connect(dsn) as connection, connection.cursor() as cursor:
+        cursor.execute("SELECT is_verified FROM users WHERE id = %s", (user_id,))
+        return cursor.fetchone()[0]
+
+
+async def test_verification_drops_the_cached_user_only_once_committed(db, user, monkeypatch):
+    token = generate_token()
+    await db.execute(
+        update(User)
+        .where(User.id == user.id)
+        .values(is_verified=False, verification_token_hash=hash_token(token), verification_token_expires=datetime.now(timezone.utc) + timedelta(hours=1))
+    )
+    await db.commit()
+    seen_at_invalidation = []
+    monkeypatch.setattr(auth.user_cache, "invalidate", lambda user_id: seen_at_invalidation.append(committed_is_verified(user_id)))
+
+    try:
+        assert await verify_user_email(db, token) is not None
+    finally:
+        # get_db would commit now; without it the row stays locked for the cleanup
+        await db.commit()
+    assert seen_at_invalidation == [True]